@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Benchmark: splitting large selections into parts, and part reuse after edits.
+
+Splits a Python file (the chat view by default) and reports the split time,
+the part sizes and, for a number of random one-line edits, how many parts
+keep their exact text and so their cached explanation.
+
+    python benchmarks/bench_chunking.py [file] [edits]
+"""
+import ast
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from thonnycontrib.ai_chat.chunking import split_selection  # noqa: E402
+
+DEFAULT_FILE = os.path.join(os.path.dirname(__file__), "..", "thonnycontrib", "AIChatView.py")
+
+
+def edited_copies(code, count, seed=1):
+    """One-line edits that keep the code valid: a comment appended to a random line."""
+    lines = code.splitlines(keepends=True)
+    rng = random.Random(seed)
+    while count:
+        index = rng.randrange(len(lines))
+        line = lines[index]
+        if not line.strip() or line.rstrip().endswith("\\"):
+            continue
+        edited = "".join(lines[:index] + [line.rstrip("\n") + " # edited\n"] + lines[index + 1:])
+        try:
+            ast.parse(edited)
+        except SyntaxError:
+            continue # Inside a string
+        count -= 1
+        yield edited
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_FILE
+    edit_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    with open(path, encoding="utf-8") as f:
+        code = f.read()
+
+    start = time.perf_counter()
+    parts = split_selection(code)
+    elapsed = time.perf_counter() - start
+    sizes = [part.last_line - part.first_line + 1 for part in parts]
+    print(f"{len(code.splitlines())} lines -> {len(parts)} parts in {elapsed * 1000:.1f} ms "
+          f"(lines per part: min {min(sizes)}, median {statistics.median(sizes):.0f}, max {max(sizes)})")
+
+    texts = set(part.text for part in parts)
+    reused = []
+    for edited in edited_copies(code, edit_count):
+        new_parts = split_selection(edited)
+        reused.append(sum(part.text in texts for part in new_parts) / len(new_parts))
+    print(f"after {edit_count} one-line edits: {statistics.mean(reused) * 100:.1f}% of parts reused on average "
+          f"(worst {min(reused) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""Benchmark: end-to-end latency of the chat view against the local mock API.
+
+Builds a real AIChatView in a Tk root and drives it the way the UI does:
+``_fetch_models_async`` (the real ``_fetch_models_worker``), then
+``_submit_request`` for each question (the real scheduler,
+``_stream_chat_worker``, ``_check_stream_queue`` and the markdown render
+path). Outside Thonny the view gets a small in-memory option store instead
+of the workbench, and a temporary user directory.
+
+Reported per scenario (milliseconds unless noted):
+
+    models_cold / models_304   model list fetch at startup / refresh, until the list is updated
+    ttft                       submit -> first token received by the worker
+    first_paint                submit -> first token inserted and redrawn (idle after insert)
+    tokens_per_s               tokens rendered / (last insert - first insert)
+    finalize                   stream_end posted -> answer finalized in the view
+    stall                      lateness of a 5 ms Tk timer while streaming (p50/p95/p99/max)
+
+Needs Thonny installed and a display (use xvfb-run on headless machines).
+
+    python benchmarks/bench_end_to_end.py [--scenario NAME ...] [--output results.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tkinter as tk
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import thonny  # noqa: E402
+from mock_openai_server import MODELS, MockConfig, MockOpenAIServer  # noqa: E402
+
+TICK_MS = 5 # Stall probe interval
+TIMEOUT = 120 # Seconds per scenario
+
+# name: (mock server settings, requests, concurrent answers)
+SCENARIOS = {
+    "steady": (dict(token_rate=50, first_token_delay=0.2, answer_tokens=150), 1, 1),
+    "burst": (dict(token_rate=0, first_token_delay=0.0, answer_tokens=3000), 1, 1),
+    "chunky": (dict(token_rate=20, first_token_delay=0.1, chunk_tokens=8, answer_tokens=200), 1, 1),
+    "concurrent": (dict(token_rate=100, first_token_delay=0.1, answer_tokens=300), 4, 4),
+    "queued": (dict(token_rate=200, first_token_delay=0.05, answer_tokens=200), 4, 1),
+    "errors": (dict(token_rate=200, first_token_delay=0.05, answer_tokens=200, error_rate=0.5, seed=1), 6, 2),
+    "dropped": (dict(token_rate=200, first_token_delay=0.05, answer_tokens=200, drop_after_tokens=50), 2, 2),
+}
+
+
+class BenchWorkbench:
+    """The workbench methods the view uses, with options kept in a dict."""
+
+    def __init__(self, root, options):
+        self.root = root
+        self.options = dict(options)
+
+    def get_option(self, name, default=None):
+        return self.options.get(name, default)
+
+    def set_option(self, name, value):
+        self.options[name] = value
+
+    def winfo_toplevel(self):
+        return self.root
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile; None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(values):
+    return {"n": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95),
+            "p99": percentile(values, 99), "max": max(values) if values else None}
+
+
+def make_view_class(AIChatView):
+    class InstrumentedView(AIChatView):
+        """Records timestamps at the points the metrics are defined by; behaviour is unchanged."""
+
+        def __init__(self, master):
+            self.marks = {} # {message id: {event: perf_counter}}
+            self.tokens = {} # {message id: tokens received}
+            self.models_requested_at = None
+            self.models_updated_at = None
+            super().__init__(master)
+
+        def _mark(self, message_id, event, when=None):
+            self.marks.setdefault(message_id, {}).setdefault(event, when or time.perf_counter())
+
+        def _post_to_ui(self, message):
+            # Called from worker threads
+            message_id = message.get("message_id")
+            if message.get("type") == "stream_chunk":
+                self._mark(message_id, "first_token")
+                self.tokens[message_id] = self.tokens.get(message_id, 0) + 1
+            elif message.get("type") in ("stream_end", "stream_error"):
+                self._mark(message_id, "end_posted")
+            super()._post_to_ui(message)
+
+        def _append_stream_chunk(self, request, chunk):
+            super()._append_stream_chunk(request, chunk)
+            now = time.perf_counter()
+            marks = self.marks.setdefault(request.message_id, {})
+            if "first_insert" not in marks:
+                marks["first_insert"] = now
+                self.after_idle(self._mark, request.message_id, "first_paint")
+            marks["last_insert"] = now
+
+        def _finish_request(self, request):
+            self._mark(request.message_id, "finished")
+            super()._finish_request(request)
+
+        def _fetch_models_async(self):
+            self.models_requested_at = time.perf_counter()
+            super()._fetch_models_async()
+
+        def _update_models_dropdown(self, models, error=None):
+            super()._update_models_dropdown(models, error)
+            self.models_updated_at = time.perf_counter()
+
+    return InstrumentedView
+
+
+class Runner:
+    def __init__(self, root, view, server):
+        self.root = root
+        self.view = view
+        self.server = server
+        self.lateness = []
+        self._tick_expected = None
+        self._ticking = False
+
+    def wait(self, done):
+        """Runs the Tk main loop until done() is true."""
+        deadline = time.perf_counter() + TIMEOUT
+        def check():
+            if done() or time.perf_counter() > deadline:
+                self.root.quit()
+            else:
+                self.root.after(2, check)
+        self.root.after(2, check)
+        self.root.mainloop()
+        if not done():
+            raise TimeoutError("Scenario did not finish in time")
+
+    def _tick(self):
+        if not self._ticking:
+            return
+        now = time.perf_counter()
+        self.lateness.append(max(0.0, (now - self._tick_expected) * 1000))
+        self._tick_expected = now + TICK_MS / 1000
+        self.root.after(TICK_MS, self._tick)
+
+    def startup_models(self):
+        """Waits for the fetch the view schedules at startup (empty cache)."""
+        view = self.view
+        self.wait(lambda: view.models_updated_at is not None and not view._models_fetch_in_flight)
+        return (view.models_updated_at - view.models_requested_at) * 1000
+
+    def refresh_models(self):
+        """A refresh with the list cached: a conditional GET answered with 304."""
+        view = self.view
+        view.models_updated_at = None
+        view._fetch_models_async()
+        self.wait(lambda: view.models_updated_at is not None)
+        return (view.models_updated_at - view.models_requested_at) * 1000
+
+    def stream(self, count):
+        view = self.view
+        submitted = {}
+        self.lateness = []
+        self._ticking = True
+        self._tick_expected = time.perf_counter() + TICK_MS / 1000
+        self.root.after(TICK_MS, self._tick)
+        for i in range(count):
+            before = set(view._streams)
+            start = time.perf_counter()
+            view._submit_request(f"Question {i}: how do I count words in a file?", f"Question {i}",
+                                 0, view.api_url.get(), view.api_key.get(), view.selected_model.get())
+            for message_id in set(view._streams) - before:
+                submitted[message_id] = start
+        self.wait(lambda: not view._streams and view._active_workers == 0)
+        self._ticking = False
+
+        ttft, first_paint, rates, finalize = [], [], [], []
+        errors = 0
+        for message_id, start in submitted.items():
+            marks = view.marks.get(message_id, {})
+            if "first_token" in marks:
+                ttft.append((marks["first_token"] - start) * 1000)
+            if "first_paint" in marks:
+                first_paint.append((marks["first_paint"] - start) * 1000)
+            span = marks.get("last_insert", 0) - marks.get("first_insert", 0)
+            if span > 0:
+                rates.append(view.tokens.get(message_id, 0) / span)
+            if "end_posted" in marks and "finished" in marks:
+                finalize.append((marks["finished"] - marks["end_posted"]) * 1000)
+            if not any(entry.get("_msg_id") == message_id for entry in view.chat_history):
+                errors += 1 # Failed answers are removed from the history
+        return {
+            "requests": count,
+            "errors": errors,
+            "ttft_ms": summarize(ttft),
+            "first_paint_ms": summarize(first_paint),
+            "tokens_per_s": summarize(rates),
+            "finalize_ms": summarize(finalize),
+            "stall_ms": summarize(self.lateness),
+        }
+
+
+def run_scenario(AIChatView, name, settings, count, max_streams):
+    import thonnycontrib.AIChatView as view_module
+
+    config = MockConfig(**settings)
+    server = MockOpenAIServer(config).start()
+    root = tk.Tk()
+    root.geometry("700x800")
+    workbench = BenchWorkbench(root, {
+        view_module.CONFIG_API_URL: server.url,
+        view_module.CONFIG_API_KEY: "bench-key",
+        view_module.CONFIG_MODEL: MODELS[0],
+        view_module.CONFIG_MAX_STREAMS: max_streams,
+    })
+    view_module.get_workbench = lambda: workbench
+    with tempfile.TemporaryDirectory() as user_dir:
+        thonny.THONNY_USER_DIR = user_dir
+        view = make_view_class(AIChatView)(root)
+        view.pack(fill="both", expand=True)
+        root.update()
+        runner = Runner(root, view, server)
+        try:
+            # Fetch errors would make the scenario about error handling; the model list is fetched cleanly
+            error_rate, config.error_rate = config.error_rate, 0.0
+            result = {"scenario": name, "mock": config.to_dict(), "max_streams": max_streams,
+                      "models_cold_ms": runner.startup_models(), "models_304_ms": runner.refresh_models()}
+            config.error_rate = error_rate
+            result.update(runner.stream(count))
+            result["frame_stats"] = view.get_stream_frame_stats()
+            result["server_requests"] = dict(server.requests)
+        finally:
+            view.destroy()
+            root.destroy()
+            server.stop()
+    return result
+
+
+def fmt(value, digits=1):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run (repeatable); default: all")
+    parser.add_argument("--output", help="Write the results as JSON to this file ('-' for stdout)")
+    args = parser.parse_args()
+
+    from thonnycontrib.AIChatView import AIChatView
+
+    results = []
+    for name in args.scenario or list(SCENARIOS):
+        settings, count, max_streams = SCENARIOS[name]
+        results.append(run_scenario(AIChatView, name, settings, count, max_streams))
+
+    report = {"python": sys.version.split()[0], "tk": tk.TkVersion, "results": results}
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    print(f"{'scenario':<11} {'models':>7} {'304':>6} {'ttft p50':>9} {'paint p50':>10} {'tok/s':>8} "
+          f"{'stall p95':>10} {'stall max':>10} {'errors':>7}")
+    for r in results:
+        print(f"{r['scenario']:<11} {fmt(r['models_cold_ms']):>7} {fmt(r['models_304_ms']):>6} "
+              f"{fmt(r['ttft_ms']['p50']):>9} {fmt(r['first_paint_ms']['p50']):>10} "
+              f"{fmt(r['tokens_per_s']['p50'], 0):>8} {fmt(r['stall_ms']['p95']):>10} "
+              f"{fmt(r['stall_ms']['max']):>10} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
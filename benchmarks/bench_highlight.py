@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Benchmark: code block highlighting cost, full vs. resumed tokenizing while streaming.
+
+A Python code block is streamed line by line. After every line "full"
+re-tokenizes the whole block (what a naive highlighter would do), while
+"resumed" tokenizes only from the last checkpoint as the view does. It also
+reports the one-off cost of a complete block and of a cache hit.
+
+    python benchmarks/bench_highlight.py [lines]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from thonnycontrib.ai_chat.highlight import HighlightCache, cache_key, python_spans  # noqa: E402
+
+FUNCTION = '''@lru_cache(maxsize=None)
+def count_words(path, encoding="utf-8"):
+    """Counts the words of a text file."""
+    total = 0
+    with open(path, encoding=encoding) as f:
+        for line in f:  # One line at a time
+            total += len(line.split())
+    return total + 0x10 - 16
+
+'''
+
+
+def synthetic_block(lines):
+    function_lines = FUNCTION.splitlines(keepends=True)
+    return "".join(function_lines[i % len(function_lines)] for i in range(lines))
+
+
+def stream_full(lines):
+    code = ""
+    for line in lines:
+        code += line
+        python_spans(code)
+
+
+def stream_resumed(lines):
+    code = ""
+    checkpoint = 0
+    for line in lines:
+        code += line
+        _, fragment_checkpoint = python_spans(code[checkpoint:])
+        checkpoint += fragment_checkpoint
+
+
+def best_of(function, *args, rounds=3):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    line_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    code = synthetic_block(line_count)
+    lines = code.splitlines(keepends=True)
+
+    spans, _ = python_spans(code)
+    print(f"{line_count} lines, {len(code)} chars, {len(spans)} spans")
+    print(f"complete block:      {best_of(python_spans, code) * 1000:8.2f} ms")
+    cache = HighlightCache()
+    cache.put(cache_key(code, "python"), spans)
+    print(f"cache hit (hash+get): {best_of(lambda: cache.get(cache_key(code, 'python'))) * 1000:8.3f} ms")
+    full = best_of(stream_full, lines)
+    resumed = best_of(stream_resumed, lines)
+    print(f"streamed, full:      {full * 1000:8.1f} ms total")
+    print(f"streamed, resumed:   {resumed * 1000:8.1f} ms total ({full / resumed:.1f}x less)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Benchmark: time-to-first-token with and without pooled keep-alive sessions.
+
+Starts a small local OpenAI-compatible stub that streams a few SSE events and
+issues the same chat request repeatedly, once through module-level
+``requests.post`` (new connection every time, the old behaviour) and once
+through ``SessionPool`` (connection reused). Against a remote HTTPS endpoint
+the difference is larger, since the TLS handshake is skipped as well.
+
+    python benchmarks/bench_http_pool.py [rounds]
+"""
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from thonnycontrib.ai_chat.http_pool import SessionPool  # noqa: E402
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive
+    disable_nagle_algorithm = True # Small SSE writes must not wait for delayed ACKs
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for word in ["Hello", " from", " the", " stub"]:
+            event = {"choices": [{"delta": {"content": word}}]}
+            self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def time_to_first_token(post, url):
+    payload = {"model": "stub", "messages": [{"role": "user", "content": "hi"}], "stream": True}
+    start = time.perf_counter()
+    with post(url, json=payload, headers={"Authorization": "Bearer x"}, stream=True, timeout=10) as response:
+        ttft = None
+        for line in response.iter_lines():
+            if ttft is None and line.startswith(b"data: "):
+                ttft = time.perf_counter() - start
+    return ttft * 1000
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[max(0, int(len(samples) * 0.95) - 1)]
+    print(f"{label:<22} median {statistics.median(samples):7.2f} ms   p95 {p95:7.2f} ms")
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    chat_url = base_url + "/chat/completions"
+
+    unpooled = [time_to_first_token(requests.post, chat_url) for _ in range(rounds)]
+    pool = SessionPool()
+    session = pool.get(base_url, "x")
+    pooled = [time_to_first_token(session.post, chat_url) for _ in range(rounds)]
+    pool.shutdown()
+    server.shutdown()
+
+    print(f"Time to first token over {rounds} requests to {base_url}")
+    report("requests.post (new)", unpooled)
+    report("SessionPool (reuse)", pooled)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""Benchmark: Markdown rendering of 1 KB / 10 KB / 100 KB answers.
+
+Compares the old full-buffer formatter (re-scan the rest of the Text widget
+after every substitution, delete/reinsert each match) with the incremental
+StreamingMarkdownRenderer, both as one complete message and fed as a stream
+of small chunks. Needs a display for the Tk parts (use xvfb-run on CI);
+without one only the pure tokenizer timings are reported.
+
+    python benchmarks/bench_markdown_render.py
+"""
+import os
+import re
+import sys
+import time
+import tkinter as tk
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from thonnycontrib.ai_chat.markdown_stream import StreamingMarkdownRenderer, render_markdown  # noqa: E402
+
+SIZES = [1_000, 10_000, 100_000]
+STREAM_CHUNK = 6  # Roughly one token
+
+PARAGRAPH = (
+    "The **list comprehension** builds a *new* list from an iterable. "
+    "Use _generator expressions_ when the result is consumed once.\n"
+)
+CODE = "```python\ndef squares(n):\n    return [i * i for i in range(n)]\n```\n"
+
+
+def make_answer(size):
+    parts = []
+    total = 0
+    i = 0
+    while total < size:
+        piece = CODE if i % 3 == 2 else PARAGRAPH
+        parts.append(piece)
+        total += len(piece)
+        i += 1
+    return "".join(parts)[:size]
+
+
+def legacy_apply_markdown_tags(text_widget, start_index):
+    """The pre-incremental algorithm, kept here only for comparison."""
+    patterns = {
+        r"(?s)```(?:[a-zA-Z]*)?\n(.*?)\n```": "code_block",
+        r"\*\*(.*?)\*\*": "bold",
+        r"(?<!\*)\*(?!\*|_)(.*?)(?<!\*)\*(?!\*|_)": "italic",
+        r"(?<!_)_(?!_|\*)(.*?)(?<!_)_(?!_|\*)": "italic",
+    }
+    end_index = text_widget.index("end-1c")
+    current_pos = start_index
+    while text_widget.compare(current_pos, "<", end_index):
+        first = None
+        search_start = text_widget.index(current_pos)
+        text_to_search = text_widget.get(search_start, end_index)
+        for pattern, tag in patterns.items():
+            match = re.search(pattern, text_to_search)
+            if match:
+                m_start = text_widget.index(f"{search_start}+{match.start()}c")
+                m_end = text_widget.index(f"{search_start}+{match.end()}c")
+                if first is None or text_widget.compare(m_start, "<", first[1]):
+                    first = (tag, m_start, m_end, match.group(1))
+        if first is None:
+            break
+        tag, s_idx, e_idx, content = first
+        text_widget.delete(s_idx, e_idx)
+        if tag == "code_block":
+            text_widget.insert(s_idx, "\n")
+            code_start = text_widget.index(f"{s_idx}+1c")
+            text_widget.insert(code_start, content)
+            code_end = text_widget.index(f"{code_start}+{len(content)}c")
+            text_widget.insert(code_end, "\n")
+            current_pos = text_widget.index(f"{code_end}+1c")
+            text_widget.tag_add(tag, code_start, current_pos)
+            text_widget.tag_add("code_content", code_start, code_end)
+        else:
+            text_widget.insert(s_idx, content)
+            current_pos = text_widget.index(f"{s_idx}+{len(content)}c")
+            text_widget.tag_add(tag, s_idx, current_pos)
+        end_index = text_widget.index("end-1c")
+
+
+def insert_segments(text_widget, index, segments):
+    if segments:
+        args = []
+        for text, tags in segments:
+            args.append(text)
+            args.append(tags)
+        text_widget.insert(index, *args)
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def bench_pure(answer):
+    def whole():
+        render_markdown(answer)
+
+    def stream():
+        renderer = StreamingMarkdownRenderer()
+        for i in range(0, len(answer), STREAM_CHUNK):
+            renderer.feed(answer[i:i + STREAM_CHUNK])
+        renderer.close()
+
+    return timed(whole), timed(stream)
+
+
+def bench_tk(text_widget, answer):
+    def legacy():
+        text_widget.delete("1.0", "end")
+        text_widget.insert("end", answer)
+        legacy_apply_markdown_tags(text_widget, "1.0")
+
+    def whole():
+        text_widget.delete("1.0", "end")
+        insert_segments(text_widget, "end", render_markdown(answer))
+
+    def stream():
+        text_widget.delete("1.0", "end")
+        renderer = StreamingMarkdownRenderer()
+        for i in range(0, len(answer), STREAM_CHUNK):
+            insert_segments(text_widget, "end-1c", renderer.feed(answer[i:i + STREAM_CHUNK]))
+        insert_segments(text_widget, "end-1c", renderer.close())
+
+    return timed(legacy), timed(whole), timed(stream)
+
+
+def main():
+    try:
+        root = tk.Tk()
+        root.withdraw()
+        text_widget = tk.Text(root)
+    except tk.TclError as e:
+        print(f"No Tk display ({e}); reporting tokenizer timings only.\n")
+        text_widget = None
+
+    if text_widget is not None:
+        print(f"{'size':>8} {'legacy ms':>10} {'new ms':>10} {'stream ms':>10} {'speedup':>8}")
+    else:
+        print(f"{'size':>8} {'render ms':>10} {'stream ms':>10}")
+    for size in SIZES:
+        answer = make_answer(size)
+        if text_widget is not None:
+            legacy_ms, whole_ms, stream_ms = bench_tk(text_widget, answer)
+            print(f"{size:>8} {legacy_ms:>10.1f} {whole_ms:>10.1f} {stream_ms:>10.1f} "
+                  f"{legacy_ms / max(whole_ms, 1e-6):>7.0f}x")
+        else:
+            whole_ms, stream_ms = bench_pure(answer)
+            print(f"{size:>8} {whole_ms:>10.2f} {stream_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Benchmark: encoding chat request bodies, from scratch vs. reusing the previous turns.
+
+Simulates a long session in which the user pastes code: each turn adds a
+question (with a code block) and an answer, and the whole history (or the
+newest part that fits a context budget) is sent again. "full" encodes
+every request body with json.dumps as requests' json= does; "reused"
+uses RequestBodyEncoder as the view does.
+
+    python benchmarks/bench_payload.py [turns] [--budget-messages N]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from thonnycontrib.ai_chat.payload import RequestBodyEncoder  # noqa: E402
+
+CODE = "def handler(event):\n    value = event.get('value', 0)  # Größe\n    return value * 2\n\n" * 60
+
+
+def session(turns, budget_messages):
+    """The message lists sent in each turn."""
+    system = {"role": "system", "content": "You are a helpful coding assistant. Please respond in English."}
+    history = []
+    for turn in range(turns):
+        history.append({"role": "user", "content": f"Question {turn}: why does this fail?\n```\n{CODE}```"})
+        window = history[-budget_messages:] if budget_messages else history
+        yield [system] + window
+        history.append({"role": "assistant", "content": f"Answer {turn}. " + "It fails because ... " * 80})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("turns", type=int, nargs="?", default=60)
+    parser.add_argument("--budget-messages", type=int, default=0,
+                        help="Send only the newest N messages (trimmed context); 0 sends all")
+    args = parser.parse_args()
+    requests_messages = list(session(args.turns, args.budget_messages))
+
+    start = time.perf_counter()
+    total_bytes = 0
+    for messages in requests_messages:
+        total_bytes += len(json.dumps({"model": "m", "messages": messages, "stream": True}).encode("utf-8"))
+    full = time.perf_counter() - start
+
+    encoder = RequestBodyEncoder()
+    start = time.perf_counter()
+    for messages in requests_messages:
+        encoder.encode({"model": "m", "stream": True}, messages)
+    reused = time.perf_counter() - start
+
+    print(f"{args.turns} turns, {total_bytes / 1024 / 1024:.1f} MiB of request bodies in total")
+    print(f"full re-encode: {full * 1000:8.1f} ms ({full / args.turns * 1000:.2f} ms per request)")
+    print(f"reused prefix:  {reused * 1000:8.1f} ms ({reused / args.turns * 1000:.2f} ms per request, "
+          f"{full / reused:.1f}x less)")
+    print(f"encoder stats: {encoder.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Benchmark: BM25 retrieval index build, reopen (mmap), refresh and query latency.
+
+Uses the synthetic module tree of bench_symbol_index (10 000 files by
+default) or an existing directory, and measures:
+
+* the first build and the size of the index file,
+* opening the saved index in a new retriever (what a restart costs),
+* a refresh with nothing changed, and after one file was edited,
+* the latency of a few questions.
+
+    python benchmarks/bench_retrieval.py [files] [--tree DIR]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from bench_symbol_index import generate_tree  # noqa: E402
+from thonnycontrib.ai_chat.retrieval import ProjectRetriever  # noqa: E402
+
+QUESTIONS = [
+    "how are the fields of a parsed row totalled",
+    "where is the file read with an encoding",
+    "Record4242 get default",
+    "which helper multiplies the value",
+    "parse_17 splitlines comma",
+]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", type=int, nargs="?", default=10000)
+    parser.add_argument("--tree", help="Index this directory instead of a generated one")
+    args = parser.parse_args()
+
+    root = args.tree or tempfile.mkdtemp(prefix="ai_chat_retrieval_")
+    index_dir = tempfile.mkdtemp(prefix="ai_chat_retrieval_index_")
+    try:
+        if not args.tree:
+            generate_tree(root, args.files)
+
+        retriever = ProjectRetriever(root, index_dir, max_files=max(args.files, 1) * 2)
+        _, build = timed(retriever.refresh)
+        stats = retriever.get_stats()
+        print(f"build: {build:.2f} s, {stats['files']} files, {stats['docs']} snippets, {stats['terms']} terms, "
+              f"{stats['postings']} postings, {stats['bytes'] / 1024 / 1024:.1f} MiB on disk")
+
+        reopened = ProjectRetriever(root, index_dir, max_files=retriever.max_files)
+        _, reopen = timed(reopened.open)
+        print(f"reopen (mmap): {reopen * 1000:.2f} ms")
+        _, unchanged = timed(reopened.refresh)
+        print(f"refresh, nothing changed: {unchanged:.2f} s")
+
+        if not args.tree:
+            with open(os.path.join(root, "package_0", "module_1.py"), "a", encoding="utf-8") as f:
+                f.write("\n\ndef freshly_saved_helper():\n    return 1\n")
+            _, one_file = timed(reopened.refresh)
+            found = [hit.path for hit in reopened.search("freshly saved helper", 1)]
+            print(f"refresh after editing one file: {one_file:.2f} s, found: {bool(found)}")
+
+        latencies = []
+        for question in QUESTIONS * 5:
+            _, elapsed = timed(reopened.search, question, 4)
+            latencies.append(elapsed * 1000)
+        print(f"query: median {statistics.median(latencies):.2f} ms, max {max(latencies):.2f} ms")
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+        if not args.tree:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
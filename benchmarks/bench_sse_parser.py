@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""Benchmark: SSE parsing throughput (events per second), old line loop vs. SSEParser.
+
+"old" is the previous worker loop: requests' iter_lines() splitting, decode,
+startswith/slice, json.loads on every event and ``full += chunk``. "new" is
+SSEParser + delta_content with the answer joined once (measured with orjson,
+if installed, and with the stdlib json fast path). The input is a
+recorded-style stream of 10,000 chat completion events (with keep-alive
+comments) cut into network-sized chunks, or a captured response body.
+
+    python benchmarks/bench_sse_parser.py [events | captured_body_file]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from thonnycontrib.ai_chat import sse  # noqa: E402
+from thonnycontrib.ai_chat.sse import SSEParser, delta_content  # noqa: E402
+
+WORDS = ["def", " read", "_lines", "(path", "):\n", "    ", "with", " open", " the", " file", "**", "日本", "\"q\""]
+
+
+def synthetic_body(events):
+    rng = random.Random(42)
+    parts = [b'data: {"id":"chatcmpl-1","object":"chat.completion.chunk","created":1,"model":"m",'
+             b'"choices":[{"index":0,"delta":{"role":"assistant","content":""},"finish_reason":null}]}\n\n']
+    for i in range(events):
+        if i % 100 == 0:
+            parts.append(b": keep-alive\n\n")
+        event = {"id": "chatcmpl-1", "object": "chat.completion.chunk", "created": 1, "model": "m",
+                 "choices": [{"index": 0, "delta": {"content": rng.choice(WORDS)}, "finish_reason": None}]}
+        parts.append(b"data: " + json.dumps(event, separators=(",", ":")).encode() + b"\n\n")
+    parts.append(b"data: [DONE]\n\n")
+    return b"".join(parts)
+
+
+def network_chunks(body):
+    """Cuts body like TCP reads of a chunked response (a few events per read)."""
+    rng = random.Random(7)
+    chunks, pos = [], 0
+    while pos < len(body):
+        size = rng.randint(64, 1500)
+        chunks.append(body[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def iter_lines(chunks):
+    """requests.Response.iter_lines() without a delimiter."""
+    pending = None
+    for chunk in chunks:
+        if pending is not None:
+            chunk = pending + chunk
+        lines = chunk.splitlines()
+        if lines and lines[-1] and chunk and lines[-1][-1] == chunk[-1]:
+            pending = lines.pop()
+        else:
+            pending = None
+        yield from lines
+    if pending is not None:
+        yield pending
+
+
+def old_loop(chunks):
+    full = ""
+    events = 0
+    for line in iter_lines(chunks):
+        if line:
+            decoded_line = line.decode("utf-8")
+            if decoded_line.startswith("data: "):
+                data_str = decoded_line[len("data: "):].strip()
+                if data_str == "[DONE]":
+                    break
+                events += 1
+                data = json.loads(data_str)
+                if data.get("choices"):
+                    content = data["choices"][0].get("delta", {}).get("content")
+                    if content:
+                        full += content
+    return full, events
+
+
+def new_loop(chunks):
+    parser = SSEParser()
+    parts = []
+    events = 0
+    for chunk in chunks:
+        for data in parser.feed(chunk):
+            if data == b"[DONE]":
+                return "".join(parts), events
+            events += 1
+            content = delta_content(data)
+            if content:
+                parts.append(content)
+    return "".join(parts), events
+
+
+def best_of(loop, chunks, rounds=5):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = loop(chunks)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    arg = sys.argv[1] if len(sys.argv) > 1 else "10000"
+    if os.path.isfile(arg):
+        with open(arg, "rb") as f:
+            body = f.read()
+    else:
+        body = synthetic_body(int(arg))
+    chunks = network_chunks(body)
+    print(f"{len(body)} bytes in {len(chunks)} reads")
+    old_time, (old_text, events) = best_of(old_loop, chunks)
+    print(f"{'parser':<12} {'ms':>8} {'events/s':>12} {'speedup':>8}")
+    print(f"{'old':<12} {old_time * 1000:>8.1f} {events / old_time:>12,.0f}")
+    backends = [sse.JSON_BACKEND] + (["json"] if sse.JSON_BACKEND != "json" else [])
+    for backend in backends:
+        if backend == "json":
+            sse.JSON_BACKEND, sse._json_loads = "json", json.loads
+        new_time, (new_text, new_events) = best_of(new_loop, chunks)
+        assert old_text == new_text and events == new_events, "parsers disagree"
+        label = f"new ({backend})"
+        print(f"{label:<12} {new_time * 1000:>8.1f} {events / new_time:>12,.0f} {old_time / new_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
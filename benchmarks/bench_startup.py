@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""Benchmark: plugin import time and first show of the chat view.
+
+"import" runs ``python -X importtime`` in fresh interpreters that have
+already imported what Thonny itself loads (tkinter, thonny.shell, json,
+...), so only the plugin's own cost is measured. It also lists the heavy
+modules the import pulled in; requests, sqlite3, orjson, ast, tokenize and
+the like are expected to load only when the view is used.
+
+"show" builds an AIChatView in a fresh Tk root (options in memory, temporary
+user directory) and measures construction, the first map + idle and the
+time until the view has started (history loaded, model fetch scheduled).
+It needs a display (use xvfb-run on headless machines).
+
+Both need Thonny installed. With --max-import-ms the script exits with
+status 1 when the median import time exceeds the budget or a deferred
+module is imported at load time, so it can guard against regressions.
+
+    python benchmarks/bench_startup.py [--runs N] [--no-show] [--max-import-ms MS] [--output results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PLUGIN_MODULE = "thonnycontrib.AIChatView"
+THONNY_PRELOAD = "import tkinter, tkinter.font, tkinter.ttk, json, locale, logging, threading, queue, thonny, thonny.shell"
+DEFERRED_MODULES = ["requests", "urllib3", "sqlite3", "orjson", "ast", "tokenize", "mmap", "email.utils", "socket",
+                    "thonnycontrib.ai_chat.sse", "thonnycontrib.ai_chat.history_store",
+                    "thonnycontrib.ai_chat.symbol_index", "thonnycontrib.ai_chat.retrieval",
+                    "thonnycontrib.ai_chat.chunking"]
+
+IMPORT_CHILD = f"""
+{THONNY_PRELOAD}
+import sys, json
+before = set(sys.modules) # Thonny itself may have loaded some of them already
+sys.stderr.write("-- plugin --\\n")
+import {PLUGIN_MODULE}
+print(json.dumps([name for name in {DEFERRED_MODULES!r} if name in sys.modules and name not in before]))
+"""
+
+
+def measure_import():
+    """One fresh interpreter: (plugin cumulative import ms, deferred modules loaded, top self times)."""
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", IMPORT_CHILD], env=env,
+                            capture_output=True, text=True, check=True)
+    plugin_us = None
+    self_times = []
+    plugin_lines = result.stderr.split("-- plugin --", 1)[-1] # Only what the plugin import added
+    for line in plugin_lines.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        self_times.append((int(self_us), name.strip()))
+        if name.strip() == PLUGIN_MODULE:
+            plugin_us = int(cumulative_us)
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    return plugin_us / 1000, loaded, sorted(self_times, reverse=True)[:8]
+
+
+def show_child():
+    """Runs in a subprocess: times construction and first show of the view."""
+    import tempfile
+    import time
+    import tkinter as tk
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import thonny
+    from bench_end_to_end import BenchWorkbench
+
+    start = time.perf_counter()
+    import thonnycontrib.AIChatView as view_module
+    imported = time.perf_counter()
+
+    root = tk.Tk()
+    root.geometry("700x800")
+    workbench = BenchWorkbench(root, {view_module.CONFIG_API_URL: "http://127.0.0.1:9/v1",
+                                      view_module.CONFIG_API_KEY: "bench-key"})
+    view_module.get_workbench = lambda: workbench
+    with tempfile.TemporaryDirectory() as user_dir:
+        thonny.THONNY_USER_DIR = user_dir
+        root.update()
+        constructed_start = time.perf_counter()
+        view = view_module.AIChatView(root)
+        constructed = time.perf_counter()
+        view.pack(fill="both", expand=True)
+        root.update()
+        shown = time.perf_counter()
+        root.update() # The history load runs at idle after the first map
+        started = time.perf_counter()
+        result = {
+            "import_ms": (imported - start) * 1000,
+            "construct_ms": (constructed - constructed_start) * 1000,
+            "first_show_ms": (shown - constructed) * 1000,
+            "started_ms": (started - constructed) * 1000,
+            "started": view._started,
+        }
+        view.destroy()
+        root.destroy()
+    print(json.dumps(result))
+
+
+def measure_show():
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--show-child"], env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def median_of(runs, key):
+    return statistics.median(run[key] for run in runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-show", action="store_true", help="Only measure the import")
+    parser.add_argument("--max-import-ms", type=float, help="Fail if the median plugin import is slower")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--show-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.show_child:
+        show_child()
+        return
+
+    imports = [measure_import() for _ in range(args.runs)]
+    import_ms = statistics.median(run[0] for run in imports)
+    loaded = sorted(set(name for run in imports for name in run[1]))
+    report = {"python": sys.version.split()[0], "runs": args.runs,
+              "plugin_import_ms": import_ms, "deferred_modules_loaded": loaded,
+              "top_self_us": imports[0][2]}
+    print(f"plugin import (on top of Thonny): {import_ms:.1f} ms median of {args.runs}")
+    print(f"deferred modules loaded at import: {', '.join(loaded) or 'none'}")
+    for self_us, name in imports[0][2]:
+        print(f"  {self_us / 1000:7.2f} ms  {name}")
+
+    if not args.no_show:
+        shows = [measure_show() for _ in range(args.runs)]
+        report["show"] = {key: median_of(shows, key)
+                          for key in ("import_ms", "construct_ms", "first_show_ms", "started_ms")}
+        print("first show (median): " + ", ".join(f"{key} {value:.1f}" for key, value in report["show"].items()))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.max_import_ms is not None and (import_ms > args.max_import_ms or loaded):
+        print(f"FAIL: import budget {args.max_import_ms} ms, deferred modules loaded: {loaded}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""Benchmark: symbol index build time, memory, incremental updates and lookups.
+
+Generates a tree of synthetic Python modules (10 000 by default, each with a
+few functions and a class with methods) in a temporary directory, then
+measures:
+
+* the first scan (parse every file) and the memory the index holds
+  (measured with tracemalloc in a separate build),
+* a second scan with nothing changed (stat only),
+* reindexing one saved file,
+* finding the definitions a selection refers to.
+
+    python benchmarks/bench_symbol_index.py [files] [--tree DIR]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from thonnycontrib.ai_chat.symbol_index import SymbolIndex  # noqa: E402
+
+MODULE_TEMPLATE = '''"""Module {index}."""
+import os
+from functools import lru_cache
+
+
+def load_{index}(path, encoding="utf-8"):
+    """Reads a file."""
+    with open(path, encoding=encoding) as f:
+        return f.read()
+
+
+def parse_{index}(text):
+    return [line.split(",") for line in text.splitlines() if line]
+
+
+@lru_cache(maxsize=None)
+def helper_{index}(value):
+    return value * {index}
+
+
+class Record{index}:
+    """A parsed row."""
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def get(self, position, default=None):
+        return self.fields[position] if position < len(self.fields) else default
+
+    def total(self):
+        return sum(float(field) for field in self.fields)
+'''
+
+SELECTION = '''def report(path):
+    rows = parse_{a}(load_{a}(path))
+    records = [Record{b}(row) for row in rows]
+    return helper_{c}(sum(record.total() for record in records))
+'''
+
+
+def generate_tree(root, files, per_directory=50):
+    for index in range(files):
+        directory = os.path.join(root, f"package_{index // per_directory}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"module_{index}.py"), "w", encoding="utf-8") as f:
+            f.write(MODULE_TEMPLATE.format(index=index))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", type=int, nargs="?", default=10000)
+    parser.add_argument("--tree", help="Index this directory instead of a generated one")
+    args = parser.parse_args()
+
+    root = args.tree or tempfile.mkdtemp(prefix="ai_chat_symbols_")
+    try:
+        if not args.tree:
+            start = time.perf_counter()
+            generate_tree(root, args.files)
+            print(f"generated {args.files} files in {time.perf_counter() - start:.1f} s")
+
+        index = SymbolIndex(max_files=max(args.files, 1) * 2)
+        start = time.perf_counter()
+        index.scan(root)
+        build = time.perf_counter() - start
+        # Memory in a second build: tracing slows parsing down several times
+        tracemalloc.start()
+        traced = SymbolIndex(max_files=index.max_files)
+        traced.scan(root)
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del traced
+        stats = index.get_stats()
+        print(f"first scan: {build:.2f} s, {stats['files']} files, {stats['symbols']} symbols, "
+              f"{stats['names']} names, {held / 1024 / 1024:.1f} MiB held "
+              f"({held / max(1, stats['symbols']):.0f} bytes per symbol)")
+
+        start = time.perf_counter()
+        index.scan(root)
+        print(f"rescan, nothing changed: {time.perf_counter() - start:.2f} s")
+
+        if not args.tree:
+            path = os.path.join(root, "package_0", "module_1.py")
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n\ndef added_on_save():\n    return 1\n")
+            start = time.perf_counter()
+            index.index_file(path)
+            print(f"reindex one saved file: {(time.perf_counter() - start) * 1000:.2f} ms, "
+                  f"found: {bool(index.lookup('added_on_save'))}")
+
+            rng = random.Random(1)
+            a, b, c = (rng.randrange(args.files) for _ in range(3))
+            selection = SELECTION.format(a=a, b=b, c=c)
+            start = time.perf_counter()
+            definitions = index.definitions_for(selection, 1000)
+            elapsed = time.perf_counter() - start
+            print(f"definitions for a selection: {elapsed * 1000:.2f} ms -> "
+                  + ", ".join(symbol.qualname for symbol, _ in definitions))
+    finally:
+        if not args.tree:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Benchmark: memory and latency of a 1,000-message transcript, full vs. virtualized.
+
+"full" renders every message into one Text widget with per-message tags (the
+old behaviour). "windowed" keeps only the newest MAX_RENDERED_MESSAGES, as the
+virtualized chat view does. Reports RSS growth and the latency of typical UI
+operations. Needs a display (use xvfb-run on headless machines).
+
+    python benchmarks/bench_virtual_transcript.py [messages]
+"""
+import os
+import sys
+import time
+import tkinter as tk
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from thonnycontrib.ai_chat.markdown_stream import render_markdown  # noqa: E402
+
+MAX_RENDERED_MESSAGES = 150 # Same as the chat view
+
+USER_TEXT = "How do I read a file line by line and count the **words** in each line?"
+ASSISTANT_TEXT = (
+    "Open the file with a *with* statement and iterate over it:\n"
+    "```python\nwith open(path) as f:\n    for line in f:\n        print(len(line.split()))\n```\n"
+    "Each iteration yields one line, so memory use stays _constant_.\n"
+)
+
+
+def rss_kb():
+    """Resident set size in KB (Linux /proc, falls back to ru_maxrss)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def synthetic_history(count):
+    return [{"role": "user" if i % 2 == 0 else "assistant",
+             "content": USER_TEXT if i % 2 == 0 else ASSISTANT_TEXT} for i in range(count)]
+
+
+def render(text_widget, entries, first_number=0):
+    args = []
+    for number, entry in enumerate(entries, start=first_number):
+        msg_tags = (f"msg_{number}", "message_block")
+        if number != first_number:
+            args += ["\n\n", ()]
+        args += [f"{entry['role'].capitalize()}: ", (f"{entry['role']}_role", f"msg_{number}_role") + msg_tags]
+        for text, tags in render_markdown(entry["content"]):
+            args += [text, tags + msg_tags]
+    text_widget.insert("end", *args)
+
+
+def measure(root, history, windowed):
+    text_widget = tk.Text(root, wrap="word", width=80, height=40)
+    text_widget.pack()
+    root.update()
+    before = rss_kb()
+
+    start = time.perf_counter()
+    entries = history[-MAX_RENDERED_MESSAGES:] if windowed else history
+    render(text_widget, entries, len(history) - len(entries))
+    text_widget.see("end")
+    root.update()
+    build_ms = (time.perf_counter() - start) * 1000
+    grown_kb = rss_kb() - before
+
+    def op_ms(action, repeat=20):
+        start = time.perf_counter()
+        for i in range(repeat):
+            action(i)
+            root.update()
+        return (time.perf_counter() - start) * 1000 / repeat
+
+    see_end = op_ms(lambda i: (text_widget.insert("end", "."), text_widget.see("end")))
+    scroll = op_ms(lambda i: text_widget.yview_moveto((i % 10) / 10))
+    resize = op_ms(lambda i: text_widget.configure(width=60 + (i % 2) * 40), repeat=6)
+    tag_count = len(text_widget.tag_names())
+    text_widget.destroy()
+    return build_ms, grown_kb, see_end, scroll, resize, tag_count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"This benchmark needs a display: {e}")
+        return
+    history = synthetic_history(count)
+    print(f"{count} messages, window of {MAX_RENDERED_MESSAGES}")
+    print(f"{'mode':<10} {'build ms':>9} {'RSS +KB':>8} {'append+see ms':>14} "
+          f"{'scroll ms':>10} {'resize ms':>10} {'tags':>6}")
+    for windowed in (False, True):
+        build_ms, grown_kb, see_end, scroll, resize, tags = measure(root, history, windowed)
+        print(f"{'windowed' if windowed else 'full':<10} {build_ms:>9.1f} {grown_kb:>8} {see_end:>14.2f} "
+              f"{scroll:>10.2f} {resize:>10.2f} {tags:>6}")
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""Local mock of an OpenAI-compatible API for benchmarks and manual testing.
+
+Serves ``GET /models`` (with ETag / 304 support) and ``POST /chat/completions``
+(streaming SSE or a plain JSON answer). Timing and failures are configurable:
+
+    token_rate          tokens per second while streaming (0 = as fast as possible)
+    first_token_delay   seconds before the first token
+    chunk_tokens        tokens per SSE event
+    answer_tokens       tokens per answer (a request's max_tokens wins if smaller)
+    error_rate          probability of answering with error_status instead
+    error_status        HTTP status of injected errors (e.g. 429, 500, 503)
+    drop_after_tokens   close the connection mid-stream after this many tokens (0 = never)
+    keepalive_every     send an SSE comment every N events (0 = never)
+    response_delay      seconds before the chat response headers (a stalled or overloaded server)
+
+Run standalone and point the plugin's API URL at it:
+
+    python benchmarks/mock_openai_server.py --port 8765 --token-rate 40 --first-token-delay 0.5
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MODELS = ["mock-small", "mock-large", "mock-code"]
+
+ANSWER_TEXT = (
+    "Here is a **short** answer with some _emphasis_ and a code block:\n"
+    "```python\n"
+    "def count_words(path):\n"
+    "    with open(path) as f:\n"
+    "        return sum(len(line.split()) for line in f)\n"
+    "```\n"
+    "The function reads the file *line by line*, so memory use stays constant. "
+)
+
+
+def answer_tokens():
+    """Endless stream of word-sized tokens taken from ANSWER_TEXT."""
+    words = ANSWER_TEXT.replace("\n", " \n ").split(" ")
+    while True:
+        for word in words:
+            if word:
+                yield word if word == "\n" else word + " "
+
+
+class MockConfig:
+    def __init__(self, token_rate=50.0, first_token_delay=0.2, chunk_tokens=1, answer_tokens=200,
+                 error_rate=0.0, error_status=500, drop_after_tokens=0, keepalive_every=0, seed=None,
+                 response_delay=0.0):
+        self.token_rate = token_rate
+        self.first_token_delay = first_token_delay
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.answer_tokens = answer_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.drop_after_tokens = drop_after_tokens
+        self.keepalive_every = keepalive_every
+        self.response_delay = response_delay
+        self.random = random.Random(seed)
+
+    def to_dict(self):
+        return {key: value for key, value in vars(self).items() if key != "random"}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, chunked streaming
+    disable_nagle_algorithm = True # Small SSE writes must not wait for delayed ACKs
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def _path(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        return path[len("/v1"):] if path.startswith("/v1/") else path
+
+    def _send_json(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject_error(self):
+        if self.config.error_rate and self.config.random.random() < self.config.error_rate:
+            status = self.config.error_status
+            headers = [("Retry-After", "1")] if status in (429, 503) else []
+            self._send_json(status, {"error": {"message": f"Injected error {status}", "type": "mock_error"}}, headers)
+            return True
+        return False
+
+    def do_GET(self):
+        self.server.count("models")
+        if self._path() != "/models":
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        if self._inject_error():
+            return
+        body = {"object": "list", "data": [{"id": model, "object": "model"} for model in MODELS]}
+        etag = '"' + hashlib.sha1(json.dumps(body).encode()).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send_json(200, body, [("ETag", etag)])
+
+    def do_POST(self):
+        self.server.count("chat")
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self._path() != "/chat/completions":
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        if self.config.response_delay:
+            time.sleep(self.config.response_delay)
+        if self._inject_error():
+            return
+        total = self.config.answer_tokens
+        if request.get("max_tokens"):
+            total = min(total, request["max_tokens"])
+        if request.get("stream"):
+            self._stream(request.get("model", MODELS[0]), total)
+        else:
+            tokens = answer_tokens()
+            text = "".join(next(tokens) for _ in range(total))
+            self._send_json(200, {"object": "chat.completion", "model": request.get("model"),
+                                  "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                               "finish_reason": "stop"}]})
+
+    def _stream(self, model, total):
+        config = self.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        tokens = answer_tokens()
+        interval = config.chunk_tokens / config.token_rate if config.token_rate else 0
+        try:
+            self._event({"role": "assistant", "content": ""}, model)
+            time.sleep(config.first_token_delay)
+            next_at = time.perf_counter()
+            sent = events = 0
+            while sent < total:
+                count = min(config.chunk_tokens, total - sent)
+                self._event({"content": "".join(next(tokens) for _ in range(count))}, model)
+                sent += count
+                events += 1
+                if config.drop_after_tokens and sent >= config.drop_after_tokens:
+                    self.close_connection = True
+                    self.connection.shutdown(2) # Abrupt end, no final chunk
+                    return
+                if config.keepalive_every and events % config.keepalive_every == 0:
+                    self._chunk(b": keep-alive\n\n")
+                if interval:
+                    next_at += interval
+                    delay = next_at - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+            self._event({}, model, finish_reason="stop")
+            self._chunk(b"data: [DONE]\n\n")
+            self._chunk(b"")
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass # Client stopped reading (e.g. the user pressed Stop)
+
+    def _event(self, delta, model, finish_reason=None):
+        event = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                 "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+        self._chunk(b"data: " + json.dumps(event, separators=(",", ":")).encode() + b"\n\n")
+
+    def _chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    """The mock server; start() runs it in a daemon thread, url is the API base URL."""
+
+    daemon_threads = True
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), MockHandler)
+        self.config = config or MockConfig()
+        self.requests = {"models": 0, "chat": 0}
+        self._count_lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/v1"
+
+    def count(self, kind):
+        with self._count_lock:
+            self.requests[kind] += 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token-rate", type=float, default=50.0)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--chunk-tokens", type=int, default=1)
+    parser.add_argument("--answer-tokens", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--drop-after-tokens", type=int, default=0)
+    parser.add_argument("--keepalive-every", type=int, default=0)
+    parser.add_argument("--response-delay", type=float, default=0.0)
+    args = parser.parse_args()
+    config = MockConfig(args.token_rate, args.first_token_delay, args.chunk_tokens, args.answer_tokens,
+                        args.error_rate, args.error_status, args.drop_after_tokens, args.keepalive_every,
+                        response_delay=args.response_delay)
+    server = MockOpenAIServer(config, args.host, args.port)
+    print(f"Mock OpenAI API at {server.url} (any API key), models: {', '.join(MODELS)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
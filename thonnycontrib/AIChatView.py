@@ -5,14 +5,36 @@ import thonny.shell # Import the shell module
 from tkinter import ttk, scrolledtext, messagebox, Menu
 import threading
 import queue
-import requests
 import json
 import logging
+import os
 import platform
 import re
+import time
 import locale # <-- Import locale module
+import math
+import importlib.util
 import tkinter.font as tk_font
 from thonny import get_workbench, get_shell # <-- Import get_shell
+from thonnycontrib.ai_chat.markdown_stream import StreamingMarkdownRenderer
+from thonnycontrib.ai_chat.highlight import (
+    TOKEN_TAGS as HIGHLIGHT_TAGS, HighlightCache, cache_key as highlight_cache_key, highlight as highlight_code,
+)
+from thonnycontrib.ai_chat.http_pool import SessionPool
+from thonnycontrib.ai_chat.payload import RequestBodyEncoder
+from thonnycontrib.ai_chat.model_cache import ModelCatalogCache, is_fresh
+from thonnycontrib.ai_chat.context_window import TOKENS_CACHE_KEY, estimate_tokens, select_context, to_api_messages
+from thonnycontrib.ai_chat.response_cache import ResponseCache, response_key
+from thonnycontrib.ai_chat.cancellation import CancelToken, set_read_timeout
+from thonnycontrib.ai_chat.latency import LatencyStats, RequestTimings, describe as describe_latency
+from thonnycontrib.ai_chat.scheduler import (
+    PRIORITY_EXPLAIN, PRIORITY_INTERACTIVE, QUEUED, ChatRequest, RequestScheduler)
+from thonnycontrib.ai_chat.compaction import (
+    build_summary_messages, history_key, plan_compaction, summary_message)
+from thonnycontrib.ai_chat.routing import Endpoint, Router, StreamRace, format_endpoints, parse_endpoints
+from thonnycontrib.ai_chat.governor import (
+    REASON_BUSY, RETRY_STATUSES, SLOT_POLL, RequestCancelled, RequestGovernor, parse_retry_after)
+# symbol_index, retrieval and chunking (ast, tokenize, mmap) are imported where they are first used
 
 # --- Constants ---
 PLUGIN_TITLE = "AI Chat Interface"
@@ -21,7 +43,62 @@ CONFIG_PREFIX = "plugin.ai_chat."
 CONFIG_API_URL = CONFIG_PREFIX + "api_url"
 CONFIG_API_KEY = CONFIG_PREFIX + "api_key"
 CONFIG_MODEL = CONFIG_PREFIX + "model"
-# CONFIG_HISTORY = CONFIG_PREFIX + "history" # History persistence not implemented
+CONFIG_MODELS_TTL = CONFIG_PREFIX + "models_cache_ttl_hours"
+DEFAULT_MODELS_TTL_HOURS = 24
+CONFIG_CONTEXT_BUDGETS = CONFIG_PREFIX + "context_budgets" # {model: max prompt tokens}
+DEFAULT_CONTEXT_BUDGET = 8000
+MIN_CONTEXT_BUDGET = 256
+CONFIG_COMPACTION_THRESHOLD = CONFIG_PREFIX + "compaction_threshold" # Tokens; 0 disables compaction
+DEFAULT_COMPACTION_THRESHOLD = 0
+CONFIG_HISTORY_PAGE_SIZE = CONFIG_PREFIX + "history_page_size" # Messages loaded at startup / per scroll page
+DEFAULT_HISTORY_PAGE_SIZE = 50
+MAX_RENDERED_MESSAGES = 150 # History messages kept in chat_display before far ones are evicted
+CODE_BLOCK_TAG_PREFIX = "codeblk_" # Per-block tag: codeblk_<message id>_<n>
+CONTEXT_MENU_MARK = "context_menu_click" # Where the chat context menu was opened
+STOPPED_MARKER = " [stopped]" # Shown after an answer the user stopped
+PLACEHOLDER_TEXT = "..." # Assistant message while waiting for the first token
+QUEUED_PLACEHOLDER_TEXT = "(queued)" # Assistant message while its request waits in the queue
+PROGRESS_PLACEHOLDER_TEXT = "... ({done} of {total} parts explained)" # While a large selection is explained in parts
+PROGRESS_PLACEHOLDER_RE = re.compile(r"\.\.\. \(\d+ of \d+ parts explained\)")
+WAITING_PLACEHOLDER_TEXT = "... (waiting{seconds}: {reason})" # While the request is paced or retried
+WAITING_PLACEHOLDER_RE = re.compile(r"\.\.\. \(waiting( \d+ s)?: [^\n]*\)")
+EXPLAIN_PART_PARALLELISM = 3 # Parts of a large selection explained at the same time
+CONFIG_DEFINITIONS_BUDGET = CONFIG_PREFIX + "definitions_budget" # Tokens of referenced definitions sent with explanations
+DEFAULT_DEFINITIONS_BUDGET = 0 # Opt-in: the definitions are sent to the API
+CONFIG_SNIPPET_BUDGET = CONFIG_PREFIX + "project_snippet_chars" # Characters of project snippets sent with questions
+DEFAULT_SNIPPET_BUDGET = 0 # Opt-in: the files are sent to the API
+SNIPPET_TOP_K = 4 # Best matching snippets considered per question
+MIN_SNIPPET_CHARS = 200 # A snippet is not cut shorter than this to fit the budget
+RETRIEVAL_REFRESH_DELAY_MS = 3000 # Saves within this time share one refresh of the retrieval index
+CONFIG_MAX_STREAMS = CONFIG_PREFIX + "max_concurrent_streams" # Answers streamed at the same time
+DEFAULT_MAX_STREAMS = 2
+MAX_STREAMS_LIMIT = 8
+CONFIG_COMPARE_MODELS = CONFIG_PREFIX + "compare_models" # Models last picked in the comparison window
+CONFIG_BACKUP_ENDPOINTS = CONFIG_PREFIX + "backup_endpoints" # [{"api_url", "api_key", "models"}] tried when the main one fails
+CONFIG_FIRST_BYTE_DEADLINE = CONFIG_PREFIX + "first_byte_deadline" # Seconds before giving up on an endpoint that sends nothing
+DEFAULT_FIRST_BYTE_DEADLINE = 10
+CONFIG_HEDGE_DELAY = CONFIG_PREFIX + "hedge_delay" # Seconds before a typed question is also sent to the next endpoint; 0 = off
+DEFAULT_HEDGE_DELAY = 0
+CONNECT_TIMEOUT = 10 # Seconds to open a connection
+STREAM_READ_TIMEOUT = 60 # Seconds of silence tolerated once an answer is streaming (or from the last endpoint)
+FAILOVER_STATUSES = {401, 403, 404, 408, 429} # Besides 5xx: errors another endpoint may not have
+CONFIG_REQUESTS_PER_MINUTE = CONFIG_PREFIX + "requests_per_minute" # Per API key; 0 = no client-side limit
+DEFAULT_REQUESTS_PER_MINUTE = 0
+CONFIG_ENDPOINT_STREAMS = CONFIG_PREFIX + "streams_per_endpoint" # Answers streaming from one endpoint; 0 = no cap
+DEFAULT_ENDPOINT_STREAMS = 4
+STREAM_FRAME_BUDGET = 0.008 # Seconds of queue draining per UI tick before yielding to Tk
+HIGHLIGHT_COLORS = {
+    "hl_keyword": "#0000c0",
+    "hl_builtin": "#900090",
+    "hl_string": "#008000",
+    "hl_comment": "#808080",
+    "hl_number": "#a05000",
+    "hl_definition": "#0060b0",
+    "hl_decorator": "#a05000",
+}
+UI_WAKEUP_EVENT = "<<AIChatWakeup>>" # Generated by worker threads when they queue work
+QUEUE_POLL_FALLBACK_MS = 250 # Safety-net poll while workers run (if wakeup events work)
+QUEUE_POLL_NO_EVENTS_MS = 20 # Poll interval while workers run when Tcl is not threaded
 
 # Configure basic logging
 logger = logging.getLogger(__name__)
@@ -34,6 +111,18 @@ _ai_chat_view_visible = False
 def is_macos():
     return platform.system() == "Darwin"
 
+def get_plugin_data_dir():
+    """Returns the plugin's data directory under the Thonny user directory, creating it if needed."""
+    path = os.path.join(thonny.THONNY_USER_DIR, "ai_chat")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def is_broad_directory(path):
+    """True for a filesystem root, the home directory or a directory above it: never indexed as a project."""
+    path = os.path.normcase(os.path.abspath(path))
+    home = os.path.normcase(os.path.abspath(os.path.expanduser("~")))
+    return os.path.dirname(path) == path or path == home or home.startswith(path.rstrip(os.sep) + os.sep)
+
 def get_system_language():
     """Attempts to get the system's language name."""
     try:
@@ -95,6 +184,7 @@ class SettingsDialog(tk.Toplevel):
         self.transient(master) # Keep dialog on top of master
         self.title(f"{PLUGIN_TITLE} - Settings")
         self.ai_view = ai_view_instance # Store reference to the main view instance
+        self.ai_view._ensure_started() # Model list (cached or fetched) for the dropdown
 
         # Make dialog modal (optional but recommended for settings)
         self.grab_set()
@@ -149,8 +239,65 @@ class SettingsDialog(tk.Toplevel):
             width=38
         )
         self.model_combo_dialog.grid(row=2, column=1, sticky="ew", padx=5, pady=2)
+        self.model_combo_dialog.bind("<<ComboboxSelected>>", self._on_dialog_model_selected)
         # Update the values from the main view's list
         self._update_dialog_model_list()
+        self._budget_model = self.ai_view.selected_model.get() # Model the budget field refers to
+
+        ttk.Label(settings_frame, text="Model list cache (hours):").grid(row=3, column=0, sticky="w", padx=5, pady=2)
+        ttl_spinbox = ttk.Spinbox(settings_frame, textvariable=self.ai_view.models_cache_ttl, from_=0, to=720, width=8)
+        ttl_spinbox.grid(row=3, column=1, sticky="w", padx=5, pady=2)
+
+        ttk.Label(settings_frame, text="Context budget (tokens):").grid(row=4, column=0, sticky="w", padx=5, pady=2)
+        budget_spinbox = ttk.Spinbox(settings_frame, textvariable=self.ai_view.context_budget,
+                                     from_=MIN_CONTEXT_BUDGET, to=1000000, increment=1000, width=8)
+        budget_spinbox.grid(row=4, column=1, sticky="w", padx=5, pady=2)
+
+        ttk.Label(settings_frame, text="Summarize history above (tokens, 0 = off):").grid(row=5, column=0, sticky="w", padx=5, pady=2)
+        compaction_spinbox = ttk.Spinbox(settings_frame, textvariable=self.ai_view.compaction_threshold,
+                                         from_=0, to=1000000, increment=1000, width=8)
+        compaction_spinbox.grid(row=5, column=1, sticky="w", padx=5, pady=2)
+
+        ttk.Label(settings_frame, text="Concurrent answers:").grid(row=6, column=0, sticky="w", padx=5, pady=2)
+        streams_spinbox = ttk.Spinbox(settings_frame, textvariable=self.ai_view.max_streams,
+                                      from_=1, to=MAX_STREAMS_LIMIT, width=8)
+        streams_spinbox.grid(row=6, column=1, sticky="w", padx=5, pady=2)
+
+        ttk.Label(settings_frame, text="Definitions sent with explanations (tokens, 0 = off):").grid(row=7, column=0, sticky="w", padx=5, pady=2)
+        definitions_spinbox = ttk.Spinbox(settings_frame, textvariable=self.ai_view.definitions_budget,
+                                          from_=0, to=100000, increment=500, width=8)
+        definitions_spinbox.grid(row=7, column=1, sticky="w", padx=5, pady=2)
+
+        ttk.Label(settings_frame, text="Project snippets sent with questions (characters, 0 = off):").grid(row=8, column=0, sticky="w", padx=5, pady=2)
+        snippets_spinbox = ttk.Spinbox(settings_frame, textvariable=self.ai_view.snippet_budget,
+                                       from_=0, to=100000, increment=1000, width=8)
+        snippets_spinbox.grid(row=8, column=1, sticky="w", padx=5, pady=2)
+
+        ttk.Label(settings_frame, text="Backup endpoints (one per line: URL KEY [MODEL or FROM=TO,...]):").grid(
+            row=9, column=0, columnspan=2, sticky="w", padx=5, pady=(6, 2))
+        self.endpoints_text = tk.Text(settings_frame, height=3, width=60, wrap="none")
+        self.endpoints_text.grid(row=10, column=0, columnspan=2, sticky="ew", padx=5, pady=2)
+        self.endpoints_text.insert("1.0", format_endpoints(self.ai_view.backup_endpoints))
+
+        ttk.Label(settings_frame, text="Try the next endpoint after no response for (s):").grid(row=11, column=0, sticky="w", padx=5, pady=2)
+        deadline_spinbox = ttk.Spinbox(settings_frame, textvariable=self.ai_view.first_byte_deadline,
+                                       from_=1, to=300, width=8)
+        deadline_spinbox.grid(row=11, column=1, sticky="w", padx=5, pady=2)
+
+        ttk.Label(settings_frame, text="Also ask the next endpoint after (s, 0 = off):").grid(row=12, column=0, sticky="w", padx=5, pady=2)
+        hedge_spinbox = ttk.Spinbox(settings_frame, textvariable=self.ai_view.hedge_delay,
+                                    from_=0, to=60, increment=0.5, width=8)
+        hedge_spinbox.grid(row=12, column=1, sticky="w", padx=5, pady=2)
+
+        ttk.Label(settings_frame, text="Requests per minute per API key (0 = no limit):").grid(row=13, column=0, sticky="w", padx=5, pady=2)
+        rate_spinbox = ttk.Spinbox(settings_frame, textvariable=self.ai_view.requests_per_minute,
+                                   from_=0, to=10000, increment=10, width=8)
+        rate_spinbox.grid(row=13, column=1, sticky="w", padx=5, pady=2)
+
+        ttk.Label(settings_frame, text="Answers streaming from one endpoint (0 = no limit):").grid(row=14, column=0, sticky="w", padx=5, pady=2)
+        endpoint_streams_spinbox = ttk.Spinbox(settings_frame, textvariable=self.ai_view.endpoint_streams,
+                                               from_=0, to=100, width=8)
+        endpoint_streams_spinbox.grid(row=14, column=1, sticky="w", padx=5, pady=2)
 
         # --- Buttons Frame ---
         # Recreate buttons here, commands will call methods on ai_view_instance
@@ -211,6 +358,12 @@ class SettingsDialog(tk.Toplevel):
         self.model_combo_dialog.config(state="readonly" if available_models else "disabled")
 
 
+    def _on_dialog_model_selected(self, event=None):
+        """Keeps the per-model context budget field in sync with the selected model."""
+        self.ai_view._remember_context_budget(self._budget_model)
+        self._budget_model = self.ai_view.selected_model.get()
+        self.ai_view._sync_context_budget_var()
+
     def _on_refresh_models(self):
         """Handles the Refresh Models button click."""
         logger.debug("SettingsDialog: Refresh models requested.")
@@ -262,8 +415,16 @@ class SettingsDialog(tk.Toplevel):
     def _on_save(self):
         """Handles the Save & Close button click."""
         logger.debug("SettingsDialog: Save requested.")
+        try:
+            self.ai_view.backup_endpoints = parse_endpoints(self.endpoints_text.get("1.0", "end-1c"))
+        except ValueError as e:
+            messagebox.showerror("Backup endpoints", str(e), parent=self)
+            return
         # Call the main view's save method to persist changes
         self.ai_view._save_settings()
+        # Definitions and project snippets are opt-in: index the open folders once they are turned on
+        self.ai_view._start_symbol_indexing()
+        self.ai_view._start_retrieval_indexing()
         self.destroy() # Close the dialog
 
     def _on_cancel(self):
@@ -273,6 +434,145 @@ class SettingsDialog(tk.Toplevel):
         self.ai_view._load_settings()
         self.destroy() # Close the dialog
 
+# --- Model Comparison Window ---
+class ComparisonPane(ttk.Frame):
+    """One column of the comparison window: a model's streamed answer and its timings."""
+
+    def __init__(self, master, window, message_id, model, api_url):
+        super().__init__(master, padding=(3, 0))
+        self.window = window
+        self.message_id = message_id
+        self.model = model
+        self.cancel_token = CancelToken()
+        self.renderer = StreamingMarkdownRenderer()
+        self.parts = []
+        self.started_at = time.perf_counter()
+        self.timings = RequestTimings(api_url, model)
+        self.timings.mark("queued", self.started_at)
+        self.first_token_at = None
+        self.done = False
+
+        header = ttk.Frame(self)
+        header.pack(fill="x")
+        ttk.Label(header, text=model, font="TkHeadingFont").pack(side="left")
+        self.keep_button = ttk.Button(header, text="Keep", width=6, state="disabled",
+                                      command=lambda: self.window._on_keep(self))
+        self.keep_button.pack(side="right")
+        self.timing_label = ttk.Label(self, text="Waiting for the first token...", foreground="gray")
+        self.timing_label.pack(fill="x")
+
+        self.text = scrolledtext.ScrolledText(self, wrap=tk.WORD, state="disabled", width=40, height=20,
+                                              bd=0, relief=tk.FLAT, padx=5, pady=5, font="TkDefaultFont")
+        self.text.pack(fill="both", expand=True)
+        bold_font = tk_font.Font(font="TkDefaultFont")
+        bold_font.configure(weight=tk_font.BOLD)
+        italic_font = tk_font.Font(font="TkDefaultFont")
+        italic_font.configure(slant=tk_font.ITALIC)
+        self.text.tag_configure("bold", font=bold_font)
+        self.text.tag_configure("italic", font=italic_font)
+        self.text.tag_configure("code_block", font="TkFixedFont", background="#f0f0f0",
+                                lmargin1=15, lmargin2=15, rmargin=15)
+        self.text.tag_configure("error_text", foreground="red")
+
+    def _insert(self, segments):
+        if not segments:
+            return
+        insert_args = []
+        for text, tags in segments:
+            insert_args += [text, tags]
+        self.text.config(state="normal")
+        self.text.insert("end", *insert_args)
+        self.text.config(state="disabled")
+        self.text.see("end")
+
+    def append(self, chunk):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            self.timings.mark("first_displayed", self.first_token_at)
+            self.timing_label.config(text=f"First token {self.first_token_at - self.started_at:.2f} s, streaming...")
+        self.parts.append(chunk)
+        self._insert(self.renderer.feed(chunk))
+
+    def finish(self):
+        self.done = True
+        self._insert(self.renderer.close())
+        total = time.perf_counter() - self.started_at
+        first = f"{self.first_token_at - self.started_at:.2f} s" if self.first_token_at else "-"
+        self.timing_label.config(text=f"First token {first}, total {total:.2f} s")
+        if self.parts:
+            self.keep_button.config(state="normal")
+
+    def show_waiting(self, text):
+        """Shows why the answer has not started (None: waiting for the first token again)."""
+        if self.first_token_at is None:
+            self.timing_label.config(text=text or "Waiting for the first token...")
+
+    def fail(self, error):
+        self.done = True
+        self._insert(self.renderer.close() + [(f"\n{error}", ("error_text",))])
+        self.timing_label.config(text=f"Failed after {time.perf_counter() - self.started_at:.2f} s")
+
+
+class ComparisonWindow(tk.Toplevel):
+    """Sends one prompt to several models at once and shows the answers side by side."""
+
+    def __init__(self, master, ai_view_instance, prompt):
+        super().__init__(master)
+        self.transient(master)
+        self.title(f"{PLUGIN_TITLE} - Compare Models")
+        self.geometry("1000x650")
+        self.ai_view = ai_view_instance
+        self.prompt = prompt
+        self.panes = {} # {message id: ComparisonPane}
+        self._build_ui()
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+
+    def _build_ui(self):
+        top_frame = ttk.Frame(self, padding=5)
+        top_frame.pack(fill="x")
+        ttk.Label(top_frame, text=f"Prompt: {_short_label(self.prompt, 80)}").grid(row=0, column=0, columnspan=2, sticky="w")
+
+        ttk.Label(top_frame, text="Models:").grid(row=1, column=0, sticky="nw", pady=(5, 0))
+        self.models_listbox = tk.Listbox(top_frame, selectmode=tk.MULTIPLE, height=5, exportselection=False)
+        self.models_listbox.grid(row=1, column=1, sticky="ew", pady=(5, 0))
+        top_frame.columnconfigure(1, weight=1)
+        models = list(self.ai_view.models) or [self.ai_view.selected_model.get()]
+        chosen = set(self.ai_view._get_compare_models())
+        for index, model in enumerate(models):
+            self.models_listbox.insert("end", model)
+            if model in chosen:
+                self.models_listbox.selection_set(index)
+
+        self.send_button = ttk.Button(top_frame, text="Send to Selected Models", command=self._on_send)
+        self.send_button.grid(row=1, column=2, sticky="n", padx=(5, 0), pady=(5, 0))
+
+        # One column per model
+        self.columns = ttk.PanedWindow(self, orient=tk.HORIZONTAL)
+        self.columns.pack(fill="both", expand=True, padx=5, pady=5)
+
+    def _on_send(self):
+        models = [self.models_listbox.get(index) for index in self.models_listbox.curselection()]
+        if not models:
+            messagebox.showwarning("Compare Models", "Select at least one model.", parent=self)
+            return
+        self.send_button.config(state="disabled")
+        self.models_listbox.config(state="disabled")
+        self.ai_view._start_comparison(self, models)
+
+    def add_pane(self, message_id, model, api_url):
+        pane = ComparisonPane(self.columns, self, message_id, model, api_url)
+        self.columns.add(pane, weight=1)
+        self.panes[message_id] = pane
+        return pane
+
+    def _on_keep(self, pane):
+        self.ai_view._keep_comparison_answer(self.prompt, pane.model, "".join(pane.parts))
+        self._on_close()
+
+    def _on_close(self):
+        self.ai_view._end_comparison(self)
+        self.destroy()
+
 # --- The AI Chat View class ---
 class AIChatView(ttk.Frame):
     """The main frame for the AI Chat interface."""
@@ -283,43 +583,246 @@ class AIChatView(ttk.Frame):
         self.api_url = tk.StringVar()
         self.api_key = tk.StringVar()
         self.selected_model = tk.StringVar()
+        self.models_cache_ttl = tk.StringVar() # Hours; kept as string so the Spinbox accepts any input
+        self.context_budget = tk.StringVar() # Token budget of the selected model
+        self.context_budgets = {} # {model: token budget}
+        self._context_dropped_count = 0 # History entries left out of the last request
+        self.compaction_threshold = tk.StringVar() # Tokens; 0 = compaction off
+        self.summary_cache = {} # {history_key of summarized prefix: summary text}
+        self._compaction = None # {"upto": n, "key": ..., "summary": ...} for chat_history[:n]
+        self._compaction_in_flight = False
+        self._compaction_token = None # CancelToken of the running compaction
+        self.history_store = None # Durable history (SQLite), opened after the UI is built
+        self._conversation_id = None
+        self._history_has_older = False # More messages in the store than in chat_history
+        self._paging_scheduled = False
+        self._window_start = 0 # chat_history[_window_start:_window_end] is rendered in chat_display
+        self._window_end = 0
+        self._message_counter = 0 # Source of unique display message ids
+        self._message_index = {} # {message id: {"entry": history entry or note, "code_tags": [...]}}
         self.models = []
         self.chat_history = [] # List of {"role": "user/assistant", "content": "..."}
         self.stream_queue = queue.Queue()
-        self.streaming_thread = None
-        self.current_assistant_message_id = None # To append stream chunks
-        self.system_language = get_system_language() # Store detected language
+        self.max_streams = tk.StringVar() # Concurrent answers; string so the Spinbox accepts any input
+        self.definitions_budget = tk.StringVar() # Tokens; 0 = no definitions attached to explanations
+        self.symbol_index = None # Definitions in the projects of the open files; created on start
+        self._indexed_roots = set() # Directories scanned (or being scanned) into symbol_index
+        self.snippet_budget = tk.StringVar() # Characters; 0 = no project snippets sent with questions
+        self.retrievers = {} # {project directory: ProjectRetriever}
+        self._retrieval_refresh_scheduled = False
+        self.scheduler = RequestScheduler() # Queued and running answers
+        self._streams = {} # {assistant message id: ChatRequest} for queued and running answers
+        self._comparison_panes = {} # {message id: ComparisonPane} streaming in a comparison window
+        self.http_pool = SessionPool() # Keep-alive connections shared by all workers
+        self.backup_endpoints = [] # routing.Endpoint list tried after (or instead of) the main API URL
+        self.first_byte_deadline = tk.StringVar() # Seconds; string so the Spinbox accepts any input
+        self.hedge_delay = tk.StringVar() # Seconds; 0 = typed questions are never sent twice
+        self.router = Router() # Health of the endpoints, orders them per request
+        self.requests_per_minute = tk.StringVar() # Per API key; 0 = no limit
+        self.endpoint_streams = tk.StringVar() # Answers streaming from one endpoint; 0 = no cap
+        self.governor = RequestGovernor() # Paces and retries the requests of all workers
+        self.request_encoder = RequestBodyEncoder() # Reuses the JSON of the history sent last time
+        self.model_cache = None # Created on start: the caches live in the plugin data directory
+        self._models_fetch_in_flight = False # Single-flight guard for model list refreshes
+        self.explain_cache = None
+        self.stream_frame_stats = {"frames": 0, "chunks": 0, "last_merged": 0, "max_merged": 0}
+        self.latency_stats = LatencyStats() # Rolling request timings per endpoint and model
+        self.highlight_cache = HighlightCache() # Token spans of complete code blocks, by content hash
+        self._highlight_blocks = {} # {code block tag: {"language", "checkpoint", "final"}}
+        self._highlight_dirty = {} # {code block tag: block is complete} waiting for the next batch
+        self._highlight_in_flight = False # A highlighting batch is running in a worker
+        self._highlight_scheduled = False
+        self._active_workers = 0 # Worker threads that may still post to stream_queue
+        self._queue_check_id = None # Pending after() id of _check_stream_queue, if any
+        self._ui_wakeup_pending = threading.Event() # Coalesces wakeups from worker threads
+        self._system_language = None # Detected on first use
+        self._started = False # Model list and history are loaded when the view is first shown
 
         self._load_settings()
         self._build_ui()
         self._configure_tags() # Use robust version
 
-        # Fetch models shortly after startup (non-blocking)
-        self.after(500, self._fetch_models_async)
+        # Workers wake the Tk thread via a virtual event; the queue is only
+        # polled (as a fallback) while a worker is running.
+        self._threaded_tcl = self._is_tcl_threaded()
+        self.bind(UI_WAKEUP_EVENT, self._on_ui_wakeup)
 
-        # Start checking the queue for streaming updates
-        self._check_stream_queue()
+        # Thonny also builds views that sit in a background tab; disk and
+        # network work waits until the view is actually shown
+        self.bind("<Map>", self._on_first_map, add="+")
+
+        logger.info(f"{VIEW_ID} initialized.")
 
-        logger.info(f"{VIEW_ID} initialized. Detected system language: {self.system_language}")
+    def _on_first_map(self, event=None):
+        self._ensure_started()
+
+    def _ensure_started(self):
+        """Loads the model list and the last conversation, once. Called on first show or first use."""
+        if self._started:
+            return
+        self._started = True
+        from thonnycontrib.ai_chat.symbol_index import SymbolIndex
+        data_dir = get_plugin_data_dir()
+        self.model_cache = ModelCatalogCache(os.path.join(data_dir, "models_cache.json"))
+        self.explain_cache = ResponseCache(os.path.join(data_dir, "explain_cache"))
+        self.symbol_index = SymbolIndex()
+        # Show cached models right away; refresh in the background only if stale
+        self._load_cached_models()
+        # Restore the last conversation once the view is on screen
+        self.after_idle(self._load_persisted_history)
+        # Index the definitions around the open files; saved files are reindexed one by one
+        self.workbench.bind("Save", self._on_editor_saved, True)
+        self._start_symbol_indexing()
+        self._start_retrieval_indexing()
+        logger.debug(f"{VIEW_ID} started. Detected system language: {self.system_language}")
+
+    @property
+    def system_language(self):
+        """The system's language name, detected on first use."""
+        if self._system_language is None:
+            self._system_language = get_system_language()
+        return self._system_language
 
     def _load_settings(self):
         """Load settings from Thonny's configuration."""
         self.api_url.set(self.workbench.get_option(CONFIG_API_URL, "https://api.openai.com/v1"))
         self.api_key.set(self.workbench.get_option(CONFIG_API_KEY, ""))
         self.selected_model.set(self.workbench.get_option(CONFIG_MODEL, ""))
+        self.models_cache_ttl.set(str(self.workbench.get_option(CONFIG_MODELS_TTL, DEFAULT_MODELS_TTL_HOURS)))
+        self.context_budgets = dict(self.workbench.get_option(CONFIG_CONTEXT_BUDGETS, {}) or {})
+        self.compaction_threshold.set(str(self.workbench.get_option(CONFIG_COMPACTION_THRESHOLD, DEFAULT_COMPACTION_THRESHOLD)))
+        self.max_streams.set(str(self.workbench.get_option(CONFIG_MAX_STREAMS, DEFAULT_MAX_STREAMS)))
+        self.definitions_budget.set(str(self.workbench.get_option(CONFIG_DEFINITIONS_BUDGET, DEFAULT_DEFINITIONS_BUDGET)))
+        self.snippet_budget.set(str(self.workbench.get_option(CONFIG_SNIPPET_BUDGET, DEFAULT_SNIPPET_BUDGET)))
+        self.backup_endpoints = [Endpoint.from_config(data)
+                                 for data in self.workbench.get_option(CONFIG_BACKUP_ENDPOINTS, []) or []]
+        self.first_byte_deadline.set(str(self.workbench.get_option(CONFIG_FIRST_BYTE_DEADLINE, DEFAULT_FIRST_BYTE_DEADLINE)))
+        self.hedge_delay.set(str(self.workbench.get_option(CONFIG_HEDGE_DELAY, DEFAULT_HEDGE_DELAY)))
+        self.requests_per_minute.set(str(self.workbench.get_option(CONFIG_REQUESTS_PER_MINUTE, DEFAULT_REQUESTS_PER_MINUTE)))
+        self.endpoint_streams.set(str(self.workbench.get_option(CONFIG_ENDPOINT_STREAMS, DEFAULT_ENDPOINT_STREAMS)))
+        self.scheduler.max_concurrent = self._get_max_streams()
+        self.governor.configure(self._get_requests_per_minute(), self._get_endpoint_streams())
+        self.http_pool.configure(self._get_pool_size())
+        self._sync_context_budget_var()
         logger.debug(f"Settings loaded. Last selected model: '{self.selected_model.get()}'")
 
     def _save_settings(self):
         """Save settings to Thonny's configuration."""
         try:
+            old_endpoint = (self.workbench.get_option(CONFIG_API_URL, ""), self.workbench.get_option(CONFIG_API_KEY, ""))
+            new_endpoint = (self.api_url.get().strip(), self.api_key.get().strip())
+            if old_endpoint != new_endpoint:
+                # Drop connections to the old endpoint; the next request opens a fresh session
+                self.http_pool.reset()
             self.workbench.set_option(CONFIG_API_URL, self.api_url.get().strip())
             self.workbench.set_option(CONFIG_API_KEY, self.api_key.get().strip())
             self.workbench.set_option(CONFIG_MODEL, self.selected_model.get())
+            self.workbench.set_option(CONFIG_MODELS_TTL, self._get_models_cache_ttl_seconds() / 3600)
+            self._remember_context_budget(self.selected_model.get())
+            self.workbench.set_option(CONFIG_CONTEXT_BUDGETS, dict(self.context_budgets))
+            self.workbench.set_option(CONFIG_COMPACTION_THRESHOLD, self._get_compaction_threshold())
+            self.workbench.set_option(CONFIG_MAX_STREAMS, self._get_max_streams())
+            self.workbench.set_option(CONFIG_DEFINITIONS_BUDGET, self._get_definitions_budget())
+            self.workbench.set_option(CONFIG_SNIPPET_BUDGET, self._get_snippet_budget())
+            self.workbench.set_option(CONFIG_BACKUP_ENDPOINTS, [endpoint.to_config() for endpoint in self.backup_endpoints])
+            self.workbench.set_option(CONFIG_FIRST_BYTE_DEADLINE, self._get_first_byte_deadline())
+            self.workbench.set_option(CONFIG_HEDGE_DELAY, self._get_hedge_delay())
+            self.workbench.set_option(CONFIG_REQUESTS_PER_MINUTE, self._get_requests_per_minute())
+            self.workbench.set_option(CONFIG_ENDPOINT_STREAMS, self._get_endpoint_streams())
+            self.scheduler.max_concurrent = self._get_max_streams()
+            self.governor.configure(self._get_requests_per_minute(), self._get_endpoint_streams())
+            self.http_pool.configure(self._get_pool_size())
             logger.debug(f"Settings saved. API URL: '{self.api_url.get()}', Model: '{self.selected_model.get()}'")
         except Exception as e:
             logger.error(f"Failed to save settings: {e}", exc_info=True)
             messagebox.showerror("Error", f"Could not save settings:\n{e}")
 
+    def _get_context_budget(self):
+        """Returns the context budget (tokens) entered for the selected model."""
+        try:
+            return max(MIN_CONTEXT_BUDGET, int(float(self.context_budget.get())))
+        except (ValueError, tk.TclError):
+            return DEFAULT_CONTEXT_BUDGET
+
+    def _get_compaction_threshold(self):
+        """Returns the history size (tokens) above which old turns get summarized; 0 = off."""
+        try:
+            return max(0, int(float(self.compaction_threshold.get())))
+        except (ValueError, tk.TclError):
+            return DEFAULT_COMPACTION_THRESHOLD
+
+    def _get_max_streams(self):
+        """Returns how many answers may stream at the same time."""
+        try:
+            return min(MAX_STREAMS_LIMIT, max(1, int(float(self.max_streams.get()))))
+        except (ValueError, tk.TclError):
+            return DEFAULT_MAX_STREAMS
+
+    def _get_definitions_budget(self):
+        """Returns the tokens of referenced definitions attached to an explanation; 0 = off."""
+        try:
+            return max(0, int(float(self.definitions_budget.get())))
+        except (ValueError, tk.TclError):
+            return DEFAULT_DEFINITIONS_BUDGET
+
+    def _get_snippet_budget(self):
+        """Returns the characters of project snippets sent with a question; 0 = off."""
+        try:
+            return max(0, int(float(self.snippet_budget.get())))
+        except (ValueError, tk.TclError):
+            return DEFAULT_SNIPPET_BUDGET
+
+    def _get_first_byte_deadline(self):
+        """Returns the seconds to wait for an endpoint's first byte before trying the next one."""
+        try:
+            return max(1.0, float(self.first_byte_deadline.get()))
+        except (ValueError, tk.TclError):
+            return float(DEFAULT_FIRST_BYTE_DEADLINE)
+
+    def _get_hedge_delay(self):
+        """Returns the seconds after which a typed question is also sent to the next endpoint; 0 = off."""
+        try:
+            return max(0.0, float(self.hedge_delay.get()))
+        except (ValueError, tk.TclError):
+            return float(DEFAULT_HEDGE_DELAY)
+
+    def _get_requests_per_minute(self):
+        """Returns the requests per minute allowed per API key; 0 = no limit."""
+        try:
+            return max(0, int(float(self.requests_per_minute.get())))
+        except (ValueError, tk.TclError):
+            return DEFAULT_REQUESTS_PER_MINUTE
+
+    def _get_endpoint_streams(self):
+        """Returns how many answers may stream from one endpoint at a time; 0 = no cap."""
+        try:
+            return max(0, int(float(self.endpoint_streams.get())))
+        except (ValueError, tk.TclError):
+            return DEFAULT_ENDPOINT_STREAMS
+
+    def _get_pool_size(self):
+        """Connections kept open per endpoint: all the answers it may stream at once, plus parts of an
+        explanation, a compaction and a model list refresh."""
+        # Without a per-endpoint cap, comparison columns stream next to the chat answers
+        streams = self._get_endpoint_streams() or self._get_max_streams() + MAX_STREAMS_LIMIT
+        return streams + EXPLAIN_PART_PARALLELISM + 2
+
+    def _chat_endpoints(self, api_url, api_key):
+        """The endpoints to try for a request to api_url, best first."""
+        primary = Endpoint(api_url, api_key)
+        endpoints = [primary] + [endpoint for endpoint in self.backup_endpoints if endpoint.api_url != primary.api_url]
+        return self.router.ranked(endpoints)
+
+    def _sync_context_budget_var(self):
+        """Loads the selected model's budget into the context_budget variable."""
+        budget = self.context_budgets.get(self.selected_model.get(), DEFAULT_CONTEXT_BUDGET)
+        self.context_budget.set(str(budget))
+
+    def _remember_context_budget(self, model):
+        """Stores the current context_budget value for model (in memory)."""
+        if model:
+            self.context_budgets[model] = self._get_context_budget()
+
     def _build_ui(self):
         """Construct the UI elements (REMOVING settings frame)."""
         self.columnconfigure(0, weight=1)
@@ -342,6 +845,8 @@ class AIChatView(ttk.Frame):
             chat_frame, wrap=tk.WORD, state="disabled", bd=0, relief=tk.FLAT, padx=5, pady=5, font="TkDefaultFont"
         )
         self.chat_display.grid(row=0, column=0, sticky="nsew")
+        # Watch scrolling to page in older history when the top is reached
+        self.chat_display.configure(yscrollcommand=self._on_chat_yscroll)
 
         # --- Input Frame ---
         input_frame = ttk.Frame(self, padding=(5, 5))
@@ -360,6 +865,13 @@ class AIChatView(ttk.Frame):
             self.user_input.bind("<Control-Return>", self._on_send_message)
         self.user_input.bind("<Shift-Return>", self._on_send_message)
 
+        # Answers in flight and waiting in the queue
+        self.queue_status = ttk.Label(input_frame, text="", foreground="gray")
+        self.queue_status.grid(row=1, column=0, columnspan=2, sticky="w")
+        # Timings of the last answer (connect, first token, tokens/s, ...)
+        self.latency_status = ttk.Label(input_frame, text="", foreground="gray")
+        self.latency_status.grid(row=2, column=0, columnspan=2, sticky="w")
+
         # --- Button Frame within Input Frame ---
         button_subframe = ttk.Frame(input_frame)
         # Place it next to the text input (column 1) or below (row 1)?
@@ -386,6 +898,25 @@ class AIChatView(ttk.Frame):
             # Consider making Send button the default? (Requires different handling)
         )
         send_button.pack(side="top", fill="x")
+
+        compare_button = ttk.Button(
+            button_subframe,
+            text="Compare",
+            command=self._open_comparison, # Same question to several models, side by side
+            width=8,
+        )
+        compare_button.pack(side="top", pady=(5, 0), fill="x")
+
+        self.stop_button = ttk.Button(
+            button_subframe,
+            text="Stop",
+            command=self._stop_streaming,
+            width=8,
+            state="disabled", # Enabled while an answer is streaming
+        )
+        self.stop_button.pack(side="top", pady=(5, 0), fill="x")
+        self.user_input.bind("<Escape>", self._stop_streaming)
+        self.chat_display.bind("<Escape>", self._stop_streaming)
         
         # --- ADD THIS SECTION BACK ---
         # --- Context Menu for Chat Display ---
@@ -395,6 +926,9 @@ class AIChatView(ttk.Frame):
             self.context_menu.add_command(label="Copy Code Block", command=self._copy_code_block)
             self.context_menu.add_command(label="Copy Message (Markdown)", command=lambda: self._copy_message(format="markdown"))
             self.context_menu.add_command(label="Copy Message (Text)", command=lambda: self._copy_message(format="text"))
+            self.context_menu.add_separator()
+            self.context_menu.add_command(label="Refresh Cached Answer", command=self._refresh_cached_answer)
+            self.context_menu.add_command(label="Stop This Answer", command=self._stop_answer_at_click)
 
             # Bind right-click events directly to chat_display
             if is_macos():
@@ -457,6 +991,8 @@ class AIChatView(ttk.Frame):
             self.chat_display.tag_configure("user_role", font=effective_bold_font, foreground="blue")
             self.chat_display.tag_configure("assistant_role", font=effective_bold_font, foreground="green")
             self.chat_display.tag_configure("error_role", font=effective_bold_font, foreground="red")
+            self.chat_display.tag_configure("info_role", font=effective_italic_font, foreground="gray")
+            self.chat_display.tag_configure("marker_label", font=effective_italic_font, foreground="gray")
 
             # Code blocks
             code_font_family = "Courier New" if not is_macos() else "Monaco"
@@ -481,209 +1017,591 @@ class AIChatView(ttk.Frame):
 
             # Tag to store the raw code content for easy copying
             self.chat_display.tag_configure("code_content")
+            # Syntax highlighting inside code blocks (see _apply_highlighting)
+            for tag in HIGHLIGHT_TAGS:
+                self.chat_display.tag_configure(tag, foreground=HIGHLIGHT_COLORS[tag])
             self.chat_display.tag_raise("sel")
             logger.info("Text tags configured successfully.")
 
         except Exception as e_config:
              logger.error(f"Unexpected error during tag configuration: {e_config}", exc_info=True)
 
-    def _apply_markdown_tags(self, text_content, start_index):
-        """Apply basic markdown formatting tags to the text widget. Operates from start_index."""
-        logger.debug(f"Applying markdown tags starting from index {start_index}")
-        patterns = {
-            r"(?s)```(?:[a-zA-Z]*)?\n(.*?)\n```": "code_block",
-            r"\*\*(.*?)\*\*": "bold",
-            r"(?<!\*)\*(?!\*|_)(.*?)(?<!\*)\*(?!\*|_)": "italic",
-            r"(?<!_)_(?!_|\*)(.*?)(?<!_)_(?!_|\*)": "italic",
-        }
-
-        # Operate only on the newly added text range
-        try:
-            end_index = self.chat_display.index("end-1c")
-            if self.chat_display.compare(start_index, ">=", end_index):
-                 logger.debug("Start index is at or after end, skipping markdown.")
-                 return # Nothing to format
-
-            # Find the earliest match within the range [start_index, end_index)
-            current_pos = start_index
-            while self.chat_display.compare(current_pos, "<", end_index):
-                first_match_info = None # Store (tag, start_idx, end_idx, content_to_format)
-
-                search_start_index = self.chat_display.index(current_pos)
-                text_to_search = self.chat_display.get(search_start_index, end_index)
-
-                for pattern, tag in patterns.items():
-                    match = re.search(pattern, text_to_search)
-                    if match:
-                        match_start_abs = self.chat_display.index(f"{search_start_index}+{match.start()}c")
-                        match_end_abs = self.chat_display.index(f"{search_start_index}+{match.end()}c")
-                        content = match.group(1) if len(match.groups()) > 0 else match.group(0)
-
-                        if first_match_info is None or self.chat_display.compare(match_start_abs, "<", first_match_info[1]):
-                            first_match_info = (tag, match_start_abs, match_end_abs, content)
-
-                if first_match_info is None:
-                    break # No more matches in the remaining text
-
-                tag_to_apply, start_idx, end_idx, content_to_format = first_match_info
-                logger.debug(f"Found markdown: tag='{tag_to_apply}', range=({start_idx}, {end_idx})")
-
-                self.chat_display.config(state="normal")
-                self.chat_display.delete(start_idx, end_idx)
-
-                if tag_to_apply == "code_block":
-                    self.chat_display.insert(start_idx, "\n")
-                    code_start_idx = self.chat_display.index(f"{start_idx}+1c")
-                    self.chat_display.insert(code_start_idx, content_to_format)
-                    code_end_idx = self.chat_display.index(f"{code_start_idx}+{len(content_to_format)}c")
-                    self.chat_display.insert(code_end_idx, "\n")
-                    block_end_idx = self.chat_display.index(f"{code_end_idx}+1c")
-                    self.chat_display.tag_add(tag_to_apply, code_start_idx, block_end_idx)
-                    self.chat_display.tag_add("code_content", code_start_idx, code_end_idx)
-                    current_pos_update_idx = block_end_idx
-                    # Adjust end_index due to added newlines
-                    end_index = self.chat_display.index("end-1c")
-
-                elif tag_to_apply in ["bold", "italic"]:
-                    self.chat_display.insert(start_idx, content_to_format)
-                    tag_end_idx = self.chat_display.index(f"{start_idx}+{len(content_to_format)}c")
-                    self.chat_display.tag_add(tag_to_apply, start_idx, tag_end_idx)
-                    current_pos_update_idx = tag_end_idx
-                else:
-                    self.chat_display.insert(start_idx, content_to_format)
-                    current_pos_update_idx = self.chat_display.index(f"{start_idx}+{len(content_to_format)}c")
-
-                self.chat_display.config(state="disabled")
-                current_pos = current_pos_update_idx
-                # Ensure end_index is updated if insertions/deletions change it
-                end_index = self.chat_display.index("end-1c")
-            logger.debug("Finished applying markdown tags.")
-
-        except Exception as e:
-            logger.error(f"Error applying markdown tags: {e}", exc_info=True)
-            # Ensure state is disabled even if error occurs
-            if self.chat_display.cget('state') == tk.NORMAL:
-                 self.chat_display.config(state="disabled")
-
-
-    def _add_message_to_display(self, role, content, message_id=None):
-        """Adds a formatted message to the chat display."""
-        self.chat_display.config(state="normal")
-        start_index_msg = self.chat_display.index("end-1c")
+    def _insert_markdown_segments(self, index, segments, extra_tags=()):
+        """Inserts rendered (text, tags) segments at index with a single Text.insert call."""
+        if not segments:
+            return
+        insert_args = []
+        for text, tags in segments:
+            insert_args.append(text)
+            insert_args.append(tags + extra_tags)
+        self.chat_display.insert(index, *insert_args)
 
-        if start_index_msg != "1.0":
-            self.chat_display.insert("end", "\n\n")
-            start_index_msg = self.chat_display.index("end-1c") # Recalculate after newlines
+    def _add_message_to_display(self, role, content, message_id=None, marker=None, before=None):
+        """Adds a formatted message to the chat display.
 
+        It goes at the end, or just above the displayed message with id
+        before (a note about a question whose answer may be streaming below it).
+        """
         role_text = f"{role.capitalize()}: "
         role_tag_id = f"msg_{message_id}_role" if message_id else ""
-        self.chat_display.insert("end", role_text, (f"{role}_role", "role_label", role_tag_id))
-        content_start_index = self.chat_display.index("end")
+        msg_tags = (f"msg_{message_id}", "message_block") if message_id else ()
+        insert_args = [role_text, (f"{role}_role", "role_label", role_tag_id) + msg_tags]
+        if marker:
+            # Part of the role label, so copying the message leaves it out
+            insert_args += [f"[{marker}] ", ("marker_label", role_tag_id) + msg_tags]
 
-        self.chat_display.insert("end", content)
-        content_end_index = self.chat_display.index("end-1c") # Before potential final newline
-
-        # Apply markdown only to the newly added content
-        self._apply_markdown_tags(content, content_start_index)
-
-        # Adjust end index in case markdown changed content length
-        final_end_index = self.chat_display.index("end-1c")
+        # Render markdown once and insert the formatted content in one go
+        renderer = StreamingMarkdownRenderer(f"{CODE_BLOCK_TAG_PREFIX}{message_id}_" if message_id else None)
+        for text, tags in renderer.render(content):
+            insert_args += [text, tags + msg_tags]
 
+        self.chat_display.config(state="normal")
+        before_ranges = self.chat_display.tag_ranges(f"msg_{before}") if before else ()
+        if before_ranges:
+            start_index_msg = self.chat_display.index(before_ranges[0])
+            self.chat_display.insert(start_index_msg, *insert_args, "\n\n", ())
+        else:
+            start_index_msg = self.chat_display.index("end-1c")
+            if start_index_msg != "1.0":
+                self.chat_display.insert("end", "\n\n")
+                start_index_msg = self.chat_display.index("end-1c") # Recalculate after newlines
+            self.chat_display.insert("end", *insert_args)
         if message_id:
-             msg_tag = f"msg_{message_id}"
-             self.chat_display.tag_add(msg_tag, start_index_msg, final_end_index)
-             self.chat_display.tag_add("message_block", start_index_msg, final_end_index)
+            # History entries are registered by _append_history; notes keep their own content
+            note = {"role": role, "content": content} if role not in ("user", "assistant") else None
+            self._register_message(message_id, note, renderer.block_tags, renderer.block_languages)
 
         self.chat_display.config(state="disabled")
-        self.chat_display.see("end")
+        if not before_ranges:
+            self.chat_display.see("end")
         return start_index_msg
 
-    def _append_stream_chunk(self, chunk):
-        """Appends a chunk of text from the stream to the current assistant message."""
-        if not self.current_assistant_message_id:
-            logger.warning("Received stream chunk but no current assistant message ID.")
-            return
-
-        msg_tag = f"msg_{self.current_assistant_message_id}"
+    def _append_stream_chunk(self, request, chunk):
+        """Appends a chunk of streamed text to the request's assistant message."""
+        msg_tag = f"msg_{request.message_id}"
         ranges = self.chat_display.tag_ranges(msg_tag)
         if not ranges:
-            # Possible if placeholder was cleared aggressively. Try adding the message again.
-            logger.warning(f"Cannot find message range for tag {msg_tag}. Re-adding assistant placeholder.")
-            # Find last known history message to get content? Or just use chunk?
-            # Let's assume the placeholder logic handles this - if it fails, something else is wrong.
-            # For now, log and return might be safer than adding partial content.
+            # Possible if placeholder was cleared aggressively.
+            # Log and return is safer than adding partial content.
+            logger.warning(f"Cannot find message range for tag {msg_tag}. Dropping stream chunk.")
             return
 
-        insert_pos = ranges[1] # Append at the current end of the message block
+        request.parts.append(chunk)
+        if request.renderer is None:
+            request.renderer = StreamingMarkdownRenderer(f"{CODE_BLOCK_TAG_PREFIX}{request.message_id}_")
+        segments = request.renderer.feed(chunk)
+        if not segments:
+            return # Renderer is holding back a possible markdown marker
 
+        # Inserted text carries the message tags itself, so no tag remove/add is needed
         self.chat_display.config(state="normal")
-        self.chat_display.insert(insert_pos, chunk)
-        new_end_pos = self.chat_display.index(f"{insert_pos}+{len(chunk)}c")
-
-        # Extend tags to cover the new content
-        self.chat_display.tag_remove(msg_tag, ranges[0], ranges[1])
-        self.chat_display.tag_add(msg_tag, ranges[0], new_end_pos)
-        self.chat_display.tag_remove("message_block", ranges[0], ranges[1])
-        self.chat_display.tag_add("message_block", ranges[0], new_end_pos)
-
-        # Skip dynamic markdown during streaming for performance/simplicity
+        self._insert_markdown_segments(ranges[1], segments, (msg_tag, "message_block"))
         self.chat_display.config(state="disabled")
         self.chat_display.see("end")
-
-    def _finalize_assistant_message(self):
-        """Called after streaming is complete to apply final formatting."""
-        if not self.current_assistant_message_id: return
-        logger.debug(f"Finalizing assistant message: {self.current_assistant_message_id}")
-
-        msg_tag = f"msg_{self.current_assistant_message_id}"
+        request.timings.mark("first_displayed")
+
+        renderer = request.renderer
+        if renderer.block_tags:
+            # Blocks that ended are highlighted as a whole; the open one as far as its lines are complete
+            closed = len(renderer.block_tags) - (1 if renderer.in_code_block else 0)
+            for block_tag in renderer.block_tags[request.closed_code_blocks:closed]:
+                self._queue_highlight(block_tag, renderer.block_languages[block_tag], final=True)
+            request.closed_code_blocks = closed
+            if renderer.in_code_block:
+                block_tag = renderer.block_tags[-1]
+                self._queue_highlight(block_tag, renderer.block_languages[block_tag], final=False)
+
+    def _flush_stream_renderer(self, request):
+        """Writes out any text the request's streaming renderer is still holding back."""
+        renderer = request.renderer
+        request.renderer = None
+        if renderer is None:
+            return
+        msg_tag = f"msg_{request.message_id}"
         ranges = self.chat_display.tag_ranges(msg_tag)
         if not ranges:
-            logger.warning(f"Cannot find ranges for {msg_tag} during finalization.")
-            self.current_assistant_message_id = None
             return
+        self.chat_display.config(state="normal")
+        self._insert_markdown_segments(ranges[1], renderer.close(), (msg_tag, "message_block"))
+        self.chat_display.config(state="disabled")
+        self._register_message(request.message_id, code_tags=renderer.block_tags, languages=renderer.block_languages)
 
-        # Find content start index (after role label)
-        role_tag = f"msg_{self.current_assistant_message_id}_role"
-        role_ranges = self.chat_display.tag_ranges(role_tag)
-        content_start_index = role_ranges[1] if role_ranges else ranges[0]
-
-        # Get the complete content for this message
-        full_content = self.chat_display.get(content_start_index, ranges[1])
-
-        # Apply markdown to the entire completed message content
-        self._apply_markdown_tags(full_content, content_start_index)
-
-        # Find the *new* end index after markdown might have changed things
-        final_end_index = self.chat_display.index("end-1c")
-        # Re-apply the message tags to the potentially adjusted final range
-        # This seems problematic if other messages were added after. Let's trust initial range end.
-        # self.chat_display.tag_remove(msg_tag, ranges[0], ranges[1])
-        # self.chat_display.tag_add(msg_tag, ranges[0], final_end_index)
-        # self.chat_display.tag_remove("message_block", ranges[0], ranges[1])
-        # self.chat_display.tag_add("message_block", ranges[0], final_end_index)
-
-
-        self.current_assistant_message_id = None # Reset for next message
+    def _finalize_assistant_message(self, request):
+        """Called after streaming is complete. Formatting was already applied while streaming."""
+        logger.debug(f"Finalizing assistant message: {request.message_id}")
+        self._flush_stream_renderer(request)
+        self.chat_display.see("end")
         logger.debug("Assistant message finalized.")
 
     def _add_error_message(self, error_text):
          """Displays an error message in the chat history."""
-         self._add_message_to_display("error", str(error_text), message_id=f"error_{len(self.chat_history)}")
+         self._add_message_to_display("error", str(error_text), message_id=self._new_message_id("error"))
 
     def _clear_chat_history(self):
          """Clears the chat display and the internal history."""
          if messagebox.askyesno("Confirm Clear", "Are you sure you want to clear the entire chat history?"):
+             self._cancel_all_requests(note=False)
              self.chat_history.clear()
+             self._context_dropped_count = 0
+             self._compaction = None
+             self.request_encoder.clear() # Nothing of the old conversation will be sent again
+             if self.history_store:
+                 try:
+                     self.history_store.delete_conversation(self._conversation_id)
+                     self._conversation_id = self.history_store.new_conversation()
+                 except Exception as e:
+                     logger.error(f"Could not clear stored chat history: {e}", exc_info=True)
+             self._history_has_older = False
+             self._window_start = self._window_end = 0
+             self._forget_all_messages()
              self.chat_display.config(state="normal")
              self.chat_display.delete("1.0", "end")
              self.chat_display.config(state="disabled")
              logger.info("Chat history cleared.")
 
+    # --- Persistent history and virtualized transcript ---
+    # chat_display only holds chat_history[_window_start:_window_end] (plus transient
+    # info/error notes). Messages far from the viewport are evicted and re-rendered
+    # from chat_history (or the history store) when the user scrolls back to them.
+    def _get_history_page_size(self):
+        try:
+            return max(1, int(self.workbench.get_option(CONFIG_HISTORY_PAGE_SIZE, DEFAULT_HISTORY_PAGE_SIZE)))
+        except (TypeError, ValueError):
+            return DEFAULT_HISTORY_PAGE_SIZE
+
+    def _new_message_id(self, role):
+        """Returns a unique display id such as 'user_12' for a new message."""
+        self._message_counter += 1
+        prefix = "asst" if role == "assistant" else role
+        return f"{prefix}_{self._message_counter}"
+
+    def _message_id_for(self, entry):
+        """Returns the display id of a history entry, assigning one on first render."""
+        msg_id = entry.get("_msg_id")
+        if msg_id is None:
+            msg_id = entry["_msg_id"] = self._new_message_id(entry["role"])
+        return msg_id
+
+    def _load_persisted_history(self):
+        """Opens the history store and shows the newest messages of the last conversation."""
+        from thonnycontrib.ai_chat.history_store import ChatHistoryStore # sqlite3 only when needed
+
+        try:
+            self.history_store = ChatHistoryStore(os.path.join(get_plugin_data_dir(), "history.sqlite3"))
+            self._conversation_id = self.history_store.latest_conversation()
+            entries = self.history_store.load_page(self._conversation_id, limit=self._get_history_page_size())
+            self._history_has_older = bool(entries) and self.history_store.has_older(
+                self._conversation_id, entries[0]["_db_id"])
+        except Exception as e:
+            logger.error(f"Could not open chat history store, history will not be saved: {e}", exc_info=True)
+            self.history_store = None
+            return
+
+        if entries:
+            self.chat_history[:0] = entries
+            self._window_end += len(entries)
+            self._render_history_range(0, len(entries), at_top=True)
+            self.chat_display.see("end")
+        logger.info(f"Restored {len(entries)} messages from the chat history store.")
+
+    def _append_history(self, role, content, message_id=None, pending=False):
+        """Appends a message to chat_history and the durable store.
+
+        A pending entry reserves the place of an answer that is queued or
+        streaming; it is filled in by _complete_history_entry (or removed).
+        """
+        entry = {"role": role, "content": content}
+        if message_id:
+            entry["_msg_id"] = message_id
+        if pending:
+            entry["_pending"] = True
+        if self.history_store:
+            try:
+                entry["_db_id"] = self.history_store.append(self._conversation_id, role, content)
+            except Exception as e:
+                logger.error(f"Could not save message to history store: {e}", exc_info=True)
+        at_latest = self._window_end == len(self.chat_history)
+        self.chat_history.append(entry)
+        if message_id:
+            self._register_message(message_id, entry)
+        if at_latest:
+            # The message is (or is about to be) shown at the bottom of the window
+            self._window_end = len(self.chat_history)
+            self._evict_far_messages(from_top=True)
+        return entry
+
+    def _complete_history_entry(self, entry, content):
+        """Fills in a pending entry once its answer is known."""
+        entry["content"] = content
+        entry.pop("_pending", None)
+        entry.pop(TOKENS_CACHE_KEY, None) # Estimated while empty
+        if self.history_store and "_db_id" in entry:
+            try:
+                self.history_store.update(entry["_db_id"], content)
+            except Exception as e:
+                logger.error(f"Could not save message to history store: {e}", exc_info=True)
+
+    def _history_index(self, entry):
+        """Index of entry in chat_history (searched from the newest end), or -1."""
+        for index in range(len(self.chat_history) - 1, -1, -1):
+            if self.chat_history[index] is entry:
+                return index
+        return -1
+
+    def _remove_history_entry(self, entry):
+        """Removes a (pending) entry from chat_history and the store."""
+        index = self._history_index(entry)
+        if index >= 0:
+            del self.chat_history[index]
+            if index < self._window_start:
+                self._window_start -= 1
+            if index < self._window_end:
+                self._window_end -= 1
+        if self.history_store and "_db_id" in entry:
+            try:
+                self.history_store.delete_message(entry["_db_id"])
+            except Exception as e:
+                logger.error(f"Could not delete message from history store: {e}", exc_info=True)
+
+    def _history_insert_args(self, entries, separator_before):
+        """Builds Text.insert arguments rendering entries as chat messages."""
+        insert_args = []
+        for entry in entries:
+            role = entry["role"]
+            msg_id = self._message_id_for(entry)
+            msg_tags = (f"msg_{msg_id}", "message_block")
+            if separator_before:
+                insert_args += ["\n\n", ()]
+            insert_args += [f"{role.capitalize()}: ", (f"{role}_role", "role_label", f"msg_{msg_id}_role") + msg_tags]
+            renderer = StreamingMarkdownRenderer(f"{CODE_BLOCK_TAG_PREFIX}{msg_id}_")
+            for text, tags in renderer.render(entry["content"] or PLACEHOLDER_TEXT):
+                insert_args += [text, tags + msg_tags]
+            if entry.get("_stopped"):
+                insert_args += [STOPPED_MARKER, ("marker_label",)]
+            self._register_message(msg_id, entry, renderer.block_tags, renderer.block_languages)
+            if not separator_before:
+                insert_args += ["\n\n", ()]
+        return insert_args
+
+    def _render_history_range(self, start, end, at_top):
+        """Renders chat_history[start:end] just above or below the window, keeping the view still."""
+        entries = self.chat_history[start:end]
+        if not entries:
+            return
+        insert_args = self._history_insert_args(entries, separator_before=not at_top)
+        if self.chat_display.index("end-1c") == "1.0":
+            # Nothing to separate from in an empty display
+            insert_args = insert_args[:-2] if at_top else insert_args[2:]
+
+        # The anchor mark moves with the text, so the visible line stays put
+        self.chat_display.mark_set("view_anchor", "@0,0")
+        self.chat_display.config(state="normal")
+        self.chat_display.insert("1.0" if at_top else "end", *insert_args)
+        self.chat_display.config(state="disabled")
+        self.chat_display.yview("view_anchor")
+        if at_top:
+            self._window_start = start
+        else:
+            self._window_end = end
+
+    def _forget_message_tags(self, entries):
+        """Deletes the per-message tags of evicted entries so they do not pile up."""
+        for entry in entries:
+            msg_id = entry.get("_msg_id")
+            if msg_id:
+                self._forget_message(msg_id)
+
+    def _forget_removed_notes(self):
+        """Drops the notes whose text was deleted with evicted messages; they are not rendered again."""
+        for msg_id, record in list(self._message_index.items()):
+            entry = record["entry"]
+            if (entry is not None and entry.get("role") not in ("user", "assistant")
+                    and not self.chat_display.tag_ranges(f"msg_{msg_id}")):
+                self._forget_message(msg_id)
+
+    # --- Message and code block index ---
+    def _register_message(self, msg_id, entry=None, code_tags=(), languages=None):
+        """Records a displayed message: its history entry (or note) and its code block tags.
+
+        The code blocks are highlighted once they are on screen.
+        """
+        record = self._message_index.get(msg_id)
+        if record is None:
+            record = self._message_index[msg_id] = {"entry": None, "code_tags": []}
+        if entry is not None:
+            record["entry"] = entry
+        record["code_tags"].extend(code_tags)
+        for block_tag in code_tags:
+            self._queue_highlight(block_tag, (languages or {}).get(block_tag, ""), final=True)
+        return record
+
+    def _forget_message(self, msg_id):
+        """Drops a message from the index and deletes its tags from chat_display."""
+        record = self._message_index.pop(msg_id, None)
+        tags = [f"msg_{msg_id}", f"msg_{msg_id}_role"]
+        if record:
+            tags += record["code_tags"]
+            for block_tag in record["code_tags"]:
+                self._highlight_blocks.pop(block_tag, None)
+                self._highlight_dirty.pop(block_tag, None)
+        self.chat_display.tag_delete(*tags)
+
+    def _forget_all_messages(self):
+        for msg_id in list(self._message_index):
+            self._forget_message(msg_id)
+
+    # --- Syntax highlighting of code blocks ---
+    def _queue_highlight(self, block_tag, language, final):
+        """Marks a code block for highlighting in the next batch; final if the block is complete."""
+        state = self._highlight_blocks.setdefault(block_tag, {"language": language, "checkpoint": 0, "final": False})
+        if state["final"]:
+            return # Complete and already highlighted
+        self._highlight_dirty[block_tag] = final or self._highlight_dirty.get(block_tag, False)
+        self._schedule_highlighting()
+
+    def _schedule_highlighting(self):
+        # One batch at a time: chunks streamed meanwhile are picked up by the next one
+        if self._highlight_dirty and not self._highlight_in_flight and not self._highlight_scheduled:
+            self._highlight_scheduled = True
+            self.after_idle(self._dispatch_highlighting)
+
+    def _dispatch_highlighting(self):
+        """Applies cached spans of marked blocks right away and tokenizes the others in a worker."""
+        self._highlight_scheduled = False
+        dirty, self._highlight_dirty = self._highlight_dirty, {}
+        jobs = []
+        cached = []
+        for block_tag, final in dirty.items():
+            state = self._highlight_blocks.get(block_tag)
+            ranges = self.chat_display.tag_ranges(block_tag)
+            if state is None or not ranges:
+                continue # Forgotten or evicted meanwhile
+            code = self.chat_display.get(ranges[0], ranges[1])
+            job = {"tag": block_tag, "language": state["language"], "final": final, "base": 0}
+            if final:
+                job["key"] = highlight_cache_key(code, state["language"])
+                spans = self.highlight_cache.get(job["key"])
+                if spans is not None:
+                    cached.append(dict(job, spans=spans, length=len(code)))
+                    continue
+            else:
+                code = code[:code.rfind("\n") + 1] # Complete lines only; the last one is still streaming
+                job["base"] = min(state["checkpoint"], len(code))
+                if len(code) == job["base"]:
+                    continue
+            job["code"] = code[job["base"]:]
+            job["length"] = len(code)
+            jobs.append(job)
+        if cached:
+            self._apply_highlighting(cached)
+        if jobs:
+            self._highlight_in_flight = True
+            self._start_worker(self._highlight_worker, (jobs,))
+
+    def _highlight_worker(self, jobs):
+        """Worker thread: tokenizes code blocks and posts all their spans in one message."""
+        for job in jobs:
+            try:
+                spans, checkpoint = highlight_code(job.pop("code"), job["language"])
+            except Exception as e:
+                logger.warning(f"Could not highlight code block {job['tag']}: {e}")
+                spans, checkpoint = [], 0
+            job["spans"] = spans
+            job["checkpoint"] = job["base"] + checkpoint
+            if job["final"]:
+                self.highlight_cache.put(job["key"], spans)
+        self._post_to_ui({"type": "highlight_result", "results": jobs})
+
+    def _apply_highlighting(self, results):
+        """Tags the spans of highlighted blocks: one tag_add call per token type and block."""
+        for result in results:
+            block_tag = result["tag"]
+            state = self._highlight_blocks.get(block_tag)
+            ranges = self.chat_display.tag_ranges(block_tag)
+            if state is None or not ranges:
+                continue
+            start, end = ranges[0], ranges[-1]
+            length = len(self.chat_display.get(start, end))
+            if length < result["length"] or (result["final"] and length != result["length"]):
+                continue # The block has been replaced meanwhile
+            base = result["base"]
+            origin = f"{start}+{base}c"
+            for tag in HIGHLIGHT_TAGS:
+                self.chat_display.tag_remove(tag, origin, end)
+            indices = {}
+            for span_start, span_end, tag in result["spans"]:
+                indices.setdefault(tag, []).extend((f"{origin}+{span_start}c", f"{origin}+{span_end}c"))
+            for tag, tag_indices in indices.items():
+                self.chat_display.tag_add(tag, *tag_indices)
+            if result["final"]:
+                state["final"] = True
+            else:
+                state["checkpoint"] = result["checkpoint"]
+
+    def get_highlight_cache_stats(self):
+        """Returns hit/miss counters of the code highlighting cache (for diagnostics)."""
+        return self.highlight_cache.get_stats()
+
+    def _message_id_at(self, index):
+        """Returns the id of the message at a display index (only the tags at that point are inspected)."""
+        for tag in self.chat_display.tag_names(index):
+            if tag.startswith("msg_") and not tag.endswith("_role"):
+                return tag[len("msg_"):]
+        return None
+
+    def _code_block_tag_at(self, index):
+        """Returns the per-block tag of the code block at a display index, if any."""
+        for tag in self.chat_display.tag_names(index):
+            if tag.startswith(CODE_BLOCK_TAG_PREFIX):
+                return tag
+        return None
+
+    def _evict_far_messages(self, from_top):
+        """Evicts off-screen messages once more than MAX_RENDERED_MESSAGES are rendered."""
+        excess = (self._window_end - self._window_start) - MAX_RENDERED_MESSAGES
+        if excess <= 0:
+            return
+        display = self.chat_display
+        if from_top:
+            top_visible = display.index("@0,0")
+            count = 0
+            delete_end = None
+            while count < excess and self._window_start + count + 1 < self._window_end:
+                next_entry = self.chat_history[self._window_start + count + 1]
+                ranges = display.tag_ranges(f"msg_{next_entry.get('_msg_id')}")
+                if not ranges or display.compare(ranges[0], ">", top_visible):
+                    break # Would remove something the user is looking at
+                delete_end = ranges[0]
+                count += 1
+            if not count:
+                return
+            evicted = self.chat_history[self._window_start:self._window_start + count]
+            display.mark_set("view_anchor", "@0,0")
+            display.config(state="normal")
+            display.delete("1.0", delete_end)
+            display.config(state="disabled")
+            display.yview("view_anchor")
+            self._window_start += count
+        else:
+            if self._streams:
+                return # Never evict below an answer that is still queued or streaming
+            bottom_visible = display.index(f"@0,{display.winfo_height()}")
+            count = 0
+            while count < excess and self._window_end - count - 1 > self._window_start:
+                entry = self.chat_history[self._window_end - count - 1]
+                ranges = display.tag_ranges(f"msg_{entry.get('_msg_id')}")
+                if not ranges or display.compare(ranges[0], "<=", bottom_visible):
+                    break
+                count += 1
+            if not count:
+                return
+            last_kept = self.chat_history[self._window_end - count - 1]
+            kept_ranges = display.tag_ranges(f"msg_{last_kept.get('_msg_id')}")
+            if not kept_ranges:
+                return
+            evicted = self.chat_history[self._window_end - count:self._window_end]
+            display.config(state="normal")
+            display.delete(kept_ranges[1], "end-1c")
+            display.config(state="disabled")
+            self._window_end -= count
+        self._forget_message_tags(evicted)
+        self._forget_removed_notes()
+        logger.debug(f"Evicted {count} messages from the {'top' if from_top else 'bottom'} of the transcript.")
+
+    def _on_chat_yscroll(self, first, last):
+        """yscrollcommand of chat_display: updates the scrollbar and pages messages in at either end."""
+        self.chat_display.vbar.set(first, last)
+        if self._paging_scheduled:
+            return
+        if float(first) <= 0.0 and (self._window_start > 0 or self._history_has_older):
+            self._paging_scheduled = True
+            self.after_idle(self._page_up)
+        elif float(last) >= 1.0 and self._window_end < len(self.chat_history):
+            self._paging_scheduled = True
+            self.after_idle(self._page_down)
+
+    def _page_up(self):
+        """Renders the previous page of messages, loading it from the store if needed."""
+        try:
+            if self._window_start == 0 and self._history_has_older:
+                self._load_older_from_store()
+            if self._window_start > 0:
+                start = max(0, self._window_start - self._get_history_page_size())
+                self._render_history_range(start, self._window_start, at_top=True)
+                self._evict_far_messages(from_top=False)
+        except Exception as e:
+            logger.error(f"Could not page in older messages: {e}", exc_info=True)
+            self._history_has_older = False
+        finally:
+            self._paging_scheduled = False
+
+    def _page_down(self):
+        """Re-renders the next page of messages below the window."""
+        try:
+            end = min(len(self.chat_history), self._window_end + self._get_history_page_size())
+            self._render_history_range(self._window_end, end, at_top=False)
+            self._evict_far_messages(from_top=True)
+        except Exception as e:
+            logger.error(f"Could not page in newer messages: {e}", exc_info=True)
+        finally:
+            self._paging_scheduled = False
+
+    def _load_older_from_store(self):
+        """Prepends the previous page of stored messages to chat_history (not rendered yet)."""
+        oldest_id = self.chat_history[0].get("_db_id") if self.chat_history else None
+        if not self.history_store or oldest_id is None:
+            self._history_has_older = False
+            return
+        entries = self.history_store.load_page(
+            self._conversation_id, before_id=oldest_id, limit=self._get_history_page_size())
+        self._history_has_older = bool(entries) and self.history_store.has_older(
+            self._conversation_id, entries[0]["_db_id"])
+        if entries:
+            self.chat_history[:0] = entries
+            self._window_start += len(entries)
+            self._window_end += len(entries)
+            self._compaction = None # Covered indices shifted; compaction is re-planned after the next answer
+
+    def _ensure_window_at_latest(self):
+        """Re-renders the newest messages if the user had scrolled the window back in time."""
+        if self._window_end == len(self.chat_history):
+            return
+        self._forget_all_messages()
+        self.chat_display.config(state="normal")
+        self.chat_display.delete("1.0", "end")
+        self.chat_display.config(state="disabled")
+        start = max(0, len(self.chat_history) - self._get_history_page_size())
+        self._window_start = self._window_end = start
+        self._render_history_range(start, len(self.chat_history), at_top=False)
+        self.chat_display.see("end")
+
+    def _get_models_cache_ttl_seconds(self):
+        """Returns the configured model list cache TTL in seconds."""
+        try:
+            return max(0.0, float(self.models_cache_ttl.get())) * 3600
+        except (ValueError, tk.TclError):
+            return DEFAULT_MODELS_TTL_HOURS * 3600
+
+    def _load_cached_models(self):
+        """Fills the model list from the disk cache and schedules a refresh if it is stale."""
+        entry = self.model_cache.get(self.api_url.get())
+        if entry and entry.get("models"):
+            logger.debug(f"Using {len(entry['models'])} cached models for {self.api_url.get()}")
+            self._update_models_dropdown(entry["models"])
+        if not is_fresh(entry, self._get_models_cache_ttl_seconds()):
+            # Fetch models shortly after startup (non-blocking)
+            self.after(500, self._fetch_models_async)
+
     def _fetch_models_async(self):
         """
         Starts the background thread to fetch models from the API.
+        Concurrent requests share the fetch that is already in flight.
         Does NOT interact with UI elements directly.
         """
+        if self._models_fetch_in_flight:
+            logger.debug("Model fetch already in flight; its result will update all listeners.")
+            return
+
         # Get necessary info directly from the instance variables (StringVars)
         api_url = self.api_url.get().strip()
         api_key = self.api_key.get().strip()
@@ -704,19 +1622,32 @@ class AIChatView(ttk.Frame):
         # logger.debug("AIChatView: Starting model fetch worker thread.") # Optional log
 
         # Start the background worker thread
-        thread = threading.Thread(
-            target=self._fetch_models_worker,
-            args=(api_url, api_key), # Pass URL and key to the worker
-            daemon=True
-        )
-        thread.start()
+        self._models_fetch_in_flight = True
+        cached_entry = self.model_cache.get(api_url) # Validators for a conditional request
+        self._start_worker(self._fetch_models_worker, (api_url, api_key, cached_entry))
+
+    def _fetch_models_worker(self, api_url, api_key, cached_entry=None):
+        """Worker thread for fetching models (conditional GET when the cache has validators)."""
+        import requests # Not imported at Thonny startup; the first worker pays for it, off the Tk thread
 
-    def _fetch_models_worker(self, api_url, api_key):
-        """Worker thread for fetching models."""
         headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        cached_entry = cached_entry or {}
+        cached_models = cached_entry.get("models")
+        if cached_models:
+            if cached_entry.get("etag"):
+                headers["If-None-Match"] = cached_entry["etag"]
+            if cached_entry.get("last_modified"):
+                headers["If-Modified-Since"] = cached_entry["last_modified"]
         models_endpoint = api_url.rstrip('/') + "/models"
         try:
-            response = requests.get(models_endpoint, headers=headers, timeout=15)
+            session = self.http_pool.get(api_url, api_key)
+            response = self.governor.call(
+                api_url, api_key, lambda: session.get(models_endpoint, headers=headers, timeout=15))
+            if response.status_code == 304 and cached_models:
+                logger.debug("Model list not modified; keeping cached list.")
+                self.model_cache.touch(api_url)
+                self._post_to_ui({"type": "models_result", "models": cached_models})
+                return
             response.raise_for_status()
             data = response.json()
             model_list = []
@@ -729,16 +1660,19 @@ class AIChatView(ttk.Frame):
             else:
                  raise ValueError(f"Unexpected API response format for models: {str(data)[:100]}")
 
-            self.stream_queue.put({"type": "models_result", "models": model_list})
+            self.model_cache.store(api_url, model_list,
+                                   etag=response.headers.get("ETag"),
+                                   last_modified=response.headers.get("Last-Modified"))
+            self._post_to_ui({"type": "models_result", "models": model_list})
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to fetch models: {e}", exc_info=True)
-            self.stream_queue.put({"type": "models_error", "error": f"Network or API Error: {e}"})
+            self._post_to_ui({"type": "models_error", "error": f"Network or API Error: {e}", "cached_models": cached_models})
         except (json.JSONDecodeError, ValueError, KeyError) as e:
             logger.error(f"Failed to parse models response: {e}", exc_info=True)
-            self.stream_queue.put({"type": "models_error", "error": f"API Response Error: {e}"})
+            self._post_to_ui({"type": "models_error", "error": f"API Response Error: {e}", "cached_models": cached_models})
         except Exception as e:
             logger.error(f"Unexpected error fetching models: {e}", exc_info=True)
-            self.stream_queue.put({"type": "models_error", "error": f"Unexpected Error: {e}"})
+            self._post_to_ui({"type": "models_error", "error": f"Unexpected Error: {e}", "cached_models": cached_models})
 
     def _update_models_dropdown(self, models, error=None):
         """Updates the main view's model list and notifies open settings dialog."""
@@ -802,10 +1736,6 @@ class AIChatView(ttk.Frame):
         if not user_text:
             return "break" # Prevent sending empty and break default newline
 
-        if self.streaming_thread and self.streaming_thread.is_alive():
-             messagebox.showwarning("Busy", "Please wait for the current response to complete.")
-             return "break"
-
         api_url = self.api_url.get().strip()
         api_key = self.api_key.get().strip()
         model = self.selected_model.get()
@@ -814,84 +1744,501 @@ class AIChatView(ttk.Frame):
              messagebox.showerror("Missing Info", "Please configure API URL, Key, and select a valid Model.")
              return "break"
 
-        # Add user message to history and display
-        msg_id = f"user_{len(self.chat_history)}"
-        self.chat_history.append({"role": "user", "content": user_text})
-        self._add_message_to_display("user", user_text, message_id=msg_id)
+        # Add user message to history and display, then queue the answer. Project snippets
+        # go to the model with this question only; they are searched for in a worker
         self.user_input.delete("1.0", "end") # Clear input field
+        snippet_query = user_text if self._get_snippet_budget() and self.retrievers else None
+        self._submit_request(user_text, _short_label(user_text), PRIORITY_INTERACTIVE, api_url, api_key, model,
+                             snippet_query=snippet_query)
 
-        # Prepare for assistant's response (placeholder)
-        self.current_assistant_message_id = f"asst_{len(self.chat_history)}"
-        self._add_message_to_display("assistant", "...", message_id=self.current_assistant_message_id)
+        return "break" # Prevents default handling of the Enter key
 
-        # Start streaming request in background thread
-        self.streaming_thread = threading.Thread(
-            target=self._stream_chat_worker,
-            args=(api_url, api_key, model, list(self.chat_history)), # Send a copy
-            daemon=True
-        )
-        self.streaming_thread.start()
+    def _get_system_prompt(self):
+        """System prompt sent with every request (asks for the detected language)."""
+        return f"You are a helpful coding assistant. Please respond in {self.system_language}. Reply in short."
 
-        return "break" # Prevents default handling of the Enter key
+    def _build_context_window(self, last_entry=None, reserved_tokens=0):
+        """Returns the history to send, trimmed to the selected model's token budget.
 
-    def _stream_chat_worker(self, api_url, api_key, model, history_copy):
-        """Worker thread for streaming chat completions, adding system prompt."""
+        Only entries up to last_entry (the question being answered) are used,
+        and answers that are still pending are left out. reserved_tokens are
+        kept free for text added to the request (e.g. project snippets).
+        """
+        budget = self._get_context_budget()
+        end = len(self.chat_history)
+        if last_entry is not None:
+            end = self._history_index(last_entry) + 1 or end
+        covered = self._compaction["upto"] if self._compaction else 0
+        entries = [entry for entry in self.chat_history[covered:end] if not entry.get("_pending")]
+        if covered:
+            # The summary stands in for the turns it covers
+            entries = [summary_message(self._compaction["summary"])] + entries
+        start, used = select_context(entries, budget, estimate_tokens(self._get_system_prompt()) + reserved_tokens)
+        logger.debug(f"Context window: {len(entries) - start} messages, ~{used} tokens (budget {budget}).")
+        dropped = start if not covered else (covered + start - 1 if start else 0)
+        if dropped != self._context_dropped_count:
+            self._context_dropped_count = dropped
+            if dropped:
+                # Tell the user what the model can no longer see, above the question being sent:
+                # the end of the chat may be an answer that is still streaming
+                anchor = last_entry
+                if anchor is None:
+                    # A prompt that is not in the chat (comparison window): above the answers still streaming
+                    anchor = next((entry for entry in self.chat_history[covered:] if entry.get("_pending")), None)
+                self._add_message_to_display(
+                    "info",
+                    f"{dropped} earlier message(s) exceed the context budget ({budget} tokens) "
+                    f"and are no longer sent to the model.",
+                    message_id=self._new_message_id("info"), before=anchor.get("_msg_id") if anchor else None)
+        return to_api_messages(entries[start:])
+
+    def _maybe_start_compaction(self):
+        """Starts a background summary of the oldest turns once the history is large enough."""
+        if self._compaction_in_flight or self._streams:
+            return # Wait until no answer is pending in the history
+        covered = self._compaction["upto"] if self._compaction else 0
+        upto = plan_compaction(self.chat_history, self._get_compaction_threshold(), covered)
+        if not upto:
+            return
+        key = history_key(self.chat_history[:upto])
+        if key in self.summary_cache:
+            self._apply_compaction(upto, key, self.summary_cache[key])
+            return
+
+        api_url = self.api_url.get().strip()
+        api_key = self.api_key.get().strip()
+        model = self.selected_model.get()
+        previous_summary = self._compaction["summary"] if self._compaction else None
+        messages = build_summary_messages(self.chat_history[covered:upto], previous_summary, self.system_language)
+        logger.info(f"Starting background compaction of {upto} history entries.")
+        self._compaction_in_flight = True
+        self._compaction_token = CancelToken()
+        self._start_worker(self._compaction_worker,
+                           (api_url, api_key, model, messages, upto, key, self._compaction_token))
+
+    def _compaction_worker(self, api_url, api_key, model, messages, upto, key, cancel_token):
+        """Worker thread: asks the model (non-streaming) for a summary of old turns."""
         headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        payload = {"model": model, "messages": messages, "stream": False}
+        chat_endpoint = api_url.rstrip('/') + "/chat/completions"
+        try:
+            session = self.http_pool.get(api_url, api_key)
+            response = self.governor.call(
+                api_url, api_key, lambda: session.post(chat_endpoint, headers=headers, json=payload, timeout=120),
+                lambda seconds, reason: not cancel_token.wait(0 if reason is None else seconds or SLOT_POLL))
+            if cancel_token.cancelled:
+                return # The view was closed while the summary was being written
+            response.raise_for_status()
+            summary = response.json()["choices"][0]["message"]["content"].strip()
+            if not summary:
+                raise ValueError("Empty summary")
+            self._post_to_ui({"type": "compaction_result", "upto": upto, "key": key, "summary": summary})
+        except Exception as e:
+            # Compaction is best effort; the full (trimmed) history is still sent
+            logger.warning(f"History compaction failed: {e}")
+            self._post_to_ui({"type": "compaction_error", "error": str(e)})
+
+    def _apply_compaction(self, upto, key, summary):
+        """Makes summary stand in for chat_history[:upto] in future requests."""
+        self.summary_cache[key] = summary
+        self._compaction = {"upto": upto, "key": key, "summary": summary}
+        self._add_message_to_display(
+            "info",
+            f"The first {upto} message(s) are now sent to the model as a summary.",
+            message_id=self._new_message_id("info"))
+
+    # --- Request queue ---
+    def _submit_request(self, prompt, label, priority, api_url, api_key, model, cache_key=None,
+                        explain_selection=None, snippet_query=None):
+        """Adds the question to the chat and queues its answer.
+
+        The answer gets its placeholder message (and a pending history entry)
+        right away, so each request streams into its own place in the chat.
+        With explain_selection the parts of a large selection are explained first;
+        with snippet_query project snippets matching it are looked up first and
+        added to the question as sent to the model (not shown).
+        """
+        self._ensure_window_at_latest()
+        user_msg_id = self._new_message_id("user")
+        user_entry = self._append_history("user", prompt, user_msg_id)
+        self._add_message_to_display("user", prompt, message_id=user_msg_id)
+
+        msg_id = self._new_message_id("assistant")
+        entry = self._append_history("assistant", "", msg_id, pending=True)
+        self._add_message_to_display("assistant", QUEUED_PLACEHOLDER_TEXT, message_id=msg_id)
+
+        request = ChatRequest(msg_id, entry, user_entry, label, priority, api_url, api_key, model, cache_key)
+        request.explain_selection = explain_selection
+        request.snippet_query = snippet_query
+        self._streams[msg_id] = request
+        self.scheduler.submit(request)
+        self._start_ready_requests()
+
+    def _start_ready_requests(self):
+        """Starts queued requests while fewer than the configured number are streaming."""
+        for request in self.scheduler.start_ready():
+            self._set_placeholder_text(request.message_id, PLACEHOLDER_TEXT)
+            if request.explain_selection is not None:
+                text, source, force_refresh = request.explain_selection
+                logger.debug(f"Starting to explain {request.message_id} in parts ({request.label}).")
+                self._start_worker(
+                    self._explain_parts_worker,
+                    (request.api_url, request.api_key, request.model, text, source, force_refresh,
+                     self.system_language, request.message_id, request.cancel_token),
+                )
+            elif request.snippet_query is not None:
+                self._start_worker(self._snippet_search_worker,
+                                   (request.snippet_query, self._get_snippet_budget(), list(self.retrievers.values()),
+                                    request.message_id))
+            else:
+                self._start_stream(request)
+        self._update_queue_status()
+
+    def _start_stream(self, request):
+        """Starts streaming the answer of a request that holds a stream slot."""
+        if request.messages is not None:
+            context_messages = request.messages
+        else:
+            reserved = estimate_tokens(request.attachment) if request.attachment else 0
+            context_messages = self._build_context_window(request.user_entry, reserved)
+            if request.attachment and context_messages and context_messages[-1]["role"] == "user":
+                last = context_messages[-1]
+                context_messages[-1] = {"role": "user", "content": last["content"] + request.attachment}
+        logger.debug(f"Starting stream worker for {request.message_id} ({request.label}).")
+        # Only typed questions are worth a second request to cut the wait
+        hedge_delay = self._get_hedge_delay() if request.priority == PRIORITY_INTERACTIVE else 0
+        self._start_worker(
+            self._stream_chat_worker,
+            (self._chat_endpoints(request.api_url, request.api_key), request.model,
+             context_messages, # Send a trimmed copy
+             request.message_id, request.cancel_token, self._get_first_byte_deadline(), hedge_delay),
+        )
 
+    def _finish_request(self, request):
+        """Forgets a request that ended, failed or was stopped, and starts the next one."""
+        self._streams.pop(request.message_id, None)
+        self.scheduler.finish(request)
+        self._start_ready_requests()
+
+    def _update_queue_status(self):
+        """Shows how many answers are streaming and which requests are waiting."""
+        running = len(self.scheduler.running)
+        pending = self.scheduler.pending()
+        text = ""
+        if running or pending:
+            text = f"Answering: {running}"
+            if pending:
+                labels = ", ".join(request.label for request in pending[:3])
+                more = ", ..." if len(pending) > 3 else ""
+                text += f"  Queued: {len(pending)} ({labels}{more})"
+        self.queue_status.config(text=text)
+        self.stop_button.config(state="normal" if self._streams else "disabled")
+
+    def _stop_streaming(self, event=None):
+        """Stops every running answer (keeping partial text) and empties the queue."""
+        if self._streams:
+            logger.info("Stopping all answers.")
+            self._cancel_all_requests()
+        return "break"
+
+    def _cancel_all_requests(self, note=True):
+        # Drop the queued ones first so stopping a running answer does not start them
+        for request in self.scheduler.pending():
+            self._stop_request(request, note)
+        for request in list(self.scheduler.running):
+            self._stop_request(request, note)
+
+    def _stop_request(self, request, note=True):
+        """Aborts one request. Text already shown is kept and marked as stopped.
+
+        Anything the worker posts afterwards is ignored, so the view is free
+        immediately even if the connection is still being set up.
+        """
+        was_queued = request.state == QUEUED
+        request.cancel_token.cancel() # Closes the connection if it is streaming
+        partial_content = "".join(request.parts)
+        if partial_content:
+            self._flush_stream_renderer(request)
+            self._complete_history_entry(request.entry, partial_content)
+            request.entry["_stopped"] = True
+            ranges = self.chat_display.tag_ranges(f"msg_{request.message_id}")
+            if ranges:
+                self.chat_display.config(state="normal")
+                self.chat_display.insert(ranges[1], STOPPED_MARKER, ("marker_label",))
+                self.chat_display.config(state="disabled")
+        else:
+            request.renderer = None
+            self._remove_placeholder_message(request.message_id)
+            self._remove_history_entry(request.entry)
+            if note:
+                text = "Removed from the queue." if was_queued else "Stopped before the answer began."
+                self._add_message_to_display("info", text, message_id=self._new_message_id("info"))
+        self._finish_request(request)
+
+    def _stop_answer_at_click(self):
+        """Stops (or unqueues) the answer the context menu was opened on."""
+        request = self._streams.get(self._message_id_at(self._context_menu_index()))
+        if request is not None:
+            self._stop_request(request)
+
+    def _is_placeholder(self, text):
+        text = text.strip()
+        return (text in (PLACEHOLDER_TEXT, QUEUED_PLACEHOLDER_TEXT) or PROGRESS_PLACEHOLDER_RE.fullmatch(text) is not None
+                or WAITING_PLACEHOLDER_RE.fullmatch(text) is not None)
+
+    def _set_placeholder_text(self, msg_id, text):
+        """Replaces the placeholder of an assistant message that has no content yet."""
+        msg_tag = f"msg_{msg_id}"
+        ranges = self.chat_display.tag_ranges(msg_tag)
+        if not ranges:
+            return False
+        role_ranges = self.chat_display.tag_ranges(f"{msg_tag}_role")
+        content_start_index = role_ranges[1] if role_ranges else ranges[0]
+        if not self._is_placeholder(self.chat_display.get(content_start_index, ranges[1])):
+            return False
+        self.chat_display.config(state="normal")
+        self.chat_display.delete(content_start_index, ranges[1])
+        if text:
+            self.chat_display.insert(content_start_index, text, (msg_tag, "message_block"))
+        self.chat_display.config(state="disabled")
+        return True
+
+    def _remove_placeholder_message(self, msg_id):
+        """Deletes an assistant message that still shows only its placeholder."""
+        msg_tag = f"msg_{msg_id}"
+        ranges = self.chat_display.tag_ranges(msg_tag)
+        if ranges:
+            role_ranges = self.chat_display.tag_ranges(f"{msg_tag}_role")
+            content_start_index = role_ranges[1] if role_ranges else ranges[0]
+            if self._is_placeholder(self.chat_display.get(content_start_index, ranges[1])):
+                self.chat_display.config(state="normal")
+                self.chat_display.delete(ranges[0], ranges[1]) # Delete whole line
+                self.chat_display.config(state="disabled")
+                self._forget_message(msg_id)
+                logger.debug("Removed placeholder message.")
+
+    def _stream_chat_worker(self, endpoints, model, history_copy, message_id, cancel_token,
+                            first_byte_deadline=None, hedge_delay=0):
+        """Worker thread for streaming chat completions, adding system prompt.
+
+        endpoints (routing.Endpoint, best first) are tried in turn: while no
+        text has been shown, one that fails or sends nothing within
+        first_byte_deadline seconds is given up for the next. With
+        hedge_delay, the next endpoint is also asked when the current one
+        has sent nothing after that many seconds; the first to send text
+        is shown and the other request is closed. When all of them are
+        busy (429, 5xx), they are tried again after a backoff, and the
+        answer's placeholder says how long it waits.
+        All messages it posts carry message_id, so the view can ignore a
+        stream it has already stopped.
+        """
         # --- Add System Prompt with Language ---
-        system_prompt = f"You are a helpful coding assistant. Please respond in {self.system_language}. Reply in short."
+        system_prompt = self._get_system_prompt()
         messages_to_send = [{"role": "system", "content": system_prompt}] + history_copy
         # --------------------------------------
 
-        payload = {
-            "model": model,
-            "messages": messages_to_send, # Use the list with system prompt
-            "stream": True,
-        }
-        chat_endpoint = api_url.rstrip('/') + "/chat/completions"
-        full_response_content = ""
-        first_chunk = True
+        started = time.perf_counter()
+        wait = self._make_waiter(message_id, cancel_token)
+        pending = list(endpoints)
+        failed = [] # Results of the attempts that failed before showing text
+        retry = 0
+        pass_start = 0 # Where the failures of the current pass over the endpoints begin in failed
+        while not cancel_token.cancelled:
+            if not pending:
+                # Every endpoint failed; try them all again if one was only busy
+                busy = [result for result in failed[pass_start:] if result["retry"]]
+                delay = self.governor.retry_delay(retry, busy[0]["retry_after"]) if busy else None
+                if delay is None:
+                    break
+                logger.warning(f"All endpoints failed ({busy[0]['error']}); retrying in {delay:.1f} s.")
+                if not (wait(delay, REASON_BUSY.format(status=busy[0]["status"] or "no connection"))
+                        and wait(0, None)):
+                    return
+                retry += 1
+                pass_start = len(failed)
+                pending = self.router.ranked(endpoints)
+
+            race = StreamRace() # Attempts of this round; a hedged round has two
+            finished = queue.Queue() # Their results
+
+            def attempt(endpoint, deadline):
+                finished.put(self._stream_attempt(endpoint, model, messages_to_send, message_id,
+                                                  cancel_token.child(), race, deadline))
+
+            endpoint = pending.pop(0)
+            # The last endpoint gets the usual timeout: there is nothing to fail over to
+            deadline = first_byte_deadline if pending else None
+            attempts = 1
+            if hedge_delay and pending:
+                threading.Thread(target=attempt, args=(endpoint, deadline), daemon=True).start()
+                if not race.progress.wait(hedge_delay) and not cancel_token.cancelled:
+                    logger.info(f"No response from {endpoint.api_url} after {hedge_delay} s; "
+                                f"also asking {pending[0].api_url}.")
+                    hedge = pending.pop(0)
+                    threading.Thread(target=attempt, args=(hedge, first_byte_deadline if pending else None),
+                                     daemon=True).start()
+                    attempts += 1
+            else:
+                attempt(endpoint, deadline)
+
+            results = []
+            while len(results) < attempts:
+                result = finished.get()
+                if result["outcome"] == "won":
+                    # The loser may still be waiting for a stalled server; it ends on its own, silently
+                    if not cancel_token.cancelled:
+                        self._post_stream_result(message_id, result, started)
+                    return
+                results.append(result)
+            if cancel_token.cancelled:
+                return
+            failed.extend(result for result in results if result["outcome"] == "failed")
+            if failed and not failed[-1]["failover"]:
+                break # The request itself was refused; another endpoint would refuse it too
+            if pending:
+                logger.warning(f"Trying {pending[0].api_url} next.")
+
+        if failed and not cancel_token.cancelled:
+            result = failed[-1]
+            if len(failed) > 1:
+                result["error"] += f" (after {len(failed)} attempts)"
+            self._post_stream_result(message_id, result, started)
+
+    def _make_waiter(self, message_id, cancel_token):
+        """A wait callback for the governor that shows the wait in the answer's placeholder.
+
+        Counts down in whole seconds and returns False as soon as the
+        request is stopped.
+        """
+        shown = [None] # The (seconds, reason) posted last
+
+        def wait(seconds, reason):
+            if reason is None: # Done waiting
+                if shown[0] is not None:
+                    shown[0] = None
+                    self._post_to_ui({"type": "stream_waiting", "message_id": message_id, "reason": None})
+                return not cancel_token.cancelled
+            deadline = time.monotonic() + (SLOT_POLL if seconds is None else seconds)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return not cancel_token.cancelled
+                notice = (None if seconds is None else math.ceil(remaining), reason)
+                if notice != shown[0]:
+                    shown[0] = notice
+                    self._post_to_ui({"type": "stream_waiting", "message_id": message_id,
+                                      "seconds": notice[0], "reason": reason})
+                if cancel_token.wait(min(1.0, remaining)):
+                    return False
+
+        return wait
+
+    def _stream_attempt(self, endpoint, model, messages, message_id, token, race, first_byte_deadline=None):
+        """One request of _stream_chat_worker to one endpoint. Returns a result dict.
+
+        Its text is posted only once it won the race. "outcome" is "won"
+        (with "error" if it failed after showing text), "failed" (with
+        "failover" if another endpoint may do better and "retry" if trying
+        again later may help), "lost" or "cancelled".
+        """
+        import requests # Not imported at Thonny startup; the first worker pays for it, off the Tk thread
+        from thonnycontrib.ai_chat.sse import DONE as SSE_DONE, SSEParser, delta_content as sse_delta_content
+
+        def post(message):
+            message["message_id"] = message_id
+            self._post_to_ui(message)
+
+        content_parts = [] # Joined once at the end
+        timings = {"started": time.perf_counter()} # Worker side of the request's latency timings
+        result = {"endpoint": endpoint, "outcome": "failed", "error": None, "failover": False, "retry": False,
+                  "status": None, "retry_after": None, "parts": content_parts, "timings": timings}
+        won = False
+
+        def claim():
+            nonlocal won
+            if not won and race.claim(token):
+                won = True
+                post({"type": "stream_clear_placeholder"})
+            return won
+
+        headers = {"Authorization": f"Bearer {endpoint.api_key}", "Content-Type": "application/json"}
+        # Only the turns not sent before are encoded; the rest comes from the previous request
+        body = self.request_encoder.encode({"model": endpoint.model_for(model), "stream": True}, messages)
+        chat_endpoint = endpoint.api_url + "/chat/completions"
+        read_timeout = first_byte_deadline or STREAM_READ_TIMEOUT
+        race.join(token)
+        wait = self._make_waiter(message_id, token)
+        slot = False
 
         try:
-            with requests.post(chat_endpoint, headers=headers, json=payload, stream=True, timeout=60) as response:
+            # The endpoint may be busy with other answers, and the key shared with a whole class
+            slot = self.governor.acquire_stream(endpoint.api_url, wait)
+            if not (slot and self.governor.wait_turn(endpoint.api_url, endpoint.api_key, wait)):
+                result["outcome"] = "cancelled"
+                return result
+            timings["started"] = time.perf_counter()
+            session = self.http_pool.get(endpoint.api_url, endpoint.api_key)
+            with session.post(chat_endpoint, headers=headers, data=body, stream=True,
+                              timeout=(min(CONNECT_TIMEOUT, read_timeout), read_timeout)) as response:
+                timings["connected"] = time.perf_counter()
+                token.attach(response)
+                if not response.ok:
+                    response.content # Read the error body while the response is open
                 response.raise_for_status()
-                logger.debug(f"Streaming response status: {response.status_code}")
-
-                for line in response.iter_lines():
-                    if line:
-                        decoded_line = line.decode('utf-8')
-                        if decoded_line.startswith("data: "):
-                            data_str = decoded_line[len("data: "):].strip()
-                            if data_str == "[DONE]":
-                                logger.debug("Stream [DONE] received.")
+                logger.debug(f"Streaming response status: {response.status_code} from {endpoint.api_url}")
+
+                # Chunked responses are read chunk by chunk as they arrive; otherwise in small reads
+                read_size = None if getattr(response.raw, "chunked", False) else 512
+                parser = SSEParser()
+                done = False
+                for raw_chunk in response.iter_content(chunk_size=read_size):
+                    if token.cancelled:
+                        break
+                    if "first_byte" not in timings:
+                        timings["first_byte"] = time.perf_counter()
+                        race.progress.set()
+                        self.router.record_success(endpoint, timings["connected"] - timings["started"])
+                        if first_byte_deadline:
+                            set_read_timeout(response, STREAM_READ_TIMEOUT) # The deadline was for the first byte
+                    for data in parser.feed(raw_chunk):
+                        if data.strip() == SSE_DONE:
+                            logger.debug("Stream [DONE] received.")
+                            done = True
+                            break
+                        try:
+                            content_chunk = sse_delta_content(data)
+                        except ValueError:
+                            logger.warning(f"Failed to decode stream JSON chunk: {data[:200]!r}")
+                            continue
+                        if content_chunk:
+                            if not claim():
+                                done = True # Another endpoint's answer is being shown
                                 break
-                            try:
-                                data = json.loads(data_str)
-                                if data.get("choices"):
-                                     delta = data["choices"][0].get("delta", {})
-                                     content_chunk = delta.get("content")
-                                     if content_chunk:
-                                         if first_chunk:
-                                             self.stream_queue.put({"type": "stream_clear_placeholder"})
-                                             first_chunk = False
-                                         self.stream_queue.put({"type": "stream_chunk", "chunk": content_chunk})
-                                         full_response_content += content_chunk
-                            except json.JSONDecodeError:
-                                logger.warning(f"Failed to decode stream JSON chunk: {data_str}")
-                                continue
-                        elif decoded_line.strip():
-                             logger.warning(f"Received unexpected non-SSE line: {decoded_line}")
-
-                self.stream_queue.put({"type": "stream_end", "full_content": full_response_content})
-                logger.debug("Stream processing finished.")
+                            timings["last_token"] = time.perf_counter()
+                            timings.setdefault("first_token", timings["last_token"])
+                            post({"type": "stream_chunk", "chunk": content_chunk})
+                            content_parts.append(content_chunk)
+                    if done:
+                        break
+
+                if token.cancelled:
+                    logger.debug("Stream stopped.")
+                    result["outcome"] = "cancelled"
+                else:
+                    result["outcome"] = "won" if claim() else "lost"
+                    logger.debug("Stream processing finished.")
 
         except requests.exceptions.Timeout:
-             logger.error("API request timed out.")
-             self.stream_queue.put({"type": "stream_error", "error": "Request timed out."})
+             logger.error(f"API request to {endpoint.api_url} timed out.")
+             result["error"] = "Request timed out."
+             result["failover"] = True
         except requests.exceptions.RequestException as e:
             error_detail = str(e)
+            status = None
             try:
                 if e.response is not None:
+                     status = e.response.status_code
+                     result["retry_after"] = parse_retry_after(e.response.headers.get("Retry-After"))
                      error_content = e.response.text
                      logger.error(f"API request failed: {e} - Response: {error_content[:500]}")
                      try:
@@ -903,98 +2250,659 @@ class AIChatView(ttk.Frame):
                 else:
                      logger.error(f"API request failed: {e} (No response object)", exc_info=True)
             except Exception: pass
-            self.stream_queue.put({"type": "stream_error", "error": f"API Error: {error_detail}"})
+            result["error"] = f"API Error: {error_detail}"
+            result["status"] = status
+            result["failover"] = status is None or status >= 500 or status in FAILOVER_STATUSES
+            # 429 and 5xx mean busy; a request that never reached the server is safe to send again
+            result["retry"] = (status in RETRY_STATUSES if status is not None
+                               else isinstance(e, requests.exceptions.ConnectionError))
+            # Every request with this key holds back, not just this one
+            self.governor.note_retry_after(endpoint.api_key, result["retry_after"])
+        except Exception as e:
+            if not token.cancelled:
+                logger.error(f"Unexpected error during streaming: {e}", exc_info=True)
+            result["error"] = f"Unexpected Error: {e}"
+        finally:
+            if slot:
+                self.governor.release_stream(endpoint.api_url)
+            token.detach()
+            race.progress.set()
+
+        if result["error"] is not None:
+            if token.cancelled:
+                # A closed response surfaces as an error; after Stop (or losing the race) it is not one
+                result["outcome"] = "cancelled"
+            elif won:
+                result["outcome"] = "won" # Text was shown: the answer ends here, with the error
+            elif result["failover"]:
+                self.router.record_failure(endpoint, result["error"])
+        return result
+
+    def _post_stream_result(self, message_id, result, started):
+        """Posts the end (or error) of the answer of _stream_chat_worker."""
+        timings = dict(result["timings"], started=started) # Time spent on earlier endpoints counts too
+        message = {"type": "stream_end", "message_id": message_id, "timings": timings,
+                   "tokens": len(result["parts"]), "endpoint": result["endpoint"].api_url}
+        if result["error"] is None:
+            message["full_content"] = "".join(result["parts"])
+        else:
+            message.update(type="stream_error", error=result["error"])
+        self._post_to_ui(message)
+
+    def _explain_parts_worker(self, api_url, api_key, model, text, source, force_refresh, language,
+                              message_id, cancel_token):
+        """Worker thread: splits a large selection and explains the parts, a few at a time (non-streaming).
+
+        Each part's explanation is cached by its text, so after a small edit
+        only the changed parts are asked again. Progress is posted as parts
+        complete; the view then streams the synthesis of all of them.
+        """
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        from thonnycontrib.ai_chat.chunking import build_part_messages, split_selection
+        from thonnycontrib.ai_chat.sse import DONE as SSE_DONE, SSEParser, delta_content as sse_delta_content
+
+        parts = split_selection(text)
+        if len(parts) < 2:
+            # Nothing to split at: answer it like a small selection
+            self._post_to_ui({"type": "stream_parts_done", "message_id": message_id, "parts": None})
+            return
+        logger.info(f"Explaining a large selection in {len(parts)} parts.")
+
+        headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        chat_endpoint = api_url.rstrip('/') + "/chat/completions"
+        wait = self._make_waiter(message_id, cancel_token)
+
+        def explain(part):
+            messages = build_part_messages(part, source, language)
+            key = response_key(api_url, model, messages[0]["content"], part.text, source)
+            if not force_refresh:
+                cached = self.explain_cache.get(key)
+                if cached is not None:
+                    return cached, True
+            if cancel_token.cancelled:
+                return None, False
+            # Streamed, so Stop closes the response at once instead of waiting for the whole answer
+            payload = {"model": model, "messages": messages, "stream": True}
+            session = self.http_pool.get(api_url, api_key)
+            token = cancel_token.child()
+
+            def send():
+                response = session.post(chat_endpoint, headers=headers, json=payload, stream=True,
+                                        timeout=(CONNECT_TIMEOUT, STREAM_READ_TIMEOUT))
+                token.attach(response)
+                return response
+
+            content_parts = []
+            try:
+                with self.governor.call(api_url, api_key, send, wait) as response:
+                    if not response.ok:
+                        response.content # Read the error body while the response is open
+                    response.raise_for_status()
+                    parser = SSEParser()
+                    read_size = None if getattr(response.raw, "chunked", False) else 512
+                    done = False
+                    for raw_chunk in response.iter_content(chunk_size=read_size):
+                        if token.cancelled:
+                            break
+                        for data in parser.feed(raw_chunk):
+                            if data.strip() == SSE_DONE:
+                                done = True
+                                break
+                            try:
+                                content_parts.append(sse_delta_content(data) or "")
+                            except ValueError:
+                                logger.warning(f"Failed to decode stream JSON chunk: {data[:200]!r}")
+                        if done:
+                            break
+            except RequestCancelled:
+                return None, False
+            except Exception:
+                if token.cancelled:
+                    return None, False # The closed response surfaces as an error
+                raise
+            finally:
+                token.detach()
+            if token.cancelled:
+                return None, False
+            explanation = "".join(content_parts).strip()
+            if not explanation:
+                raise ValueError("Empty answer")
+            self.explain_cache.put(key, explanation)
+            return explanation, False
+
+        explanations = [None] * len(parts)
+        done = cached = 0
+        executor = ThreadPoolExecutor(max_workers=min(EXPLAIN_PART_PARALLELISM, len(parts)),
+                                      thread_name_prefix="ai_chat_explain")
+        try:
+            futures = {executor.submit(explain, part): index for index, part in enumerate(parts)}
+            for future in as_completed(futures):
+                if cancel_token.cancelled:
+                    logger.debug("Explaining parts stopped by the user.")
+                    return
+                part = parts[futures[future]]
+                try:
+                    explanation, from_cache = future.result()
+                except Exception as e:
+                    logger.error(f"Explaining lines {part.first_line}-{part.last_line} failed: {e}")
+                    self._post_to_ui({"type": "stream_error", "message_id": message_id,
+                                      "error": f"Explaining lines {part.first_line}-{part.last_line} failed: {e}"})
+                    return
+                explanations[futures[future]] = explanation
+                done += 1
+                cached += from_cache
+                self._post_to_ui({"type": "stream_parts_progress", "message_id": message_id,
+                                  "done": done, "total": len(parts)})
+            logger.info(f"Explained {len(parts)} parts ({cached} from the cache).")
+            self._post_to_ui({"type": "stream_parts_done", "message_id": message_id, "parts": parts,
+                              "explanations": explanations})
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True) # After Stop, parts not yet started are dropped
+
+    # --- Symbol index ---
+    def _open_editor_files(self):
+        """Filenames of the editors open in Thonny (saved at least once)."""
+        try:
+            editors = self.workbench.get_editor_notebook().get_all_editors()
         except Exception as e:
-            logger.error(f"Unexpected error during streaming: {e}", exc_info=True)
-            self.stream_queue.put({"type": "stream_error", "error": f"Unexpected Error: {e}"})
+            logger.debug(f"Could not list editors: {e}")
+            return []
+        return [os.path.abspath(editor.get_filename()) for editor in editors if editor.get_filename()]
+
+    def _new_project_roots(self, known_roots, root_of=os.path.dirname):
+        """Directories (root_of each open file) not inside one of known_roots (or each other).
+
+        A file opened straight from the home folder or a drive root does not
+        make that whole tree a project.
+        """
+        roots = []
+        for directory in sorted(set(root_of(filename) for filename in self._open_editor_files())):
+            if is_broad_directory(directory):
+                logger.debug(f"Not indexing {directory}: too broad for a project.")
+                continue
+            if any(directory == root or directory.startswith(root + os.sep) for root in list(known_roots) + roots):
+                continue
+            roots.append(directory)
+        return roots
+
+    def _start_symbol_indexing(self):
+        """Indexes the projects of the open files that are not indexed yet, in a worker thread."""
+        if not self._get_definitions_budget():
+            return
+        from thonnycontrib.ai_chat.symbol_index import project_root
+        roots = self._new_project_roots(self._indexed_roots, project_root)
+        if roots:
+            self._indexed_roots.update(roots)
+            self._start_worker(self._symbol_index_worker, (roots,))
+
+    def _symbol_index_worker(self, roots):
+        """Worker thread: indexes the Python files under roots."""
+        for root in roots:
+            start = time.perf_counter()
+            reparsed = self.symbol_index.scan(root)
+            logger.info(f"Indexed {reparsed} files under {root} in {time.perf_counter() - start:.2f} s "
+                        f"({self.symbol_index.get_stats()}).")
+
+    def _on_editor_saved(self, event=None):
+        """Workbench "Save" handler: reindexes the saved file (and its directory, if new)."""
+        filename = getattr(event, "filename", None)
+        if not filename:
+            return
+        filename = os.path.abspath(filename)
+        if filename.endswith(".py") and self._get_definitions_budget():
+            self._start_worker(self.symbol_index.index_file, (filename,))
+            self._start_symbol_indexing()
+        for retriever in self.retrievers.values():
+            if filename.startswith(retriever.root + os.sep):
+                retriever.stale = True
+        self._schedule_retrieval_refresh()
+
+    def _current_buffer(self):
+        """(absolute path, text) of the current editor's file, or (None, None). Tk thread only."""
+        try:
+            editor = self.workbench.get_editor_notebook().get_current_editor()
+            if editor is not None and editor.get_filename():
+                return os.path.abspath(editor.get_filename()), editor.get_text_widget().get("1.0", "end-1c")
+        except Exception as e:
+            logger.debug(f"Could not read the current editor: {e}")
+        return None, None
+
+    def _definitions_worker(self, text, source, force_refresh, budget, near_path, buffer_text):
+        """Worker thread: looks up the definitions text uses and posts them (explain_definitions)."""
+        try:
+            definitions = self._referenced_definitions(text, budget, near_path, buffer_text)
+        except Exception as e:
+            # Definitions are best effort; the selection is still explained
+            logger.error(f"Looking up referenced definitions failed: {e}", exc_info=True)
+            definitions = ""
+        self._post_to_ui({"type": "explain_definitions", "text": text, "source": source,
+                          "force_refresh": force_refresh, "definitions": definitions})
+
+    def _referenced_definitions(self, text, budget, near_path, buffer_text):
+        """Markdown with the project definitions text uses (within budget), or "". Runs in a worker."""
+        from thonnycontrib.ai_chat.symbol_index import project_root
+        try:
+            # The current buffer may have unsaved helpers; unchanged text is not parsed again
+            self.symbol_index.index_source(near_path, buffer_text, keep_source=True)
+        except Exception as e:
+            logger.debug(f"Could not index the current editor: {e}")
+        # Only the current file's project is searched; a file lying in the home folder only uses its own definitions
+        root = project_root(near_path)
+        if is_broad_directory(root):
+            root = near_path
+        start = time.perf_counter()
+        definitions = self.symbol_index.definitions_for(text, budget, near_path, root)
+        logger.debug(f"Found {len(definitions)} referenced definitions in {(time.perf_counter() - start) * 1000:.1f} ms.")
+        sections = []
+        for symbol, definition in definitions:
+            try:
+                location = os.path.relpath(symbol.path, os.path.dirname(near_path))
+            except ValueError:
+                location = os.path.basename(symbol.path) # Other drive
+            sections.append(f"{symbol.qualname} ({location}, line {symbol.first_line}):\n```python\n{definition}\n```")
+        return "\n\n".join(sections)
+
+    # --- Project snippet retrieval ---
+    def _start_retrieval_indexing(self):
+        """Opens (or builds) the retrieval index of new project directories in a worker thread."""
+        if not self._get_snippet_budget():
+            return
+        from thonnycontrib.ai_chat.retrieval import ProjectRetriever
+        new_retrievers = []
+        for root in self._new_project_roots(self.retrievers):
+            retriever = ProjectRetriever(root, os.path.join(get_plugin_data_dir(), "retrieval"))
+            self.retrievers[root] = retriever
+            new_retrievers.append(retriever)
+        if new_retrievers:
+            self._start_worker(self._retrieval_worker, (new_retrievers, True))
+
+    def _schedule_retrieval_refresh(self):
+        """Refreshes stale retrieval indexes a little later, so a burst of saves costs one refresh."""
+        self._start_retrieval_indexing()
+        if not self._retrieval_refresh_scheduled and any(retriever.stale for retriever in self.retrievers.values()):
+            self._retrieval_refresh_scheduled = True
+            self.after(RETRIEVAL_REFRESH_DELAY_MS, self._refresh_stale_retrievers)
+
+    def _refresh_stale_retrievers(self):
+        self._retrieval_refresh_scheduled = False
+        stale = [retriever for retriever in self.retrievers.values() if retriever.stale]
+        if stale:
+            self._start_worker(self._retrieval_worker, (stale, False))
+
+    def _retrieval_worker(self, retrievers, open_first):
+        """Worker thread: maps the saved index files (when open_first) and brings them up to date."""
+        for retriever in retrievers:
+            try:
+                start = time.perf_counter()
+                if open_first:
+                    retriever.open()
+                retriever.refresh()
+                logger.info(f"Retrieval index ready in {time.perf_counter() - start:.2f} s: {retriever.get_stats()}")
+            except Exception as e:
+                logger.error(f"Could not build the retrieval index of {retriever.root}: {e}", exc_info=True)
+
+    def _snippet_search_worker(self, question, budget, retrievers, message_id):
+        """Worker thread: finds the project snippets for a question and posts them (stream_snippets)."""
+        try:
+            attachment, sources = self._retrieve_snippets(question, budget, retrievers)
+        except Exception as e:
+            # Snippets are best effort; the question is still answered
+            logger.error(f"Searching the project files failed: {e}", exc_info=True)
+            attachment, sources = "", []
+        self._post_to_ui({"type": "stream_snippets", "message_id": message_id,
+                          "attachment": attachment, "sources": sources})
+
+    def _retrieve_snippets(self, question, budget, retrievers):
+        """(text to attach, [source labels]) of the project snippets matching question, within the budget."""
+        start = time.perf_counter()
+        hits = []
+        for retriever in retrievers:
+            hits.extend((hit, retriever) for hit in retriever.search(question, SNIPPET_TOP_K))
+        hits.sort(key=lambda item: item[0].score, reverse=True)
+        sections = []
+        labels = []
+        used = 0
+        for hit, retriever in hits[:SNIPPET_TOP_K]:
+            text = retriever.snippet_text(hit)
+            if not text or not text.strip():
+                continue # Changed since it was indexed
+            remaining = budget - used
+            if len(text) > remaining:
+                if remaining < MIN_SNIPPET_CHARS:
+                    break
+                text = text[:remaining].rsplit("\n", 1)[0]
+            label = f"{os.path.relpath(hit.path, retriever.root)}:{hit.first_line}-{hit.last_line}"
+            language = "python" if hit.path.endswith((".py", ".pyw")) else ""
+            sections.append(f"{label}\n```{language}\n{text}\n```")
+            labels.append(label)
+            used += len(text)
+        logger.debug(f"Retrieved {len(sections)} snippets ({used} chars) in {(time.perf_counter() - start) * 1000:.1f} ms.")
+        if not sections:
+            return "", []
+        return ("\n\nExcerpts from the project files that may be relevant (use them only if they are):\n\n"
+                + "\n\n".join(sections)), labels
+
+    # --- Worker threads and UI wakeup ---
+    def _is_tcl_threaded(self):
+        """True if Tcl is built with threads, so worker threads may call event_generate."""
+        try:
+            return str(self.tk.eval("info exists tcl_platform(threaded)")) == "1"
+        except tk.TclError:
+            return False
+
+    def _start_worker(self, target, args):
+        """Starts a daemon worker thread and makes sure its messages get processed."""
+        self._active_workers += 1
+        thread = threading.Thread(target=self._run_worker, args=(target, args), daemon=True)
+        thread.start()
+        self._schedule_queue_check(QUEUE_POLL_FALLBACK_MS if self._threaded_tcl else QUEUE_POLL_NO_EVENTS_MS)
+        return thread
+
+    def _run_worker(self, target, args):
+        """Thread body: runs target and always reports back when it is finished."""
+        try:
+            target(*args)
+        finally:
+            self._post_to_ui({"type": "worker_done"})
+
+    def _post_to_ui(self, message):
+        """Queues a message for the Tk thread and wakes it up. Safe to call from workers."""
+        self.stream_queue.put(message)
+        if self._ui_wakeup_pending.is_set():
+            return # A wakeup is already on its way; it will drain this message too
+        self._ui_wakeup_pending.set()
+        if self._threaded_tcl:
+            try:
+                self.event_generate(UI_WAKEUP_EVENT, when="tail")
+            except (tk.TclError, RuntimeError) as e:
+                # View destroyed or main loop gone; the fallback poll picks it up if still alive
+                logger.debug(f"Could not generate UI wakeup event: {e}")
+
+    def _on_ui_wakeup(self, event=None):
+        """Handles the wakeup event: drain the queue now instead of at the next poll."""
+        if self._queue_check_id is not None:
+            self.after_cancel(self._queue_check_id)
+            self._queue_check_id = None
+        self._check_stream_queue()
+
+    def _schedule_queue_check(self, delay_ms):
+        """Schedules _check_stream_queue unless a check is already pending."""
+        if self._queue_check_id is None:
+            self._queue_check_id = self.after(delay_ms, self._check_stream_queue)
 
     def _check_stream_queue(self):
-        """Periodically check the queue for updates from worker threads."""
+        """Drain the queue, coalescing stream chunks within a frame budget."""
+        self._queue_check_id = None
+        # Clear before draining so a message queued during the drain triggers a new wakeup
+        self._ui_wakeup_pending.clear()
+        deadline = time.perf_counter() + STREAM_FRAME_BUDGET
+        pending_chunks = {} # {message id: [chunks]}
         try:
-            while True:
+            while time.perf_counter() < deadline:
                 message = self.stream_queue.get_nowait()
-                msg_type = message.get("type")
-
-                if msg_type == "models_result":
-                    self._update_models_dropdown(message["models"])
-                elif msg_type == "models_error":
-                    self._update_models_dropdown(None, error=message["error"])
-                elif msg_type == "stream_clear_placeholder":
-                     if self.current_assistant_message_id:
-                          msg_tag = f"msg_{self.current_assistant_message_id}"
-                          ranges = self.chat_display.tag_ranges(msg_tag)
-                          if ranges:
-                              role_tag = f"msg_{self.current_assistant_message_id}_role"
-                              role_ranges = self.chat_display.tag_ranges(role_tag)
-                              content_start_index = role_ranges[1] if role_ranges else ranges[0]
-                              if self.chat_display.get(content_start_index, ranges[1]).strip() == "...":
-                                 self.chat_display.config(state="normal")
-                                 self.chat_display.delete(content_start_index, ranges[1])
-                                 # Adjust ranges AFTER deletion
-                                 new_end_pos = content_start_index # Placeholder content is gone
-                                 self.chat_display.tag_remove(msg_tag, ranges[0], ranges[1])
-                                 self.chat_display.tag_add(msg_tag, ranges[0], new_end_pos)
-                                 self.chat_display.tag_remove("message_block", ranges[0], ranges[1])
-                                 self.chat_display.tag_add("message_block", ranges[0], new_end_pos)
-                                 self.chat_display.config(state="disabled")
-                                 logger.debug("Cleared placeholder '...'")
-
-                elif msg_type == "stream_chunk":
-                    self._append_stream_chunk(message["chunk"])
-                elif msg_type == "stream_end":
-                     # Important: Add to history *before* finalizing display
-                     if self.current_assistant_message_id: # Check if still relevant
-                        self.chat_history.append({"role": "assistant", "content": message["full_content"]})
-                        self._finalize_assistant_message()
-                        logger.debug("Stream ended successfully.")
-                     else:
-                        logger.warning("Stream ended but no current assistant message ID. Response lost?")
-
-                elif msg_type == "stream_error":
-                     error_msg = message["error"]
-                     # Add error message to display, but NOT to persistent history
-                     self._add_error_message(f"Assistant Error: {error_msg}")
-                     if self.current_assistant_message_id:
-                         # Remove the "..." placeholder line entirely on error
-                         msg_tag = f"msg_{self.current_assistant_message_id}"
-                         ranges = self.chat_display.tag_ranges(msg_tag)
-                         if ranges:
-                             # Check if it's still just the placeholder
-                             role_tag = f"msg_{self.current_assistant_message_id}_role"
-                             role_ranges = self.chat_display.tag_ranges(role_tag)
-                             content_start_index = role_ranges[1] if role_ranges else ranges[0]
-                             if self.chat_display.get(content_start_index, ranges[1]).strip() == "...":
-                                 self.chat_display.config(state="normal")
-                                 self.chat_display.delete(ranges[0], ranges[1]) # Delete whole line
-                                 self.chat_display.config(state="disabled")
-                                 logger.debug("Removed placeholder '...' on stream error.")
-
-                     self.current_assistant_message_id = None # Reset on error
-                     logger.error(f"Stream error processed: {error_msg}")
-
+                if message.get("type") == "stream_chunk":
+                    # Merge consecutive chunks of each answer into a single insert for this frame
+                    pending_chunks.setdefault(message["message_id"], []).append(message["chunk"])
+                else:
+                    self._flush_pending_chunks(pending_chunks)
+                    self._handle_queue_message(message)
                 self.stream_queue.task_done()
         except queue.Empty:
             pass
         finally:
-            self.after(100, self._check_stream_queue)
+            self._flush_pending_chunks(pending_chunks)
+            if not self.stream_queue.empty():
+                # Out of budget with work left: yield to the event loop, then continue right away
+                self._schedule_queue_check(1)
+            elif self._active_workers > 0:
+                # Fallback poll while requests are in flight; stops completely when idle
+                self._schedule_queue_check(QUEUE_POLL_FALLBACK_MS if self._threaded_tcl else QUEUE_POLL_NO_EVENTS_MS)
+
+    def _flush_pending_chunks(self, pending_chunks):
+        """Appends the chunks collected in this frame as one piece of text per answer."""
+        if not pending_chunks:
+            return
+        stats = self.stream_frame_stats
+        merged = sum(len(chunks) for chunks in pending_chunks.values())
+        stats["frames"] += 1
+        stats["chunks"] += merged
+        stats["last_merged"] = merged
+        stats["max_merged"] = max(stats["max_merged"], merged)
+        for message_id, chunks in pending_chunks.items():
+            request = self._streams.get(message_id)
+            if request is not None: # Otherwise stopped meanwhile
+                self._append_stream_chunk(request, "".join(chunks))
+            elif message_id in self._comparison_panes:
+                self._comparison_panes[message_id].append("".join(chunks))
+        pending_chunks.clear()
+
+    def get_stream_frame_stats(self):
+        """Returns counters of stream chunks merged per UI frame (for diagnostics)."""
+        stats = dict(self.stream_frame_stats)
+        stats["avg_merged"] = stats["chunks"] / stats["frames"] if stats["frames"] else 0.0
+        return stats
+
+    def _record_latency(self, timings, outcome="ok"):
+        """Adds a finished request to the latency stats and shows it in the status line."""
+        metrics = self.latency_stats.record(timings, outcome)
+        percentiles = self.latency_stats.percentiles(timings.endpoint, timings.model)
+        self.latency_status.config(text=describe_latency(metrics, percentiles))
+
+    def get_latency_stats(self, api_url=None, model=None):
+        """Returns latency percentiles (ms, tokens/s) of recent requests.
+
+        With api_url and/or model only matching requests are included;
+        ``get_latency_stats()["last"]`` holds the latest request's metrics.
+        """
+        endpoint = api_url.rstrip("/") if api_url else None
+        return {"last": self.latency_stats.last,
+                "percentiles": self.latency_stats.percentiles(endpoint, model),
+                "by_model": self.latency_stats.summary()}
+
+    def _handle_queue_message(self, message):
+        """Dispatches a single non-chunk message from the worker threads."""
+        msg_type = message.get("type")
+        request = None
+        if msg_type.startswith("stream_"):
+            request = self._streams.get(message.get("message_id"))
+            if request is None:
+                pane = self._comparison_panes.get(message.get("message_id"))
+                if pane is not None:
+                    self._handle_comparison_message(pane, message)
+                else:
+                    logger.debug(f"Ignoring {msg_type} of a stopped answer.")
+                return
+
+        if msg_type == "worker_done":
+            self._active_workers = max(0, self._active_workers - 1)
+        elif msg_type == "compaction_result":
+            self._compaction_in_flight = False
+            # Ignore results for a history that has changed meanwhile (e.g. cleared)
+            if history_key(self.chat_history[:message["upto"]]) == message["key"]:
+                self._apply_compaction(message["upto"], message["key"], message["summary"])
+        elif msg_type == "compaction_error":
+            self._compaction_in_flight = False
+        elif msg_type == "highlight_result":
+            self._highlight_in_flight = False
+            self._apply_highlighting(message["results"])
+            self._schedule_highlighting()
+        elif msg_type == "models_result":
+            self._models_fetch_in_flight = False
+            self._update_models_dropdown(message["models"])
+        elif msg_type == "models_error":
+            self._models_fetch_in_flight = False
+            if message.get("cached_models"):
+                # Offline or server trouble: keep showing the cached list
+                logger.warning(f"Model refresh failed, keeping cached list: {message['error']}")
+                self._update_models_dropdown(message["cached_models"])
+            else:
+                self._update_models_dropdown(None, error=message["error"])
+        elif msg_type == "explain_definitions":
+            self._queue_explanation(message["text"], message["source"], message["force_refresh"],
+                                    message["definitions"])
+        elif msg_type == "stream_parts_progress":
+            self._set_placeholder_text(
+                request.message_id, PROGRESS_PLACEHOLDER_TEXT.format(done=message["done"], total=message["total"]))
+
+        elif msg_type == "stream_parts_done":
+            # All parts explained: stream the answer in the same slot
+            _, source, _ = request.explain_selection
+            request.explain_selection = None
+            if message["parts"]:
+                from thonnycontrib.ai_chat.chunking import build_synthesis_messages
+                request.messages = build_synthesis_messages(
+                    message["parts"], message["explanations"], source, self.system_language)
+            self._set_placeholder_text(request.message_id, PLACEHOLDER_TEXT)
+            self._start_stream(request)
+
+        elif msg_type == "stream_snippets":
+            # Project snippets looked up: the chat notes where they are from, above the question
+            request.snippet_query = None
+            request.attachment = message["attachment"] or None
+            if message["sources"]:
+                self._add_message_to_display(
+                    "info", "Sending project excerpts with the question: " + ", ".join(message["sources"]),
+                    message_id=self._new_message_id("info"), before=self._message_id_for(request.user_entry))
+            if any(retriever.stale for retriever in self.retrievers.values()):
+                self._schedule_retrieval_refresh() # A snippet's file changed since it was indexed
+            self._start_stream(request)
+
+        elif msg_type == "stream_waiting":
+            # Paced or retried instead of failing: say why the answer has not started
+            if message.get("reason") is not None or request.explain_selection is None:
+                self._set_placeholder_text(request.message_id, self._waiting_text(message))
+
+        elif msg_type == "stream_clear_placeholder":
+             if self._set_placeholder_text(request.message_id, ""):
+                 logger.debug("Cleared placeholder '...'")
+
+        elif msg_type == "stream_end":
+             # Important: Fill in the history entry *before* finalizing display
+             content = message["full_content"]
+             self._complete_history_entry(request.entry, content)
+             if request.cache_key and content:
+                 self.explain_cache.put(request.cache_key, content)
+             self._finalize_assistant_message(request)
+             request.timings.update(message.get("timings"), message.get("tokens"), message.get("endpoint"))
+             request.timings.mark("finalized")
+             self._record_latency(request.timings)
+             self._finish_request(request)
+             logger.debug("Stream ended successfully.")
+             self._maybe_start_compaction()
+
+        elif msg_type == "stream_error":
+             error_msg = message["error"]
+             self._flush_stream_renderer(request) # Keep the partial answer readable
+             # Add error message to display, but NOT to persistent history
+             self._add_error_message(f"Assistant Error: {error_msg}")
+             # Remove the "..." placeholder line entirely on error
+             self._remove_placeholder_message(request.message_id)
+             self._remove_history_entry(request.entry) # Never cache or keep a failed answer
+             request.timings.update(message.get("timings"), message.get("tokens"), message.get("endpoint"))
+             self._record_latency(request.timings, "error")
+             self._finish_request(request)
+             logger.error(f"Stream error processed: {error_msg}")
+
+    # --- Model comparison ---
+    def _get_compare_models(self):
+        models = self.workbench.get_option(CONFIG_COMPARE_MODELS, []) or []
+        return list(models) or [self.selected_model.get()]
+
+    def _open_comparison(self):
+        """Opens a comparison window for the question in the input box."""
+        prompt = self.user_input.get("1.0", "end-1c").strip()
+        if not prompt:
+            messagebox.showinfo("Compare Models", "Type a question first; it is sent to every selected model.")
+            return
+        if not self.api_url.get().strip() or not self.api_key.get().strip():
+            messagebox.showerror("Missing Info", "Please configure API URL and Key.")
+            return
+        ComparisonWindow(self.workbench, self, prompt)
+
+    def _start_comparison(self, window, models):
+        """Streams window.prompt from every model at once; each answer goes to its own column."""
+        self.workbench.set_option(CONFIG_COMPARE_MODELS, list(models))
+        api_url = self.api_url.get().strip()
+        api_key = self.api_key.get().strip()
+        # The question is only added to chat_history if an answer is kept
+        context_messages = self._build_context_window() + [{"role": "user", "content": window.prompt}]
+        for model in models:
+            message_id = self._new_message_id("compare")
+            pane = window.add_pane(message_id, model, api_url)
+            self._comparison_panes[message_id] = pane
+            # Each column measures one model on the configured endpoint, so no failover here
+            self._start_worker(
+                self._stream_chat_worker,
+                ([Endpoint(api_url, api_key)], model, context_messages, message_id, pane.cancel_token),
+            )
+        logger.info(f"Comparing {len(models)} models.")
+
+    def _waiting_text(self, message):
+        """Placeholder text for a stream_waiting message (the plain one when the wait is over)."""
+        if message.get("reason") is None:
+            return PLACEHOLDER_TEXT
+        seconds = f" {message['seconds']} s" if message.get("seconds") else ""
+        return WAITING_PLACEHOLDER_TEXT.format(seconds=seconds, reason=message["reason"])
+
+    def _handle_comparison_message(self, pane, message):
+        msg_type = message["type"]
+        if msg_type == "stream_waiting":
+            pane.show_waiting(self._waiting_text(message) if message.get("reason") else None)
+        elif msg_type == "stream_end":
+            pane.finish()
+            self._comparison_panes.pop(pane.message_id, None)
+            pane.timings.update(message.get("timings"), message.get("tokens"))
+            pane.timings.mark("finalized")
+            self.latency_stats.record(pane.timings) # Comparisons feed the per-model percentiles too
+        elif msg_type == "stream_error":
+            pane.fail(message["error"])
+            self._comparison_panes.pop(pane.message_id, None)
+            pane.timings.update(message.get("timings"), message.get("tokens"))
+            self.latency_stats.record(pane.timings, "error")
+
+    def _end_comparison(self, window):
+        """Stops the streams of a closed comparison window."""
+        for message_id, pane in window.panes.items():
+            pane.cancel_token.cancel()
+            self._comparison_panes.pop(message_id, None)
+
+    def _keep_comparison_answer(self, prompt, model, content):
+        """Adds the question and the chosen model's answer to the conversation."""
+        if self.user_input.get("1.0", "end-1c").strip() == prompt:
+            self.user_input.delete("1.0", "end") # The question has been answered
+        self._ensure_window_at_latest()
+        user_msg_id = self._new_message_id("user")
+        self._append_history("user", prompt, user_msg_id)
+        self._add_message_to_display("user", prompt, message_id=user_msg_id)
+        msg_id = self._new_message_id("assistant")
+        self._append_history("assistant", content, msg_id)
+        self._add_message_to_display("assistant", content, message_id=msg_id, marker=model)
+        self._maybe_start_compaction()
 
     # --- Context Menu Actions for Chat Display ---
     def _show_context_menu(self, event):
         """Display the context menu at the clicked position."""
         try:
             current_index = self.chat_display.index(f"@{event.x},{event.y}")
-            tags_here = self.chat_display.tag_names(current_index)
+            # Remember the click position; a mark follows the text if the display changes
+            self.chat_display.mark_set(CONTEXT_MENU_MARK, current_index)
 
-            is_in_code_block = "code_block" in tags_here or "code_content" in tags_here
+            is_in_code_block = self._code_block_tag_at(current_index) is not None
             self.context_menu.entryconfig("Copy Code Block", state="normal" if is_in_code_block else "disabled")
 
             has_selection = bool(self.chat_display.tag_ranges("sel"))
             self.context_menu.entryconfig("Copy Selection", state="normal" if has_selection else "disabled")
 
-            is_in_message = any(tag.startswith("msg_") for tag in tags_here) or "message_block" in tags_here
+            is_in_message = self._message_id_at(current_index) is not None
             self.context_menu.entryconfig("Copy Message (Markdown)", state="normal" if is_in_message else "disabled")
             self.context_menu.entryconfig("Copy Message (Text)", state="normal" if is_in_message else "disabled")
 
+            record = self._message_index.get(self._message_id_at(current_index))
+            is_cached_answer = bool(record and record.get("explain"))
+            self.context_menu.entryconfig("Refresh Cached Answer", state="normal" if is_cached_answer else "disabled")
+            is_active_answer = self._message_id_at(current_index) in self._streams
+            self.context_menu.entryconfig("Stop This Answer", state="normal" if is_active_answer else "disabled")
+
             self.context_menu.tk_popup(event.x_root, event.y_root)
         except Exception as e:
              logger.error(f"Error showing context menu: {e}", exc_info=True)
@@ -1018,19 +2926,18 @@ class AIChatView(ttk.Frame):
         except Exception as e:
             logger.error(f"Failed to copy selection: {e}", exc_info=True)
 
+    def _context_menu_index(self):
+        """Index where the context menu was opened (falls back to the mouse position)."""
+        if CONTEXT_MENU_MARK in self.chat_display.mark_names():
+            return self.chat_display.index(CONTEXT_MENU_MARK)
+        return self.chat_display.index(tk.CURRENT)
+
     def _copy_code_block(self):
         try:
-            current_index = self.chat_display.index(tk.CURRENT)
-            ranges = self.chat_display.tag_ranges("code_content")
-            target_range = None
-            for i in range(0, len(ranges), 2):
-                 start, end = ranges[i], ranges[i+1]
-                 if self.chat_display.compare(current_index, ">=", start) and \
-                    self.chat_display.compare(current_index, "<=", end): # Use <= for end
-                     target_range = (start, end)
-                     break
-            if target_range:
-                code_text = self.chat_display.get(target_range[0], target_range[1])
+            block_tag = self._code_block_tag_at(self._context_menu_index())
+            ranges = self.chat_display.tag_ranges(block_tag) if block_tag else ()
+            if ranges:
+                code_text = self.chat_display.get(ranges[0], ranges[-1])
                 self.clipboard_clear()
                 self.clipboard_append(code_text)
                 logger.debug("Copied code block to clipboard.")
@@ -1040,45 +2947,22 @@ class AIChatView(ttk.Frame):
             logger.error(f"Failed to copy code block: {e}", exc_info=True)
 
     def _get_message_range_and_content(self, index):
-        """Finds the message tag, its range, and original content."""
-        tags = self.chat_display.tag_names(index)
-        msg_tag = next((tag for tag in tags if tag.startswith("msg_") and "_role" not in tag), None)
-
-        if msg_tag:
+        """Finds the message tag, its range, and original content via the message index."""
+        msg_id = self._message_id_at(index)
+        if msg_id:
+            msg_tag = f"msg_{msg_id}"
             ranges = self.chat_display.tag_ranges(msg_tag)
             if ranges:
-                role = msg_tag.split('_')[1]
-                msg_index_str = msg_tag.split('_')[-1]
-                original_content = f"[Could not find original message for {msg_tag}]"
-                display_text = "[Error getting display text]"
                 try:
-                    role_tag = f"{msg_tag}_role"
-                    role_ranges = self.chat_display.tag_ranges(role_tag)
+                    role_ranges = self.chat_display.tag_ranges(f"{msg_tag}_role")
                     content_start_index = role_ranges[1] if role_ranges else ranges[0]
                     display_text = self.chat_display.get(content_start_index, ranges[1]).strip()
 
-                    try:
-                         msg_num = int(msg_index_str)
-                         history_idx = -1
-                         count = -1
-                         target_role = 'user' if role == 'user' else ('assistant' if role == 'asst' else None)
-
-                         if target_role:
-                             for i, msg in enumerate(self.chat_history):
-                                 if msg['role'] == target_role:
-                                     count += 1
-                                     if count == msg_num:
-                                         history_idx = i
-                                         break
-                         if history_idx != -1:
-                            original_content = self.chat_history[history_idx]['content']
-                         elif role == 'error': # Errors aren't in history
-                             original_content = display_text
-
-                    except (ValueError, IndexError) as e_hist:
-                         logger.warning(f"Could not parse index or find message in history for {msg_tag}: {e_hist}")
-                         original_content = display_text # Fallback
-
+                    record = self._message_index.get(msg_id)
+                    if record and record["entry"] is not None and not record["entry"].get("_pending"):
+                        original_content = record["entry"]["content"]
+                    else:
+                        original_content = display_text # e.g. an answer that is still streaming
                     return ranges, original_content, display_text
                 except Exception as e_disp:
                     logger.error(f"Error finding message details for {msg_tag}: {e_disp}", exc_info=True)
@@ -1086,8 +2970,7 @@ class AIChatView(ttk.Frame):
 
     def _copy_message(self, format="markdown"):
         try:
-            current_index = self.chat_display.index(tk.CURRENT)
-            ranges, original_content, display_text = self._get_message_range_and_content(current_index)
+            ranges, original_content, display_text = self._get_message_range_and_content(self._context_menu_index())
             if ranges:
                 content_to_copy = original_content if format == "markdown" else display_text
                 self.clipboard_clear()
@@ -1099,13 +2982,15 @@ class AIChatView(ttk.Frame):
             logger.error(f"Failed to copy message: {e}", exc_info=True)
 
     # --- Method called by Explain context menu ---
-    def explain_this(self, text_to_explain, source):
-        """Receives text from editor/shell and initiates explanation."""
-        logger.info(f"Received text from {source} for explanation.")
+    def explain_this(self, text_to_explain, source, force_refresh=False):
+        """Receives text from editor/shell and initiates explanation.
 
-        if self.streaming_thread and self.streaming_thread.is_alive():
-             messagebox.showwarning("Busy", "AI Chat is busy. Please wait.")
-             return
+        Answers are cached by request content; a hit is shown immediately with
+        a "cached" marker unless force_refresh is set.
+        """
+        from thonnycontrib.ai_chat.chunking import is_large as is_large_selection
+        logger.info(f"Received text from {source} for explanation.")
+        self._ensure_started()
 
         api_url = self.api_url.get().strip()
         api_key = self.api_key.get().strip()
@@ -1115,28 +3000,79 @@ class AIChatView(ttk.Frame):
              messagebox.showerror("Missing Info", "Please configure AI Chat API URL, Key, and select a valid Model.")
              return
 
+        if self._get_definitions_budget() and not is_large_selection(text_to_explain):
+            # Large selections usually contain their helpers; the parts are explained on their own
+            near_path, buffer_text = self._current_buffer()
+            if near_path is not None:
+                # Parsing the project files happens in a worker; the explanation is queued when they are found
+                self._start_worker(self._definitions_worker,
+                                   (text_to_explain, source, force_refresh, self._get_definitions_budget(),
+                                    near_path, buffer_text))
+                return
+        self._queue_explanation(text_to_explain, source, force_refresh)
+
+    def _queue_explanation(self, text_to_explain, source, force_refresh, definitions=""):
+        """Shows a cached explanation of the selection or queues a request for it."""
+        from thonnycontrib.ai_chat.chunking import is_large as is_large_selection
+        api_url = self.api_url.get().strip()
+        api_key = self.api_key.get().strip()
+        model = self.selected_model.get()
+
         # Construct the prompt (Instruction in English, mentioning target language)
         prompt = (f"Explain the following {source} selection "
                   f"(please respond in {self.system_language}):\n\n"
                   f"```\n{text_to_explain}\n```")
+        if definitions:
+            prompt += f"\n\nDefinitions it uses, for reference:\n\n{definitions}"
+
+        # Attached definitions are part of the key: an edited helper gets a new answer
+        cache_key = response_key(api_url, model, self._get_system_prompt(),
+                                 text_to_explain + (f"\n\n{definitions}" if definitions else ""), source)
+        if force_refresh:
+            # The old answer is not served again, even if the new one fails or is stopped
+            self.explain_cache.invalidate(cache_key)
+            cached_answer = None
+        else:
+            cached_answer = self.explain_cache.get(cache_key)
+        logger.debug(f"Explain cache {'hit' if cached_answer is not None else 'miss'}: {self.explain_cache.stats}")
+
+        if cached_answer is not None:
+            # Add explanation request to history (as user role for context)
+            self._ensure_window_at_latest()
+            user_msg_id = self._new_message_id("user")
+            self._append_history("user", prompt, user_msg_id)
+            self._add_message_to_display("user", prompt, message_id=user_msg_id)
+            self._show_cached_answer(cached_answer, text_to_explain, source)
+            return
 
-        # Add explanation request to history (as user role for context)
-        user_msg_id = f"user_{len(self.chat_history)}"
-        self.chat_history.append({"role": "user", "content": prompt})
-        self._add_message_to_display("user", prompt, message_id=user_msg_id)
-
-        # Prepare placeholder for assistant response
-        self.current_assistant_message_id = f"asst_{len(self.chat_history)}"
-        self._add_message_to_display("assistant", "...", message_id=self.current_assistant_message_id)
-
-        # Start streaming request
-        logger.debug("Starting stream worker for explanation request.")
-        self.streaming_thread = threading.Thread(
-            target=self._stream_chat_worker,
-            args=(api_url, api_key, model, list(self.chat_history)), # Send copy
-            daemon=True
-        )
-        self.streaming_thread.start()
+        # Queue the request; explanations wait behind questions typed into the chat
+        logger.debug("Queueing explanation request.")
+        explain_selection = None
+        if is_large_selection(text_to_explain):
+            # Explained part by part first, then as a whole (split in the worker thread)
+            explain_selection = (text_to_explain, source, force_refresh)
+        self._submit_request(prompt, f"Explain {_short_label(text_to_explain)}", PRIORITY_EXPLAIN,
+                             api_url, api_key, model, cache_key, explain_selection)
+
+    def _show_cached_answer(self, content, text_to_explain, source):
+        """Replays a cached explanation through the normal history/display path."""
+        msg_id = self._new_message_id("assistant")
+        self._append_history("assistant", content, msg_id)
+        self._add_message_to_display("assistant", content, message_id=msg_id, marker="cached")
+        self._register_message(msg_id)["explain"] = (text_to_explain, source)
+        self._maybe_start_compaction()
+
+    def _refresh_cached_answer(self):
+        """Asks the model again for a cached explanation, replacing the cache entry."""
+        record = self._message_index.get(self._message_id_at(self._context_menu_index()))
+        if record and record.get("explain"):
+            text_to_explain, source = record["explain"]
+            self.explain_this(text_to_explain, source, force_refresh=True)
+
+    def get_explain_cache_stats(self):
+        """Returns hit/miss counters of the explain answer cache (for tuning)."""
+        self._ensure_started()
+        return self.explain_cache.get_stats()
 
     def destroy(self):
         """Called when the view is closed."""
@@ -1144,6 +3080,25 @@ class AIChatView(ttk.Frame):
         _ai_chat_view_visible = False # Update state when closed
         logger.info(f"{VIEW_ID} destroy method called, setting _ai_chat_view_visible to False.")
         self._save_settings() # Save settings on close
+        # Stop every answer before the connections and the history database go away
+        self._cancel_all_requests(note=False)
+        for pane in list(self._comparison_panes.values()):
+            pane.cancel_token.cancel()
+        self._comparison_panes.clear()
+        if self._compaction_token is not None:
+            self._compaction_token.cancel()
+        if self._queue_check_id is not None:
+            self.after_cancel(self._queue_check_id)
+            self._queue_check_id = None
+        self.http_pool.shutdown() # Close keep-alive connections
+        if self._started:
+            try:
+                self.workbench.unbind("Save", self._on_editor_saved)
+            except Exception as e:
+                logger.debug(f"Could not unbind Save handler: {e}")
+        if self.history_store:
+            self.history_store.close()
+            self.history_store = None
         super().destroy()
 
 # --- Toggle Function (Robust Version) ---
@@ -1178,6 +3133,11 @@ def toggle_ai_chat_view():
          _ai_chat_view_visible = False # Reset state defensively
 
 # --- Context Menu Helpers and Handlers ---
+def _short_label(text, limit=24):
+    """First line of text, shortened for the queue status line."""
+    line = text.strip().splitlines()[0] if text.strip() else ""
+    return line if len(line) <= limit else line[:limit - 3] + "..."
+
 def _has_selection(widget):
     """Checks if a Text widget has selected text."""
     if not isinstance(widget, tk.Text): return False
@@ -1346,8 +3306,9 @@ def load_plugin():
 
     workbench = get_workbench()
     if workbench is None: return
-    try: import requests
-    except ImportError: # ... (handle missing requests) ...
+    # Only check that requests is installed; importing it is left to the first request
+    if importlib.util.find_spec("requests") is None:
+        logger.error("The 'requests' package is not installed; AI Chat is disabled.")
         return
 
     # 1. Register the View itself
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""Support modules for the AI Chat plugin (thonnycontrib.AIChatView).
+
+Thonny imports every top-level module in ``thonnycontrib`` at startup, so this
+package must stay cheap to import. The view imports the light submodules when
+it loads; those that need ast, tokenize, mmap, SQLite or requests are imported
+on first use, mostly in worker threads (benchmarks/bench_startup.py checks).
+"""
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Cooperative cancellation of streaming requests."""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class CancelToken:
+    """Cancellation flag for one streaming request.
+
+    The worker attaches its open HTTP response; cancel() (from any thread)
+    sets the flag and closes the response, so a read blocked in
+    ``iter_lines()`` returns at once instead of waiting for the server.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._response = None
+        self._children = [] # Tokens cancelled together with this one
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def attach(self, response):
+        with self._lock:
+            self._response = response
+            cancelled = self._event.is_set()
+        if cancelled:
+            _close_response(response)
+
+    def detach(self):
+        with self._lock:
+            self._response = None
+
+    def wait(self, timeout):
+        """Sleeps up to timeout seconds; True (at once) if the request is cancelled."""
+        return self._event.wait(timeout)
+
+    def child(self):
+        """A token for one of several attempts at the request; cancelled with this one, or on its own."""
+        child = CancelToken()
+        with self._lock:
+            self._children.append(child)
+            cancelled = self._event.is_set()
+        if cancelled:
+            child.cancel()
+        return child
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            response = self._response
+            children = list(self._children)
+        if response is not None:
+            _close_response(response)
+        for child in children:
+            child.cancel()
+
+
+def set_read_timeout(response, seconds):
+    """Changes the read timeout of a streaming response's socket (e.g. once the first byte arrived)."""
+    try:
+        connection = getattr(response.raw, "connection", None) or getattr(response.raw, "_connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is not None:
+            sock.settimeout(seconds)
+    except Exception as e:
+        logger.debug(f"Could not change the read timeout: {e}")
+
+
+def _close_response(response):
+    # close() alone does not wake a thread blocked in recv(); shutting the
+    # socket down does, so the reader sees EOF immediately.
+    import socket # Loaded by requests already; not needed at plugin import
+    try:
+        connection = getattr(response.raw, "connection", None) or getattr(response.raw, "_connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+    except Exception as e:
+        logger.debug(f"Could not shut down the socket of a cancelled response: {e}")
+    try:
+        response.close()
+    except Exception as e:
+        logger.debug(f"Error closing cancelled response: {e}")
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""Splitting of large selections into parts for map-reduce explanations.
+
+Python code is cut at top-level statements, so functions and classes stay
+whole; a class too big for one part is cut between its members. Code that
+does not parse (or is not Python) is cut at blank lines.
+
+Consecutive units are grouped into parts at content-defined boundaries: a
+part ends after a unit whose hash hits BOUNDARY_MODULUS, or before it would
+grow past MAX_PART_LINES. Where a part ends therefore depends on nearby code
+only. After a small edit most parts keep their exact text, and with it their
+cached explanation.
+"""
+import ast
+import hashlib
+import textwrap
+
+LARGE_SELECTION_LINES = 150 # Larger selections are explained in parts
+LARGE_SELECTION_CHARS = 8000
+MIN_PART_LINES = 30
+MAX_PART_LINES = 150
+BOUNDARY_MODULUS = 3
+
+PART_INSTRUCTIONS = (
+    "You explain one part of a larger {source} selection to a programmer. "
+    "Say briefly what this part does: its functions and classes, their inputs "
+    "and outputs, and anything notable. Write in {language}. Be concise."
+)
+SYNTHESIS_PROMPT = (
+    "A {source} selection of {lines} lines was explained in {count} parts. "
+    "Using the part explanations below, explain the whole selection: its "
+    "purpose, how the parts work together, and anything notable. Do not "
+    "explain each part again one by one. Please respond in {language}."
+)
+
+
+class SelectionPart:
+    """A contiguous piece of the selection."""
+
+    def __init__(self, text, first_line, last_line, title):
+        self.text = text
+        self.first_line = first_line # 1-based, inclusive, within the selection
+        self.last_line = last_line
+        self.title = title # e.g. "def load, class Parser"
+
+
+def is_large(text):
+    return text.count("\n") + 1 > LARGE_SELECTION_LINES or len(text) > LARGE_SELECTION_CHARS
+
+
+def split_selection(text):
+    """Returns the SelectionParts of text (a single part if it is small)."""
+    code = textwrap.dedent(text.replace("\r\n", "\n").replace("\r", "\n"))
+    lines = code.splitlines(keepends=True)
+    if not lines:
+        return []
+    units = _python_units(code, lines)
+    if units is None:
+        units = _paragraph_units(lines)
+    units = [piece for unit in units for piece in _split_oversized(unit)]
+    return _group(units, lines)
+
+
+def _python_units(code, lines):
+    """(start, end, title) line ranges (0-based, end exclusive) of top-level statements; None if code does not parse."""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+    if not tree.body:
+        return None
+    units = []
+    for node in tree.body:
+        start, end = _node_lines(node)
+        if isinstance(node, ast.ClassDef) and end - start > MAX_PART_LINES and len(node.body) > 1:
+            # Cut between members; the class header goes with the first one
+            member_start = start
+            for member in node.body[1:]:
+                boundary = _node_lines(member)[0]
+                units.append((member_start, boundary, f"class {node.name}"))
+                member_start = boundary
+            units.append((member_start, end, f"class {node.name}"))
+        else:
+            units.append((start, end, _title(node)))
+
+    # Comments and blank lines before a statement belong to it; trailing ones to the last
+    covered = []
+    previous_end = 0
+    for start, end, title in units:
+        covered.append((previous_end, max(end, previous_end), title))
+        previous_end = max(end, previous_end)
+    start, _, title = covered[-1]
+    covered[-1] = (start, len(lines), title)
+    return covered
+
+
+def _node_lines(node):
+    first = min([node.lineno] + [decorator.lineno for decorator in getattr(node, "decorator_list", [])])
+    return first - 1, node.end_lineno
+
+
+def _title(node):
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        return f"def {node.name}"
+    if isinstance(node, ast.ClassDef):
+        return f"class {node.name}"
+    return "module code"
+
+
+def _paragraph_units(lines):
+    """Units ending at blank lines."""
+    units = []
+    start = 0
+    for index, line in enumerate(lines):
+        if not line.strip() and index + 1 > start:
+            units.append((start, index + 1, "text"))
+            start = index + 1
+    if start < len(lines):
+        units.append((start, len(lines), "text"))
+    return units
+
+
+def _split_oversized(unit):
+    start, end, title = unit
+    if end - start <= MAX_PART_LINES:
+        return [unit]
+    return [(piece, min(end, piece + MAX_PART_LINES), title) for piece in range(start, end, MAX_PART_LINES)]
+
+
+def _is_boundary(text):
+    digest = hashlib.sha1(text.rstrip().encode("utf-8", "surrogatepass")).digest()
+    return int.from_bytes(digest[:4], "big") % BOUNDARY_MODULUS == 0
+
+
+def _group(units, lines):
+    parts = []
+    group = []
+
+    def close():
+        if group:
+            start, end = group[0][0], group[-1][1]
+            titles = []
+            for _, _, title in group:
+                if title not in titles:
+                    titles.append(title)
+            title = ", ".join(titles[:3]) + (f", +{len(titles) - 3} more" if len(titles) > 3 else "")
+            parts.append(SelectionPart("".join(lines[start:end]), start + 1, end, title))
+            group.clear()
+
+    for unit in units:
+        start, end, _ = unit
+        if group and end - group[0][0] > MAX_PART_LINES:
+            close()
+        group.append(unit)
+        if end - group[0][0] >= MIN_PART_LINES and _is_boundary("".join(lines[start:end])):
+            close()
+    close()
+    return parts
+
+
+def build_part_messages(part, source, language):
+    """Builds the request messages explaining one part (streamed, so Stop can interrupt it)."""
+    return [
+        {"role": "system", "content": PART_INSTRUCTIONS.format(source=source, language=language)},
+        {"role": "user", "content": f"```\n{part.text}\n```"},
+    ]
+
+
+def build_synthesis_messages(parts, explanations, source, language):
+    """Builds the messages asking for one explanation of the whole selection from the part explanations."""
+    sections = [SYNTHESIS_PROMPT.format(source=source, lines=parts[-1].last_line, count=len(parts), language=language)]
+    for part, explanation in zip(parts, explanations):
+        sections.append(f"Lines {part.first_line}-{part.last_line} ({part.title}):\n{explanation}")
+    return [{"role": "user", "content": "\n\n".join(sections)}]
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Summarizing ("compacting") the oldest part of a long conversation.
+
+The view asks the model for a summary in a background request; once ready,
+the summary replaces the summarized turns in the request payload. The chat
+display is never changed.
+"""
+import hashlib
+
+from thonnycontrib.ai_chat.context_window import message_tokens
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+SUMMARY_INSTRUCTIONS = (
+    "You compress chat transcripts between a user and a coding assistant. "
+    "Summarize the conversation below so the assistant can continue it: keep "
+    "the user's goals, decisions, names of files, functions and variables, and "
+    "any code that is still relevant. Write in {language}. Be concise."
+)
+
+
+def history_key(entries):
+    """Stable content hash of a list of history entries."""
+    digest = hashlib.sha1()
+    for entry in entries:
+        digest.update(entry["role"].encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(entry["content"].encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def plan_compaction(history, threshold_tokens, covered=0):
+    """Decides how many of the oldest entries should be summarized.
+
+    Compaction starts once the history is larger than threshold_tokens and
+    keeps roughly the newest half of the threshold verbatim. The cut is moved
+    forward to a user message so a question and its answer stay together.
+
+    Returns the new number of covered entries, or 0 if nothing new should be
+    summarized (less than or equal to ``covered``).
+    """
+    if threshold_tokens <= 0:
+        return 0
+    total = sum(message_tokens(entry) for entry in history)
+    if total <= threshold_tokens:
+        return 0
+    keep_tokens = threshold_tokens // 2
+    kept = 0
+    cut = len(history)
+    while cut > 0 and kept + message_tokens(history[cut - 1]) <= keep_tokens:
+        cut -= 1
+        kept += message_tokens(history[cut])
+    while cut < len(history) - 1 and history[cut]["role"] != "user":
+        cut += 1
+    if cut < 2 or cut <= covered:
+        return 0
+    return cut
+
+
+def build_summary_messages(entries, previous_summary, language):
+    """Builds the (non-streaming) request messages asking for a summary."""
+    parts = []
+    if previous_summary:
+        parts.append(SUMMARY_PREFIX + previous_summary)
+    for entry in entries:
+        parts.append(f"{entry['role'].capitalize()}: {entry['content']}")
+    return [
+        {"role": "system", "content": SUMMARY_INSTRUCTIONS.format(language=language)},
+        {"role": "user", "content": "\n\n".join(parts)},
+    ]
+
+
+def summary_message(summary):
+    """History-shaped entry carrying a summary into the request payload."""
+    return {"role": "system", "content": SUMMARY_PREFIX + summary}
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Token-budgeted selection of the chat history sent with each request.
+
+Token counts are estimated (no tokenizer dependency): roughly four ASCII
+characters per token, one token per non-ASCII character, plus a small
+per-message overhead. The estimate is cached on each history entry.
+"""
+TOKENS_CACHE_KEY = "_tokens"
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text):
+    """Cheap, tokenizer-free estimate of the token count of text."""
+    if not text:
+        return 0
+    non_ascii = len(text) - len(text.encode("ascii", "ignore"))
+    ascii_chars = len(text) - non_ascii
+    return (ascii_chars + 3) // 4 + non_ascii
+
+
+def message_tokens(entry):
+    """Returns the (cached) token estimate of one history entry."""
+    tokens = entry.get(TOKENS_CACHE_KEY)
+    if tokens is None:
+        tokens = estimate_tokens(entry.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+        entry[TOKENS_CACHE_KEY] = tokens
+    return tokens
+
+
+def select_context(history, budget_tokens, reserved_tokens=0):
+    """Picks the most recent history entries that fit the budget.
+
+    Args:
+        history: list of {"role", "content"} dicts, oldest first.
+        budget_tokens: total token budget for the prompt.
+        reserved_tokens: tokens already used (e.g. by the system prompt).
+
+    Returns:
+        (start, used_tokens): history[start:] is the window to send. The newest
+        entry is always included, and the window never starts with an
+        assistant reply whose question was dropped.
+    """
+    available = budget_tokens - reserved_tokens
+    used = 0
+    start = len(history)
+    for i in range(len(history) - 1, -1, -1):
+        tokens = message_tokens(history[i])
+        if used + tokens > available and start < len(history):
+            break
+        used += tokens
+        start = i
+    while 0 < start < len(history) - 1 and history[start].get("role") == "assistant":
+        used -= message_tokens(history[start])
+        start += 1
+    return start, used
+
+
+def to_api_messages(entries):
+    """Strips cached bookkeeping keys so only role/content reach the API."""
+    return [{"role": entry["role"], "content": entry["content"]} for entry in entries]
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""Client-side pacing of API requests: rate limit, Retry-After, backoff and stream slots.
+
+Many copies of the plugin may share one API key (a classroom). Instead
+of sending every request at once and showing the provider's 429 as an
+error, requests go through a RequestGovernor:
+
+* a token bucket per API key keeps to an optional requests-per-minute
+  limit, allowing a short burst,
+* a Retry-After from a 429 or 503 holds back every request with that key
+  until then,
+* failures worth another try (429, 5xx) are retried after a jittered,
+  exponentially growing delay, so retries of many clients spread out,
+* at most a given number of answers stream from one endpoint at a time.
+
+Waiting goes through a ``wait(seconds, reason)`` callback, so a worker
+can show why an answer has not started and stop waiting when it is
+cancelled (the callback returns False). ``seconds`` is None while
+waiting for something without a known end (a free stream slot), and
+``wait(0, None)`` says the waiting is over.
+"""
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+MAX_RETRIES = 3 # Further tries after the first request
+BASE_BACKOFF = 1.0 # Seconds before the first retry (jittered), doubled per retry...
+MAX_BACKOFF = 30.0 # ... up to this
+MAX_RETRY_AFTER = 120.0 # A longer Retry-After is reported instead of waited for
+BURST_SECONDS = 10 # The bucket holds this many seconds' worth of requests
+SLOT_POLL = 0.1 # Seconds between checks for a free stream slot
+
+REASON_RATE = "keeping to the request rate of the API key"
+REASON_RETRY_AFTER = "the API asked to wait"
+REASON_SLOTS = "other answers are streaming from this endpoint"
+REASON_BUSY = "the API is busy ({status})"
+
+
+def parse_retry_after(value, now=None):
+    """Seconds from a Retry-After header (delay or HTTP date); None if missing or invalid."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    import email.utils # Only HTTP dates need it; most servers send seconds
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+
+def backoff_delay(retry, retry_after=None, rng=random):
+    """Seconds to wait before retry number retry + 1.
+
+    Half the exponential delay is fixed and half random, so the retries of
+    clients that failed together do not arrive together again. A
+    Retry-After wins, with up to a second of spread added.
+    """
+    if retry_after is not None:
+        return retry_after + rng.uniform(0, 1)
+    delay = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** retry)
+    return delay / 2 + rng.uniform(0, delay / 2)
+
+
+def sleep_wait(seconds, reason):
+    """Default wait callback: just sleeps."""
+    if reason is not None:
+        time.sleep(SLOT_POLL if seconds is None else seconds)
+    return True
+
+
+class RequestCancelled(Exception):
+    """The wait callback gave up (the request was stopped)."""
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, up to burst at once."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def reserve(self, now):
+        """Takes a token; returns the seconds until it is actually available (0 = now)."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1 # May go negative: the request is booked for later
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RequestGovernor:
+    """Paces the requests of all workers; thread-safe."""
+
+    def __init__(self, requests_per_minute=0, streams_per_endpoint=0):
+        self._lock = threading.Lock()
+        self._buckets = {} # {api_key: TokenBucket}
+        self._blocked_until = {} # {api_key: time.monotonic()} from Retry-After
+        self._streams = {} # {api_url: answers streaming}
+        self.requests_per_minute = 0
+        self.streams_per_endpoint = 0 # 0 = no cap
+        self.stats = {"waits": 0, "waited_s": 0.0, "retries": 0, "retry_after": 0}
+        self.configure(requests_per_minute, streams_per_endpoint)
+
+    def configure(self, requests_per_minute, streams_per_endpoint):
+        with self._lock:
+            if requests_per_minute != self.requests_per_minute:
+                self._buckets.clear()
+            self.requests_per_minute = max(0, requests_per_minute)
+            self.streams_per_endpoint = max(0, streams_per_endpoint)
+
+    def _reserve(self, api_key):
+        now = time.monotonic()
+        with self._lock:
+            delay = max(0.0, self._blocked_until.get(api_key, 0.0) - now)
+            if delay:
+                return delay, REASON_RETRY_AFTER
+            if not self.requests_per_minute:
+                return 0.0, None
+            bucket = self._buckets.get(api_key)
+            if bucket is None:
+                rate = self.requests_per_minute / 60
+                bucket = self._buckets[api_key] = TokenBucket(rate, max(1, round(rate * BURST_SECONDS)))
+            return bucket.reserve(now), REASON_RATE
+
+    def wait_turn(self, api_url, api_key, wait=sleep_wait):
+        """Blocks until a request with api_key may be sent; False if wait gave up."""
+        waited = False
+        while True:
+            delay, reason = self._reserve(api_key)
+            if delay <= 0:
+                break
+            logger.info(f"Waiting {delay:.1f} s before a request to {api_url}: {reason}.")
+            with self._lock:
+                self.stats["waits"] += 1
+                self.stats["waited_s"] += delay
+            if not wait(delay, reason):
+                return False
+            waited = True
+            if reason == REASON_RATE:
+                break # The token was booked for this moment
+        return wait(0, None) if waited else True
+
+    def note_retry_after(self, api_key, seconds):
+        """Holds back every request with api_key for seconds (capped at MAX_RETRY_AFTER)."""
+        if seconds is None:
+            return
+        until = time.monotonic() + min(seconds, MAX_RETRY_AFTER)
+        with self._lock:
+            self._blocked_until[api_key] = max(until, self._blocked_until.get(api_key, 0.0))
+            self.stats["retry_after"] += 1
+
+    def acquire_stream(self, api_url, wait=sleep_wait):
+        """Takes one of the endpoint's stream slots; False if wait gave up. Pair with release_stream."""
+        waited = False
+        while True:
+            with self._lock:
+                streams = self._streams.get(api_url, 0)
+                if not self.streams_per_endpoint or streams < self.streams_per_endpoint:
+                    self._streams[api_url] = streams + 1
+                    break
+            if not wait(None, REASON_SLOTS):
+                return False
+            waited = True
+        if waited and not wait(0, None):
+            self.release_stream(api_url)
+            return False
+        return True
+
+    def release_stream(self, api_url):
+        with self._lock:
+            streams = self._streams.get(api_url, 0) - 1
+            if streams > 0:
+                self._streams[api_url] = streams
+            else:
+                self._streams.pop(api_url, None)
+
+    def retry_delay(self, retry, retry_after=None):
+        """Seconds to wait before the next try of a failed request, or None to give up."""
+        if retry >= MAX_RETRIES or (retry_after is not None and retry_after > MAX_RETRY_AFTER):
+            return None
+        with self._lock:
+            self.stats["retries"] += 1
+        return backoff_delay(retry, retry_after)
+
+    def call(self, api_url, api_key, send, wait=sleep_wait):
+        """Sends a non-streaming request with send() (a requests call), paced and retried.
+
+        Returns the last response; its status is for the caller to check.
+        Raises RequestCancelled if wait gave up.
+        """
+        retry = 0
+        while True:
+            if not self.wait_turn(api_url, api_key, wait):
+                raise RequestCancelled()
+            response = send()
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            self.note_retry_after(api_key, retry_after)
+            delay = self.retry_delay(retry, retry_after)
+            if delay is None:
+                return response
+            response.close()
+            logger.warning(f"{api_url} answered {response.status_code}; retrying in {delay:.1f} s.")
+            if not wait(delay, REASON_BUSY.format(status=response.status_code)):
+                raise RequestCancelled()
+            retry += 1
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, streams=dict(self._streams),
+                        blocked_keys=sum(1 for until in self._blocked_until.values() if until > time.monotonic()))
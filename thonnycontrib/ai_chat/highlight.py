@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""Syntax highlighting of code blocks as ``(start, end, tag)`` character spans.
+
+Python (and unlabelled blocks, this being a Python IDE) is tokenized with
+the standard ``tokenize`` module. Other languages are highlighted with
+Pygments if it is installed, and left plain otherwise.
+
+Spans are computed off the Tk thread and applied by the view in one batch.
+Python highlighting can also resume: ``highlight()`` returns a checkpoint,
+the start of the last top-level statement, before which the spans can no
+longer change while more lines of a streamed block arrive. The next call
+only tokenizes the text from there on.
+"""
+import builtins
+import hashlib
+import io
+import keyword
+import threading
+from collections import OrderedDict
+
+KEYWORD = "hl_keyword"
+BUILTIN = "hl_builtin"
+STRING = "hl_string"
+COMMENT = "hl_comment"
+NUMBER = "hl_number"
+DEFINITION = "hl_definition" # Name after def / class
+DECORATOR = "hl_decorator"
+TOKEN_TAGS = (KEYWORD, BUILTIN, STRING, COMMENT, NUMBER, DEFINITION, DECORATOR)
+
+PYTHON_LANGUAGES = frozenset(["", "python", "py", "python3", "py3", "pycon", "ipython"])
+DEFAULT_CACHE_ENTRIES = 512
+
+_BUILTINS = frozenset(name for name in dir(builtins) if not name.startswith("_"))
+_STRING_TOKENS = None # Token types, set when tokenize is first imported (see _tokenize_module)
+_LINE_START_TOKENS = None
+_OPENING = frozenset("([{")
+_CLOSING = frozenset(")]}")
+
+
+def is_python(language):
+    return (language or "").lower() in PYTHON_LANGUAGES
+
+
+def cache_key(code, language):
+    """Hash identifying a complete code block for the span cache."""
+    return hashlib.sha1(f"{(language or '').lower()}\0{code}".encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def highlight(code, language):
+    """Returns (spans, checkpoint) for code; spans before checkpoint are final."""
+    if is_python(language):
+        return python_spans(code)
+    return pygments_spans(code, language), 0
+
+
+def _tokenize_module():
+    """tokenize, imported by the first highlighting worker rather than when Thonny loads the plugin."""
+    global _STRING_TOKENS, _LINE_START_TOKENS
+    import tokenize
+    if _LINE_START_TOKENS is None:
+        _STRING_TOKENS = frozenset(getattr(tokenize, name) for name in ("STRING", "FSTRING_START", "FSTRING_MIDDLE", "FSTRING_END")
+                                   if hasattr(tokenize, name)) # f-string tokens exist from Python 3.12 on
+        _LINE_START_TOKENS = frozenset([tokenize.NEWLINE, tokenize.NL, tokenize.INDENT, tokenize.DEDENT])
+    return tokenize
+
+
+def python_spans(code):
+    """Tokenizes Python code. Incomplete or invalid code keeps the spans found before the error."""
+    tokenize = _tokenize_module()
+    line_starts = [0]
+    for line in code.splitlines(keepends=True):
+        line_starts.append(line_starts[-1] + len(line))
+
+    def offset(position):
+        row, col = position
+        return line_starts[row - 1] + col if row - 1 < len(line_starts) else len(code)
+
+    spans = []
+    checkpoint = 0
+    depth = 0 # Open brackets
+    previous = None # Previous significant token
+    statement_start = True # The next token starts a logical line
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            token_type = token.type
+            if token_type in _LINE_START_TOKENS:
+                if token_type == tokenize.NEWLINE:
+                    statement_start = True
+                continue
+            if token_type == tokenize.ENDMARKER:
+                break
+            if statement_start and depth == 0 and token.start[1] == 0 and token_type != tokenize.COMMENT:
+                # A top-level statement starts here; tokenizing can resume from this line
+                checkpoint = line_starts[token.start[0] - 1]
+            if token_type != tokenize.COMMENT:
+                statement_start = False
+
+            tag = None
+            text = token.string
+            if token_type == tokenize.NAME:
+                if keyword.iskeyword(text):
+                    tag = KEYWORD
+                elif previous is not None and previous.string in ("def", "class") and previous.type == tokenize.NAME:
+                    tag = DEFINITION
+                elif previous is not None and previous.string == "@" and previous.type == tokenize.OP:
+                    tag = DECORATOR
+                elif text in _BUILTINS and not (previous is not None and previous.string == "."):
+                    tag = BUILTIN
+            elif token_type in _STRING_TOKENS:
+                tag = STRING
+            elif token_type == tokenize.COMMENT:
+                tag = COMMENT
+            elif token_type == tokenize.NUMBER:
+                tag = NUMBER
+            elif token_type == tokenize.OP:
+                if text in _OPENING:
+                    depth += 1
+                elif text in _CLOSING:
+                    depth = max(0, depth - 1)
+                elif text == "@" and (previous is None or previous.start[0] != token.start[0]):
+                    tag = DECORATOR
+            if tag is not None:
+                spans.append((offset(token.start), offset(token.end), tag))
+            if token_type != tokenize.COMMENT:
+                previous = token
+    except (tokenize.TokenError, SyntaxError):
+        pass # Unterminated string or bracket, inconsistent dedent, ...: keep what was found
+    return spans, checkpoint
+
+
+def pygments_spans(code, language):
+    """Highlights code with Pygments; no spans if it is not installed or does not know the language."""
+    try:
+        from pygments.lexers import get_lexer_by_name
+        from pygments.token import Comment, Keyword, Name, Number, String
+        from pygments.util import ClassNotFound
+    except ImportError: # Optional dependency
+        return []
+    try:
+        lexer = get_lexer_by_name(language)
+    except ClassNotFound:
+        return []
+    token_tags = ((Comment, COMMENT), (String, STRING), (Number, NUMBER), (Keyword, KEYWORD),
+                  (Name.Decorator, DECORATOR), (Name.Function, DEFINITION), (Name.Class, DEFINITION),
+                  (Name.Builtin, BUILTIN))
+    spans = []
+    for start, token_type, value in lexer.get_tokens_unprocessed(code):
+        for pygments_type, tag in token_tags:
+            if token_type in pygments_type:
+                spans.append((start, start + len(value), tag))
+                break
+    return spans
+
+
+class HighlightCache:
+    """Thread-safe LRU of span lists keyed by cache_key() of complete code blocks."""
+
+    def __init__(self, max_entries=DEFAULT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key):
+        with self._lock:
+            spans = self._entries.get(key)
+            if spans is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return spans
+
+    def put(self, key, spans):
+        with self._lock:
+            self._entries[key] = spans
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries))
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Durable, append-only chat history stored in SQLite (WAL mode).
+
+Each message is one INSERT, so saving never rewrites the growing
+conversation. An answer that is still streaming is inserted empty (to keep
+its place) and filled in by one UPDATE. Reads are paged from the newest
+message backwards and skip empty rows.
+"""
+import logging
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id INTEGER NOT NULL REFERENCES conversations(id),
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_conversation ON messages(conversation_id, id);
+"""
+
+
+class ChatHistoryStore:
+    """Stores conversations as rows of (id, role, content). Use from one thread."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL") # Durable enough for chat, no fsync per message
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def latest_conversation(self):
+        """Returns the id of the most recent conversation, creating one if there is none."""
+        row = self._conn.execute("SELECT MAX(id) FROM conversations").fetchone()
+        if row and row[0] is not None:
+            return row[0]
+        return self.new_conversation()
+
+    def new_conversation(self):
+        cursor = self._conn.execute("INSERT INTO conversations (started) VALUES (?)", (time.time(),))
+        self._conn.commit()
+        return cursor.lastrowid
+
+    def append(self, conversation_id, role, content):
+        """Appends one message and returns its row id."""
+        cursor = self._conn.execute(
+            "INSERT INTO messages (conversation_id, role, content, created) VALUES (?, ?, ?, ?)",
+            (conversation_id, role, content, time.time()))
+        self._conn.commit()
+        return cursor.lastrowid
+
+    def update(self, message_id, content):
+        """Sets the content of a message inserted before its text was known."""
+        self._conn.execute("UPDATE messages SET content = ? WHERE id = ?", (content, message_id))
+        self._conn.commit()
+
+    def delete_message(self, message_id):
+        self._conn.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+        self._conn.commit()
+
+    def load_page(self, conversation_id, before_id=None, limit=50):
+        """Returns up to limit messages older than before_id (or the newest ones), oldest first.
+
+        Each message is a dict with "role", "content" and "_db_id".
+        """
+        if before_id is None:
+            rows = self._conn.execute(
+                "SELECT id, role, content FROM messages WHERE conversation_id = ? AND content != '' "
+                "ORDER BY id DESC LIMIT ?", (conversation_id, limit)).fetchall()
+        else:
+            rows = self._conn.execute(
+                "SELECT id, role, content FROM messages WHERE conversation_id = ? AND id < ? AND content != '' "
+                "ORDER BY id DESC LIMIT ?", (conversation_id, before_id, limit)).fetchall()
+        return [{"role": role, "content": content, "_db_id": row_id} for row_id, role, content in reversed(rows)]
+
+    def has_older(self, conversation_id, before_id):
+        row = self._conn.execute(
+            "SELECT 1 FROM messages WHERE conversation_id = ? AND id < ? AND content != '' LIMIT 1",
+            (conversation_id, before_id)).fetchone()
+        return row is not None
+
+    def delete_conversation(self, conversation_id):
+        self._conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+        self._conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+        self._conn.commit()
+
+    def close(self):
+        try:
+            self._conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Error closing chat history store: {e}")
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Keep-alive HTTP sessions shared by the chat and model-list workers.
+
+Every request to the same API URL reuses one ``requests.Session`` so the TCP
+connection (and TLS handshake) is paid once instead of once per question.
+"""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# One host per session; a few connections so a model refresh can run next to a chat stream.
+# The view sizes the pool for the streams it allows; connections beyond it are discarded after use
+POOL_CONNECTIONS = 1
+POOL_MAXSIZE = 4
+
+
+def _make_session(pool_maxsize):
+    # requests is imported on first use (in a worker thread), not when Thonny loads the plugin
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=pool_maxsize,
+        pool_block=False,
+        max_retries=0, # Never silently resend a chat request
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class SessionPool:
+    """Thread-safe map of (API URL, API key) to a pooled ``requests.Session``."""
+
+    def __init__(self, pool_maxsize=POOL_MAXSIZE):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._closed = False
+        self.pool_maxsize = pool_maxsize # Connections kept open per endpoint
+
+    def configure(self, pool_maxsize):
+        """Changes the connections kept per endpoint; existing sessions are replaced on next use."""
+        with self._lock:
+            changed = pool_maxsize != self.pool_maxsize
+            self.pool_maxsize = pool_maxsize
+        if changed:
+            self.reset()
+
+    def get(self, api_url, api_key):
+        """Returns the session for this endpoint, creating it on first use."""
+        key = (api_url.rstrip("/"), api_key)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("HTTP session pool has been shut down.")
+            session = self._sessions.get(key)
+            if session is None:
+                logger.debug(f"Creating pooled HTTP session for {key[0]}")
+                session = _make_session(self.pool_maxsize)
+                self._sessions[key] = session
+            return session
+
+    def reset(self):
+        """Closes all sessions, e.g. after the API URL or key changed. The pool stays usable."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            try:
+                session.close()
+            except Exception as e:
+                logger.warning(f"Error closing HTTP session: {e}")
+
+    def shutdown(self):
+        """Closes all sessions and refuses new ones."""
+        with self._lock:
+            self._closed = True
+        self.reset()
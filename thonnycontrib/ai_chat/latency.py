@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Latency timings of chat requests and rolling percentiles per endpoint and model.
+
+Timestamps are ``time.perf_counter()`` values. The worker thread records
+when it started, when the response headers arrived ("connected": DNS,
+TCP/TLS for a new connection and the server's own queueing), the first
+byte of the body and the first and last token it parsed. The view adds
+when the request was queued, when the first token was displayed and when
+the answer was finalized.
+"""
+import collections
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+EVENTS = ("queued", "started", "connected", "first_byte", "first_token", "first_displayed", "last_token", "finalized")
+
+# Derived metric: (from event, to event)
+INTERVALS = {
+    "queue_wait_ms": ("queued", "started"), # Waiting for a free stream slot
+    "connect_ms": ("started", "connected"), # Until the response headers arrived
+    "first_byte_ms": ("connected", "first_byte"),
+    "ttft_ms": ("started", "first_token"), # Time to first token, from the request being sent
+    "display_lag_ms": ("first_token", "first_displayed"), # Worker -> Tk thread -> Text widget
+    "time_to_display_ms": ("queued", "first_displayed"), # What the user waits before text appears
+    "stream_ms": ("first_token", "last_token"),
+    "finalize_ms": ("last_token", "finalized"),
+    "total_ms": ("queued", "finalized"),
+}
+
+PERCENTILES = (50, 90, 99)
+DEFAULT_WINDOW = 200 # Samples kept per endpoint and model
+
+
+class RequestTimings:
+    """Timestamps of one request; each event is recorded once (the first time)."""
+
+    def __init__(self, api_url, model):
+        self.endpoint = (api_url or "").rstrip("/")
+        self.model = model
+        self.marks = {} # {event: perf_counter()}
+        self.tokens = 0 # Content chunks received
+
+    def mark(self, event, when=None):
+        if event not in self.marks:
+            self.marks[event] = time.perf_counter() if when is None else when
+
+    def update(self, marks, tokens=None, endpoint=None):
+        """Adds the marks recorded by the worker thread (and the endpoint that answered, after a failover)."""
+        for event, when in (marks or {}).items():
+            self.mark(event, when)
+        if tokens is not None:
+            self.tokens = tokens
+        if endpoint:
+            self.endpoint = endpoint.rstrip("/")
+
+    def metrics(self, outcome="ok"):
+        """Derived durations (ms, rounded) plus tokens/s; intervals with a missing end are left out."""
+        result = {"endpoint": self.endpoint, "model": self.model, "outcome": outcome, "tokens": self.tokens}
+        for name, (start, end) in INTERVALS.items():
+            if start in self.marks and end in self.marks:
+                result[name] = round((self.marks[end] - self.marks[start]) * 1000, 1)
+        stream_seconds = result.get("stream_ms", 0) / 1000
+        if self.tokens > 1 and stream_seconds > 0:
+            result["tokens_per_s"] = round((self.tokens - 1) / stream_seconds, 1)
+        return result
+
+
+class LatencyStats:
+    """Recent request metrics per (endpoint, model), with percentiles over a rolling window."""
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self._samples = {} # {(endpoint, model): deque of metrics dicts}
+        self.last = None # Metrics of the latest recorded request
+
+    def record(self, timings, outcome="ok"):
+        """Stores and logs the metrics of a finished request; returns them."""
+        metrics = timings.metrics(outcome)
+        key = (timings.endpoint, timings.model)
+        self._samples.setdefault(key, collections.deque(maxlen=self.window)).append(metrics)
+        self.last = metrics
+        # One JSON object per request; handlers can also use record.ai_chat_timings
+        logger.info(f"Request timings {json.dumps(metrics, sort_keys=True)}", extra={"ai_chat_timings": metrics})
+        return metrics
+
+    def percentiles(self, endpoint=None, model=None):
+        """{metric: {"p50": ..., "p90": ..., "p99": ..., "count": n}} over the matching samples.
+
+        Only successful requests count. endpoint/model None match any.
+        """
+        samples = [metrics for (sample_endpoint, sample_model), entries in self._samples.items()
+                   if endpoint in (None, sample_endpoint) and model in (None, sample_model)
+                   for metrics in entries if metrics["outcome"] == "ok"]
+        result = {}
+        for name in list(INTERVALS) + ["tokens_per_s"]:
+            values = sorted(metrics[name] for metrics in samples if name in metrics)
+            if values:
+                summary = {f"p{pct}": _nearest_rank(values, pct) for pct in PERCENTILES}
+                summary["count"] = len(values)
+                result[name] = summary
+        return result
+
+    def summary(self):
+        """{"model @ endpoint": percentiles} for every endpoint and model seen."""
+        return {f"{model} @ {endpoint}": self.percentiles(endpoint, model) for endpoint, model in self._samples}
+
+
+def describe(metrics, percentiles=None):
+    """One-line summary of a request's metrics for the status line."""
+    if metrics["outcome"] != "ok":
+        total = metrics.get("total_ms") or metrics.get("ttft_ms")
+        return f"{metrics['model']}: failed" + (f" after {total / 1000:.2f} s" if total else "")
+    parts = []
+    if "connect_ms" in metrics:
+        parts.append(f"connect {metrics['connect_ms']:.0f} ms")
+    if "ttft_ms" in metrics:
+        parts.append(f"first token {metrics['ttft_ms'] / 1000:.2f} s")
+    if "tokens_per_s" in metrics:
+        parts.append(f"{metrics['tokens_per_s']:.0f} tok/s")
+    if "display_lag_ms" in metrics:
+        parts.append(f"display {metrics['display_lag_ms']:.0f} ms")
+    if "total_ms" in metrics:
+        parts.append(f"total {metrics['total_ms'] / 1000:.2f} s")
+    text = f"{metrics['model']}: " + ", ".join(parts)
+    ttft = (percentiles or {}).get("ttft_ms")
+    if ttft and ttft["count"] > 1:
+        text += f" (median first token {ttft['p50'] / 1000:.2f} s over {ttft['count']})"
+    return text
+
+
+def _nearest_rank(sorted_values, pct):
+    rank = max(1, -(-len(sorted_values) * pct // 100)) # ceil(n * pct / 100)
+    return sorted_values[rank - 1]
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""Incremental Markdown renderer for the chat display.
+
+The renderer turns raw Markdown text into ``(text, tags)`` segments that can be
+inserted into a Tk Text widget in a single call. It keeps its parse state
+between calls to :meth:`StreamingMarkdownRenderer.feed`, so a streamed answer
+is tokenized exactly once and never needs to be reformatted at the end.
+
+Supported syntax matches what the chat view always supported:
+fenced code blocks (```), **bold**, *italic* and _italic_. Emphasis spans
+at most MAX_EMPHASIS_CHARS characters; a marker without a closing one
+within that distance is plain text (e.g. the ``*`` in ``2 * 3``), so a
+streamed line never holds back more than that.
+"""
+import re
+
+MAX_EMPHASIS_CHARS = 250
+
+# Same inline rules as the original regex-based formatter. The alternation
+# keeps the old priority: at the same position bold wins over italic.
+_SPAN = f"(.{{0,{MAX_EMPHASIS_CHARS}}}?)"
+_INLINE_RE = re.compile(
+    rf"\*\*{_SPAN}\*\*"
+    rf"|(?<!\*)\*(?!\*|_){_SPAN}(?<!\*)\*(?!\*|_)"
+    rf"|(?<!_)_(?!_|\*){_SPAN}(?<!_)_(?!_|\*)"
+)
+# Characters after a marker that decide whether it opens a span: two-character
+# opening, the longest content, closing, and the character the closing checks
+_MARKER_LOOKAHEAD = MAX_EMPHASIS_CHARS + 5
+_MARKER_RE = re.compile(r"[*_]")
+_FENCE_OPEN_RE = re.compile(r"^\s*```[\w+.#-]*\s*$")
+_FENCE_CLOSE_RE = re.compile(r"^\s*```\s*$")
+
+CODE_TAGS = ("code_block", "code_content")
+CODE_BLOCK_TAGS = ("code_block",)
+NO_TAGS = ()
+
+
+class StreamingMarkdownRenderer:
+    """Stateful, line-oriented Markdown tokenizer.
+
+    ``feed()`` returns only the segments that can no longer change. Text that
+    may still turn out to be a marker (e.g. a lone ``*`` or the start of a
+    code fence) is held back until enough input arrives; ``close()`` flushes it.
+    """
+
+    def __init__(self, block_tag_prefix=None):
+        """
+        Args:
+            block_tag_prefix: If given, the content of each code block also gets
+                its own tag ``f"{block_tag_prefix}{n}"`` (listed in ``block_tags``),
+                so a click can be mapped to its block without scanning. The
+                fence's language (lowercase, "" if none) is kept in
+                ``block_languages[tag]``.
+        """
+        self._line = ""        # Current (incomplete) line
+        self._pos = 0          # Characters of _line already emitted
+        self._in_code = False
+        self._code_newline_pending = False  # Newline after the last code line
+        self._block_tag_prefix = block_tag_prefix
+        self._code_tags = CODE_TAGS
+        self.block_tags = []
+        self.block_languages = {} # {block tag: language of the fence}
+
+    @property
+    def in_code_block(self):
+        return self._in_code
+
+    def feed(self, chunk):
+        """Consumes a chunk of text and returns the finished segments."""
+        segments = []
+        if not chunk:
+            return segments
+        parts = chunk.split("\n")
+        for part in parts[:-1]:
+            self._line += part
+            self._finish_line(segments, had_newline=True)
+        self._line += parts[-1]
+        self._render_partial(segments)
+        return segments
+
+    def close(self):
+        """Flushes any held-back text at the end of the message."""
+        segments = []
+        if self._line or self._pos:
+            self._finish_line(segments, had_newline=False)
+        if self._in_code and self._code_newline_pending:
+            segments.append(("\n", CODE_BLOCK_TAGS))
+        self._in_code = False
+        self._code_newline_pending = False
+        return segments
+
+    def render(self, text):
+        """Renders a complete message in one go."""
+        return self.feed(text) + self.close()
+
+    # --- Internals ---
+    def _finish_line(self, segments, had_newline):
+        line = self._line
+        if self._in_code:
+            if self._pos == 0 and _FENCE_CLOSE_RE.match(line):
+                if self._code_newline_pending:
+                    segments.append(("\n", CODE_BLOCK_TAGS))
+                self._in_code = False
+                self._code_newline_pending = False
+                if had_newline:
+                    segments.append(("\n", NO_TAGS))
+            else:
+                self._emit_code(segments, line[self._pos:])
+                if had_newline:
+                    self._code_newline_pending = True
+        elif self._pos == 0 and _FENCE_OPEN_RE.match(line):
+            # The fence line collapses into a single blank line
+            self._in_code = True
+            self._code_newline_pending = False
+            if self._block_tag_prefix is not None:
+                block_tag = f"{self._block_tag_prefix}{len(self.block_tags)}"
+                self.block_tags.append(block_tag)
+                self.block_languages[block_tag] = line.strip()[3:].strip().lower()
+                self._code_tags = CODE_TAGS + (block_tag,)
+            segments.append(("\n", NO_TAGS))
+        else:
+            self._pos = _render_inline(line, self._pos, True, segments)
+            if had_newline:
+                segments.append(("\n", NO_TAGS))
+        self._line = ""
+        self._pos = 0
+
+    def _render_partial(self, segments):
+        line = self._line
+        if self._pos == 0 and _could_be_fence(line, self._in_code):
+            return
+        if self._in_code:
+            if len(line) > self._pos:
+                self._emit_code(segments, line[self._pos:])
+                self._pos = len(line)
+        else:
+            self._pos = _render_inline(line, self._pos, False, segments)
+
+    def _emit_code(self, segments, text):
+        if not text:
+            return
+        if self._code_newline_pending:
+            segments.append(("\n", self._code_tags))
+            self._code_newline_pending = False
+        segments.append((text, self._code_tags))
+
+
+def _could_be_fence(line, in_code):
+    """True while an unfinished line might still become a code fence."""
+    stripped = line.lstrip()
+    if len(stripped) < 3:
+        return "```".startswith(stripped)
+    if not stripped.startswith("```"):
+        return False
+    if in_code:
+        return not stripped[3:].strip()
+    return True
+
+
+def _render_inline(line, pos, final, segments):
+    """Emits inline-formatted segments of ``line`` starting at ``pos``.
+
+    When ``final`` is False the line may still grow, so a match is only
+    committed if no unresolved marker precedes it and its closing lookahead
+    has already seen a character. A marker that can no longer open a span
+    (_MARKER_LOOKAHEAD characters followed it) is emitted as plain text.
+    Returns the new emitted position.
+    """
+    length = len(line)
+    while pos < length:
+        match = _INLINE_RE.search(line, pos)
+        if not final:
+            marker = _MARKER_RE.search(line, pos)
+            marker_start = marker.start() if marker else length
+            if match is None or match.start() != marker_start or match.end() >= length:
+                if marker is not None and length - marker_start > _MARKER_LOOKAHEAD and (
+                        match is None or match.start() != marker_start):
+                    segments.append((line[pos:marker_start + 1], NO_TAGS))
+                    pos = marker_start + 1
+                    continue
+                if marker_start > pos:
+                    segments.append((line[pos:marker_start], NO_TAGS))
+                return marker_start
+        elif match is None:
+            segments.append((line[pos:], NO_TAGS))
+            return length
+
+        if match.start() > pos:
+            segments.append((line[pos:match.start()], NO_TAGS))
+        tag = "bold" if match.lastindex == 1 else "italic"
+        content = match.group(match.lastindex)
+        if content:
+            segments.append((content, (tag,)))
+        pos = match.end()
+    return pos
+
+
+def render_markdown(text, block_tag_prefix=None):
+    """Convenience wrapper: renders a complete Markdown string to segments."""
+    return StreamingMarkdownRenderer(block_tag_prefix).render(text)
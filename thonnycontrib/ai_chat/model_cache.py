@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""On-disk cache of the model list returned by each API URL's ``/models``.
+
+Entries remember when they were fetched and the ``ETag`` / ``Last-Modified``
+validators, so a refresh can be a cheap conditional request.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ModelCatalogCache:
+    """Thread-safe JSON file mapping API URL -> cached model list."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None # Loaded lazily on first access
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self._entries = data if isinstance(data, dict) else {}
+        except FileNotFoundError:
+            self._entries = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable model cache {self.path}: {e}")
+            self._entries = {}
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path) # Atomic, readers never see a partial file
+        except OSError as e:
+            logger.warning(f"Could not write model cache {self.path}: {e}")
+
+    @staticmethod
+    def _key(api_url):
+        return api_url.strip().rstrip("/")
+
+    def get(self, api_url):
+        """Returns a copy of the entry for api_url, or None."""
+        with self._lock:
+            self._load()
+            entry = self._entries.get(self._key(api_url))
+            return dict(entry) if entry else None
+
+    def store(self, api_url, models, etag=None, last_modified=None):
+        with self._lock:
+            self._load()
+            self._entries[self._key(api_url)] = {
+                "models": list(models),
+                "fetched_at": time.time(),
+                "etag": etag,
+                "last_modified": last_modified,
+            }
+            self._save()
+
+    def touch(self, api_url):
+        """Marks an entry as fresh again (server answered 304 Not Modified)."""
+        with self._lock:
+            self._load()
+            entry = self._entries.get(self._key(api_url))
+            if entry:
+                entry["fetched_at"] = time.time()
+                self._save()
+
+
+def is_fresh(entry, ttl_seconds):
+    """True if a cache entry is younger than ttl_seconds."""
+    if not entry:
+        return False
+    return time.time() - entry.get("fetched_at", 0) < ttl_seconds
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Encoding of chat request bodies that reuses the JSON of earlier turns.
+
+A conversation is sent again with every question: the system prompt and
+the history, plus one new turn. ``RequestBodyEncoder`` keeps the encoded
+message array of the previous request as an append-only byte buffer. The
+next request compares its messages with those and encodes only from the
+first one that differs, which is normally just the new question.
+
+Each message is compared by role and content. An edited, removed or
+summarized turn therefore differs, and the buffer is cut back to that
+point, so it never sends stale text. Messages dropped from the front by
+the context budget shift everything, so single messages are also cached
+(bounded by size) and re-joined without encoding them again.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+_json_dumps = None # Chosen on first use: orjson if installed, else json
+
+
+def _std_json_dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _get_json_dumps():
+    """The JSON encoder; orjson is imported here (in a worker thread), not when Thonny loads the plugin."""
+    global _json_dumps
+    if _json_dumps is None:
+        try:
+            import orjson # Optional dependency
+            _json_dumps = orjson.dumps
+        except ImportError:
+            _json_dumps = _std_json_dumps
+    return _json_dumps
+
+DEFAULT_CACHE_BYTES = 8 * 1024 * 1024 # Encoded single messages kept for reuse
+
+
+class RequestBodyEncoder:
+    """Builds chat completion request bodies (bytes); thread-safe."""
+
+    def __init__(self, cache_bytes=DEFAULT_CACHE_BYTES):
+        self.cache_bytes = cache_bytes
+        self._prefix = bytearray() # Encoded messages of the last request, comma separated
+        self._keys = [] # (role, content) of each message in _prefix
+        self._offsets = [] # Where each message starts in _prefix
+        self._encoded = OrderedDict() # {(role, content): bytes}, least recently used first
+        self._encoded_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "reused": 0, "cached": 0, "encoded": 0}
+
+    def encode(self, fields, messages):
+        """Returns the JSON body {**fields, "messages": messages} as bytes."""
+        head = _get_json_dumps()(fields)[:-1] # Without the closing brace
+        with self._lock:
+            self.stats["requests"] += 1
+            common = 0
+            for key, message in zip(self._keys, messages):
+                if key[0] != message["role"] or key[1] != message["content"]:
+                    break
+                common += 1
+            self.stats["reused"] += common
+            if common < len(self._keys):
+                # Edited, trimmed or a different conversation: cut back to the last shared message
+                del self._prefix[self._offsets[common] - (1 if common else 0):]
+                del self._keys[common:]
+                del self._offsets[common:]
+            for message in messages[common:]:
+                key = (message["role"], message["content"])
+                if self._prefix:
+                    self._prefix += b","
+                self._offsets.append(len(self._prefix))
+                self._prefix += self._encode_message(key, message)
+                self._keys.append(key)
+            separator = b"," if len(head) > 1 else b""
+            return b"".join((head, separator, b'"messages":[', self._prefix, b"]}"))
+
+    def _encode_message(self, key, message):
+        encoded = self._encoded.get(key)
+        if encoded is not None:
+            self._encoded.move_to_end(key)
+            self.stats["cached"] += 1
+            return encoded
+        encoded = _get_json_dumps()({"role": message["role"], "content": message["content"]})
+        self.stats["encoded"] += 1
+        if len(encoded) <= self.cache_bytes // 4:
+            self._encoded[key] = encoded
+            self._encoded_bytes += len(encoded)
+            while self._encoded_bytes > self.cache_bytes:
+                _, dropped = self._encoded.popitem(last=False)
+                self._encoded_bytes -= len(dropped)
+        return encoded
+
+    def clear(self):
+        with self._lock:
+            self._prefix = bytearray()
+            self._keys = []
+            self._offsets = []
+            self._encoded.clear()
+            self._encoded_bytes = 0
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, prefix_bytes=len(self._prefix), cached_bytes=self._encoded_bytes)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed cache of "Explain Selection" answers.
+
+The key is a hash of everything that determines the answer (API URL, model,
+system prompt, normalized selection and its source). Recent answers are kept
+in a small in-memory LRU; all answers are also written to one file per key
+in a size-capped directory, the least recently used files being removed first.
+"""
+import hashlib
+import json
+import logging
+import os
+import textwrap
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_ENTRIES = 64
+DEFAULT_DISK_LIMIT_BYTES = 16 * 1024 * 1024
+
+
+def normalize_selection(text):
+    """Normalizes a selection so whitespace-only differences share one cache entry."""
+    lines = [line.rstrip() for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n")]
+    return textwrap.dedent("\n".join(lines)).strip("\n")
+
+
+def response_key(api_url, model, system_prompt, selection, source):
+    """Stable hex key of an explain request."""
+    digest = hashlib.sha256()
+    for part in (api_url.strip().rstrip("/"), model, system_prompt, source, normalize_selection(selection)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + disk) cache mapping response_key -> answer text. Thread-safe."""
+
+    def __init__(self, directory, memory_entries=DEFAULT_MEMORY_ENTRIES, disk_limit_bytes=DEFAULT_DISK_LIMIT_BYTES):
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.disk_limit_bytes = disk_limit_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None # Total size of the cache files, computed on first write
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def _remember(self, key, content):
+        self._memory[key] = content
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Returns the cached answer for key, or None."""
+        with self._lock:
+            content = self._memory.get(key)
+            if content is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return content
+            path = self._path(key)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    content = json.load(f)["content"]
+                os.utime(path) # The mtime is the LRU clock of the disk tier
+            except FileNotFoundError:
+                self.stats["misses"] += 1
+                return None
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Ignoring unreadable cached answer {path}: {e}")
+                self.stats["misses"] += 1
+                return None
+            self._remember(key, content)
+            self.stats["disk_hits"] += 1
+            return content
+
+    def put(self, key, content):
+        with self._lock:
+            self._remember(key, content)
+            self.stats["stores"] += 1
+            path = self._path(key)
+            tmp_path = path + ".tmp"
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                if self._disk_bytes is None:
+                    self._disk_bytes = sum(size for _, size, _ in self._scan())
+                old_size = os.path.getsize(path) if os.path.exists(path) else 0
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"content": content}, f)
+                os.replace(tmp_path, path)
+                self._disk_bytes += os.path.getsize(path) - old_size
+                if self._disk_bytes > self.disk_limit_bytes:
+                    self._trim_disk()
+            except OSError as e:
+                logger.warning(f"Could not write cached answer {path}: {e}")
+
+    def invalidate(self, key):
+        """Forgets one answer (e.g. before a forced refresh)."""
+        with self._lock:
+            self._memory.pop(key, None)
+            path = self._path(key)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                if self._disk_bytes is not None:
+                    self._disk_bytes -= size
+            except OSError:
+                pass
+
+    def _scan(self):
+        """Yields (path, size, mtime) of the cache files."""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            yield path, st.st_size, st.st_mtime
+
+    def _trim_disk(self):
+        """Removes the least recently used files until the tier is below 90% of its limit."""
+        target = self.disk_limit_bytes * 9 // 10
+        for path, size, _ in sorted(self._scan(), key=lambda item: item[2]):
+            if self._disk_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._disk_bytes -= size
+            self.stats["evictions"] += 1
+
+    def get_stats(self):
+        """Returns hit/miss counters plus the hit ratio and tier sizes."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,602 @@
+# -*- coding: utf-8 -*-
+"""BM25 search over the project's Python and text files, for grounding chat questions.
+
+Files are cut into snippets of a few dozen lines (at blank lines where
+possible), and each snippet is a document of an inverted index. Identifiers
+are indexed whole and split at underscores and camelCase, so "load_config"
+also matches "config".
+
+The index of a project directory lives in one file that is memory-mapped
+read-only: integer arrays for documents and postings, and a sorted term
+table that is binary-searched. A restart maps the file instead of
+rebuilding it, so opening costs only the header.
+
+Freshness: ``refresh()`` compares every file's mtime and size with the
+index. Changed and new files are indexed into a small delta file next to
+the base index, which lists the base files it replaces or removes; a save
+rewrites only the delta. Once the delta and the base documents it hides
+reach a tenth of the base, both are merged into a new base, and once a
+quarter of a base's documents are dead it is compacted. Search results
+are checked against the file on disk, so an edit is never misquoted while
+a refresh is pending.
+
+A directory with more than ``max_files`` files to index is left out: it
+is most likely a home or downloads folder rather than a project.
+"""
+import array
+import hashlib
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import sys
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MAGIC = b"AICBM25\n"
+INDEXED_EXTENSIONS = (".py", ".pyw", ".txt", ".md", ".rst")
+SKIPPED_DIRS = frozenset(["__pycache__", "node_modules", "site-packages", "dist-packages", "build", "dist",
+                          "venv", "env"])
+MAX_FILE_BYTES = 512 * 1024
+DEFAULT_MAX_FILES = 2000 # A directory with more files to index is left out
+SNIPPET_MIN_LINES = 15 # A snippet ends at the first blank line after this many lines...
+SNIPPET_MAX_LINES = 40 # ... or here
+K1 = 1.2
+B = 0.75
+MAX_DF_FRACTION = 0.3 # Terms in more documents than this ("self", "the") are skipped when searching
+COMPACT_DEAD_FRACTION = 0.25
+DELTA_MERGE_FRACTION = 0.1 # The delta is merged into a new base at this fraction of the base's documents
+DEAD = 0xFFFFFFFF # doc_file of a document whose file changed or was deleted
+
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|[0-9]+")
+_SUBWORD_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+_ARRAY_TYPE = "I" if array.array("I").itemsize == 4 else "L"
+
+
+def terms(text):
+    """Lowercased index terms of text: words, and the parts of compound identifiers."""
+    result = []
+    for match in _WORD_RE.finditer(text):
+        word = match.group()
+        lower = word.lower()
+        if len(lower) > 1:
+            result.append(lower)
+        parts = _SUBWORD_RE.findall(word)
+        if len(parts) > 1:
+            result.extend(part.lower() for part in parts if len(part) > 1)
+    return result
+
+
+def split_snippets(text):
+    """(first_line, last_line, text) pieces of a file, 1-based and inclusive."""
+    lines = text.splitlines()
+    snippets = []
+    start = 0
+    for index, line in enumerate(lines):
+        length = index + 1 - start
+        if length >= SNIPPET_MAX_LINES or (length >= SNIPPET_MIN_LINES and not line.strip()):
+            snippets.append((start + 1, index + 1, "\n".join(lines[start:index + 1])))
+            start = index + 1
+    if start < len(lines):
+        snippets.append((start + 1, len(lines), "\n".join(lines[start:])))
+    return [snippet for snippet in snippets if snippet[2].strip()]
+
+
+def iter_indexed_files(root):
+    """Indexable files under root, skipping hidden, cache and virtual environment directories."""
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = sorted(name for name in subdirectories
+                                   if not name.startswith(".") and name not in SKIPPED_DIRS
+                                   and not os.path.exists(os.path.join(directory, name, "pyvenv.cfg")))
+        for name in sorted(files):
+            if name.endswith(INDEXED_EXTENSIONS):
+                yield os.path.join(directory, name)
+
+
+def read_text(path):
+    with open(path, "rb") as f:
+        data = f.read(MAX_FILE_BYTES + 1)
+    if len(data) > MAX_FILE_BYTES or b"\0" in data[:4096]:
+        return None # Too large, or binary
+    return data.decode("utf-8", errors="replace")
+
+
+class SearchHit:
+    """A matching snippet."""
+
+    __slots__ = ("path", "first_line", "last_line", "score", "mtime", "size")
+
+    def __init__(self, path, first_line, last_line, score, mtime, size):
+        self.path = path
+        self.first_line = first_line
+        self.last_line = last_line
+        self.score = score
+        self.mtime = mtime # Of the file when it was indexed
+        self.size = size
+
+
+class IndexSegment:
+    """A read-only, memory-mapped index file.
+
+    Layout: MAGIC, uint32 header length, JSON header (files, counts), padding
+    to 4 bytes, then uint32 arrays doc_file, doc_first, doc_last, doc_length
+    (one item per document), term_offsets and posting_starts (one per term
+    plus one), posting_docs and posting_freqs (one per posting), and finally
+    the UTF-8 term blob (terms sorted by their bytes).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header, offset = self._read_header(mapped)
+        except Exception:
+            mapped.close()
+            raise
+        self.header = header
+        self.files = header["files"] # [[path, mtime, size] or None]
+        self.doc_count = header["doc_count"]
+        self.term_count = header["term_count"]
+        self.posting_count = header["posting_count"]
+        self.live_docs = header["live_docs"]
+        self.live_length = header["live_length"]
+        # The views keep the mapping alive; it is unmapped when the last one is gone
+        view = memoryview(mapped)
+        for name, count in self._sections():
+            setattr(self, name, view[offset:offset + 4 * count].cast("I"))
+            offset += 4 * count
+        self.blob = view[offset:]
+
+    def _sections(self):
+        return (("doc_file", self.doc_count), ("doc_first", self.doc_count),
+                ("doc_last", self.doc_count), ("doc_length", self.doc_count),
+                ("term_offsets", self.term_count + 1), ("posting_starts", self.term_count + 1),
+                ("posting_docs", self.posting_count), ("posting_freqs", self.posting_count))
+
+    def _read_header(self, mapped):
+        """(header, offset of the first array); checks that the file is complete."""
+        if mapped[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not an index file")
+        start = len(MAGIC) + 4
+        header_length = int.from_bytes(mapped[len(MAGIC):start], "little")
+        header = json.loads(mapped[start:start + header_length].decode("utf-8"))
+        if header.get("version") != FORMAT_VERSION or header.get("byteorder") != sys.byteorder:
+            raise ValueError("Index file of another version or platform")
+        offset = (start + header_length + 3) // 4 * 4
+        blob_start = offset + 4 * (4 * header["doc_count"] + 2 * (header["term_count"] + 1) + 2 * header["posting_count"])
+        last_term_offset = blob_start - 4 * (2 * header["posting_count"] + header["term_count"] + 2)
+        if len(mapped) < blob_start:
+            raise ValueError("Truncated index file")
+        blob_length = int.from_bytes(mapped[last_term_offset:last_term_offset + 4], sys.byteorder)
+        if len(mapped) != blob_start + blob_length:
+            raise ValueError("Truncated index file")
+        return header, offset
+
+    def term_at(self, index):
+        return bytes(self.blob[self.term_offsets[index]:self.term_offsets[index + 1]])
+
+    def find_term(self, term_bytes):
+        """Index of term in the sorted term table, or None."""
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.term_at(middle) < term_bytes:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.term_count and self.term_at(low) == term_bytes:
+            return low
+        return None
+
+    def postings(self, term):
+        """(doc ids, frequencies) of term as uint32 views, or None."""
+        index = self.find_term(term.encode("utf-8"))
+        if index is None:
+            return None
+        start, end = self.posting_starts[index], self.posting_starts[index + 1]
+        return self.posting_docs[start:end], self.posting_freqs[start:end]
+
+
+def write_segment(path, header, docs, postings):
+    """Writes an index file atomically.
+
+    docs: (doc_file, doc_first, doc_last, doc_length) uint32 arrays;
+    postings: {term bytes: (doc id array, frequency array)}.
+    """
+    term_offsets = array.array(_ARRAY_TYPE, [0])
+    posting_starts = array.array(_ARRAY_TYPE, [0])
+    posting_docs = array.array(_ARRAY_TYPE)
+    posting_freqs = array.array(_ARRAY_TYPE)
+    blob = bytearray()
+    for term in sorted(postings):
+        doc_ids, freqs = postings[term]
+        if not doc_ids:
+            continue
+        blob += term
+        term_offsets.append(len(blob))
+        posting_docs.extend(doc_ids)
+        posting_freqs.extend(freqs)
+        posting_starts.append(len(posting_docs))
+    header = dict(header, version=FORMAT_VERSION, byteorder=sys.byteorder, doc_count=len(docs[0]),
+                  term_count=len(term_offsets) - 1, posting_count=len(posting_docs))
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(4, "little"))
+        f.write(header_bytes)
+        f.write(b"\0" * (-(len(MAGIC) + 4 + len(header_bytes)) % 4))
+        for section in list(docs) + [term_offsets, posting_starts, posting_docs, posting_freqs]:
+            section.tofile(f)
+        f.write(blob)
+    os.replace(temp_path, path)
+
+
+class ProjectRetriever:
+    """BM25 index of the files under one directory, persisted in index_dir."""
+
+    def __init__(self, root, index_dir, max_files=DEFAULT_MAX_FILES):
+        self.root = os.path.abspath(root)
+        self.index_dir = index_dir
+        self.max_files = max_files
+        self._prefix = hashlib.sha1(self.root.encode("utf-8", "surrogatepass")).hexdigest()[:16]
+        self._segment = None # Base index file
+        self._generation = 0
+        self._delta = None # Changes since the base was written, or None
+        self._dropped = frozenset() # Base file indices the delta replaced or removed
+        self._lock = threading.Lock() # Guards the four above
+        self._refresh_lock = threading.Lock() # One refresh at a time
+        self.stale = True # Files may have changed since the last refresh
+        self.too_large = False # More than max_files files to index: the directory is left out
+
+    # --- Persistence ---
+    def _segment_path(self, generation):
+        return os.path.join(self.index_dir, f"{self._prefix}.{generation}.bm25")
+
+    def _delta_path(self, generation, serial):
+        return os.path.join(self.index_dir, f"{self._prefix}.{generation}.{serial}.delta")
+
+    def _index_files(self):
+        """(base generations, {generation: delta serials}) of this directory's index files, sorted."""
+        try:
+            names = os.listdir(self.index_dir)
+        except OSError:
+            return [], {}
+        generations = []
+        deltas = {}
+        for name in names:
+            fields = name.split(".")
+            if fields[0] != self._prefix or not all(field.isdigit() for field in fields[1:-1]):
+                continue
+            if len(fields) == 3 and fields[2] == "bm25":
+                generations.append(int(fields[1]))
+            elif len(fields) == 4 and fields[3] == "delta":
+                deltas.setdefault(int(fields[1]), []).append(int(fields[2]))
+        return sorted(generations), {generation: sorted(serials) for generation, serials in deltas.items()}
+
+    def open(self):
+        """Maps the newest index file of this directory (and its delta), if there is a usable one. Returns True if so."""
+        generations, deltas = self._index_files()
+        for generation in reversed(generations):
+            try:
+                segment = IndexSegment(self._segment_path(generation))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring index file {self._segment_path(generation)}: {e}")
+                continue
+            if segment.header.get("root") != self.root:
+                continue
+            for serial in reversed(deltas.get(generation, [])):
+                try:
+                    delta = IndexSegment(self._delta_path(generation, serial))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Ignoring index file {self._delta_path(generation, serial)}: {e}")
+                    continue
+                if delta.header.get("root") == self.root and delta.header.get("base") == generation:
+                    self._swap(segment, generation, delta, serial)
+                    return True
+            self._swap(segment, generation)
+            return True
+        return False
+
+    def _swap(self, segment, generation, delta=None, serial=0):
+        # A search still using the previous files keeps them mapped until it returns
+        with self._lock:
+            self._segment = segment
+            self._generation = generation
+            self._delta = delta
+            self._dropped = frozenset(delta.header["dropped"]) if delta is not None else frozenset()
+        generations, deltas = self._index_files()
+        old_paths = [self._segment_path(old) for old in generations if old < generation]
+        old_paths += [self._delta_path(old, old_serial) for old, serials in deltas.items() for old_serial in serials
+                      if old < generation or (old == generation and old_serial < serial)]
+        for path in old_paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass # Still mapped (Windows); removed after the next refresh
+
+    def _state(self):
+        with self._lock:
+            return self._segment, self._generation, self._delta, self._dropped
+
+    # --- Building ---
+    def refresh(self, cancel_event=None):
+        """Brings the index up to date with the files on disk. Returns the number of files (re)indexed."""
+        with self._refresh_lock:
+            self.stale = False
+            segment, generation, delta, dropped = self._state()
+            indexed = {} # {path: (segment, file index, mtime, size)} of the current index
+            for current in (segment, delta):
+                if current is None:
+                    continue
+                for file_index, record in enumerate(current.files):
+                    if record is not None and not (current is segment and file_index in dropped):
+                        indexed[record[0]] = (current, file_index, record[1], record[2])
+
+            changed = []
+            seen = set()
+            for path in iter_indexed_files(self.root):
+                if cancel_event is not None and cancel_event.is_set():
+                    return 0
+                if len(seen) >= self.max_files:
+                    # Most likely not a project (a home or downloads folder): better nothing than its contents
+                    logger.warning(f"More than {self.max_files} files to index under {self.root}; leaving it out.")
+                    self.too_large = True
+                    return 0
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                seen.add(path)
+                previous = indexed.get(path)
+                if previous is None or previous[2:] != (stat.st_mtime, stat.st_size):
+                    changed.append((path, stat.st_mtime, stat.st_size))
+            self.too_large = False
+            removed = [path for path in indexed if path not in seen]
+            if segment is not None and not changed and not removed:
+                return 0
+
+            new_docs = [] # (path, mtime, size, [(first, last, Counter)])
+            for path, mtime, size in changed:
+                if cancel_event is not None and cancel_event.is_set():
+                    return 0
+                try:
+                    text = read_text(path)
+                except OSError:
+                    continue
+                # Too large or binary files are recorded without snippets, so they are not read again
+                new_docs.append((path, mtime, size, [] if text is None else
+                                 [(first, last, Counter(terms(snippet))) for first, last, snippet in split_snippets(text)]))
+            gone = [indexed[path] for path in removed] + [indexed[path] for path, _, _ in changed if path in indexed]
+            base_dropped = set(dropped).union(file_index for current, file_index, _, _ in gone if current is segment)
+            if delta is not None:
+                # The delta is small: it is rewritten with the files it already had
+                delta_dropped = set(file_index for current, file_index, _, _ in gone if current is delta)
+                new_docs = _segment_documents(delta, delta_dropped) + new_docs
+            base_totals = _base_totals(segment, base_dropped) if segment is not None else (0, 0)
+            delta_docs = sum(len(snippets) for _, _, _, snippets in new_docs)
+            if segment is None or (segment.live_docs - base_totals[0] + delta_docs
+                                   >= DELTA_MERGE_FRACTION * segment.doc_count):
+                self._write(segment, base_dropped, new_docs)
+            else:
+                self._write_delta(segment, generation, base_dropped, base_totals, new_docs)
+            logger.info(f"Retrieval index of {self.root}: {len(changed)} files (re)indexed, {len(removed)} removed.")
+            return len(changed)
+
+    def _write(self, segment, dropped_files, new_docs):
+        """Writes the next base generation: old documents (minus dropped files) plus new_docs, then maps it."""
+        if segment is not None:
+            files = list(segment.files)
+            docs = tuple(array.array(_ARRAY_TYPE, getattr(segment, name))
+                         for name in ("doc_file", "doc_first", "doc_last", "doc_length"))
+            dropped = set(dropped_files)
+            for file_index in dropped:
+                files[file_index] = None
+            doc_file = docs[0]
+            live_docs, live_length = segment.live_docs, segment.live_length
+            for doc_id, file_index in enumerate(doc_file):
+                if file_index in dropped:
+                    doc_file[doc_id] = DEAD
+                    live_docs -= 1
+                    live_length -= docs[3][doc_id]
+            postings = {}
+            for index in range(segment.term_count):
+                start, end = segment.posting_starts[index], segment.posting_starts[index + 1]
+                postings[segment.term_at(index)] = (array.array(_ARRAY_TYPE, segment.posting_docs[start:end]),
+                                                    array.array(_ARRAY_TYPE, segment.posting_freqs[start:end]))
+        else:
+            files = []
+            docs = tuple(array.array(_ARRAY_TYPE) for _ in range(4))
+            live_docs = live_length = 0
+            postings = {}
+
+        added_docs, added_length = _add_documents(files, docs, postings, new_docs)
+        live_docs += added_docs
+        live_length += added_length
+
+        if docs[0] and len(docs[0]) - live_docs >= COMPACT_DEAD_FRACTION * len(docs[0]):
+            files, docs, postings = _compact(files, docs, postings)
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        generation = (self._index_files()[0] or [0])[-1] + 1
+        path = self._segment_path(generation)
+        write_segment(path, {"root": self.root, "files": files, "live_docs": live_docs, "live_length": live_length},
+                      docs, postings)
+        self._swap(IndexSegment(path), generation)
+
+    def _write_delta(self, segment, generation, dropped_files, base_totals, new_docs):
+        """Writes the changes since the base generation to a new delta file and maps it next to the base."""
+        files = []
+        docs = tuple(array.array(_ARRAY_TYPE) for _ in range(4))
+        postings = {}
+        live_docs, live_length = _add_documents(files, docs, postings, new_docs)
+        os.makedirs(self.index_dir, exist_ok=True)
+        serial = (self._index_files()[1].get(generation) or [0])[-1] + 1
+        path = self._delta_path(generation, serial)
+        write_segment(path, {"root": self.root, "base": generation, "files": files, "live_docs": live_docs,
+                             "live_length": live_length, "dropped": sorted(dropped_files),
+                             "base_live_docs": base_totals[0], "base_live_length": base_totals[1]},
+                      docs, postings)
+        self._swap(segment, generation, IndexSegment(path), serial)
+
+    # --- Searching ---
+    def search(self, query, k=4):
+        """The k best snippets for query, best first."""
+        segment, _, delta, dropped = self._state()
+        if segment is None:
+            return []
+        doc_count, total_length = _live_totals(segment, delta)
+        if not doc_count:
+            return []
+        average_length = total_length / doc_count or 1
+        parts = [(segment, dropped)] + ([(delta, frozenset())] if delta is not None else [])
+        scores = {} # {(part number, doc id): score}
+        for term in set(terms(query)):
+            found = [current.postings(term) for current, _ in parts]
+            df = sum(len(postings[0]) for postings in found if postings is not None)
+            if not df:
+                continue
+            if df > MAX_DF_FRACTION * doc_count and doc_count > 20:
+                continue # Carries little information and would dominate the time
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for number, ((current, skipped), postings) in enumerate(zip(parts, found)):
+                if postings is None:
+                    continue
+                doc_file, doc_length = current.doc_file, current.doc_length
+                for doc_id, frequency in zip(*postings):
+                    file_index = doc_file[doc_id]
+                    if file_index == DEAD or file_index in skipped:
+                        continue
+                    norm = K1 * (1 - B + B * doc_length[doc_id] / average_length)
+                    key = (number, doc_id)
+                    scores[key] = scores.get(key, 0.0) + idf * frequency * (K1 + 1) / (frequency + norm)
+        hits = []
+        for (number, doc_id), score in heapq.nlargest(k, scores.items(), key=lambda item: item[1]):
+            current = parts[number][0]
+            path, mtime, size = current.files[current.doc_file[doc_id]]
+            hits.append(SearchHit(path, current.doc_first[doc_id], current.doc_last[doc_id], score, mtime, size))
+        return hits
+
+    def snippet_text(self, hit):
+        """Current text of a hit, or None if its file changed since it was indexed (marks the index stale)."""
+        try:
+            stat = os.stat(hit.path)
+            if (stat.st_mtime, stat.st_size) != (hit.mtime, hit.size):
+                self.stale = True
+                return None
+            text = read_text(hit.path)
+        except OSError:
+            self.stale = True
+            return None
+        if text is None:
+            return None
+        return "\n".join(text.splitlines()[hit.first_line - 1:hit.last_line])
+
+    def get_stats(self):
+        segment, _, delta, dropped = self._state()
+        if segment is None:
+            return {"root": self.root, "docs": 0, "too_large": self.too_large}
+        docs, _ = _live_totals(segment, delta)
+        parts = [segment] + ([delta] if delta is not None else [])
+        files = sum(record is not None and index not in dropped for index, record in enumerate(segment.files))
+        return {"root": self.root, "files": files + (sum(record is not None for record in delta.files) if delta else 0),
+                "docs": docs, "dead_docs": sum(part.doc_count for part in parts) - docs,
+                "delta_docs": delta.live_docs if delta is not None else 0,
+                "terms": segment.term_count, "postings": sum(part.posting_count for part in parts),
+                "bytes": sum(os.path.getsize(part.path) for part in parts)}
+
+
+def _add_documents(files, docs, postings, new_docs):
+    """Appends new_docs to the files, document arrays and postings being built. Returns (documents, length) added."""
+    added_docs = added_length = 0
+    for path, mtime, size, snippets in new_docs:
+        file_index = len(files)
+        files.append([path, mtime, size])
+        for first, last, counts in snippets:
+            doc_id = len(docs[0])
+            length = sum(counts.values())
+            for section, value in zip(docs, (file_index, first, last, length)):
+                section.append(value)
+            added_docs += 1
+            added_length += length
+            for term, frequency in counts.items():
+                entry = postings.get(term.encode("utf-8"))
+                if entry is None:
+                    entry = postings[term.encode("utf-8")] = (array.array(_ARRAY_TYPE), array.array(_ARRAY_TYPE))
+                entry[0].append(doc_id)
+                entry[1].append(frequency)
+    return added_docs, added_length
+
+
+def _segment_documents(segment, skipped_files):
+    """The files of segment, except skipped_files, as new_docs items rebuilt from its postings."""
+    counts = {} # {doc id: Counter}
+    for index in range(segment.term_count):
+        term = segment.term_at(index).decode("utf-8")
+        start, end = segment.posting_starts[index], segment.posting_starts[index + 1]
+        for doc_id, frequency in zip(segment.posting_docs[start:end], segment.posting_freqs[start:end]):
+            counts.setdefault(doc_id, Counter())[term] = frequency
+    snippets = {} # {file index: [(first, last, Counter)]}
+    for doc_id, file_index in enumerate(segment.doc_file):
+        if file_index != DEAD:
+            snippets.setdefault(file_index, []).append(
+                (segment.doc_first[doc_id], segment.doc_last[doc_id], counts.get(doc_id, Counter())))
+    return [(record[0], record[1], record[2], snippets.get(file_index, []))
+            for file_index, record in enumerate(segment.files)
+            if record is not None and file_index not in skipped_files]
+
+
+def _base_totals(segment, dropped_files):
+    """(documents, total length) of segment that are neither dead nor in dropped_files."""
+    if not dropped_files:
+        return segment.live_docs, segment.live_length
+    docs = length = 0
+    for file_index, doc_length in zip(segment.doc_file, segment.doc_length):
+        if file_index != DEAD and file_index not in dropped_files:
+            docs += 1
+            length += doc_length
+    return docs, length
+
+
+def _live_totals(segment, delta):
+    """(documents, total length) searched: the base's live documents plus the delta's."""
+    if delta is None:
+        return segment.live_docs, segment.live_length
+    return (delta.header["base_live_docs"] + delta.live_docs,
+            delta.header["base_live_length"] + delta.live_length)
+
+
+def _compact(files, docs, postings):
+    """Drops dead documents and removed files, renumbering what is left."""
+    file_map = {}
+    live_files = []
+    for file_index, record in enumerate(files):
+        if record is not None:
+            file_map[file_index] = len(live_files)
+            live_files.append(record)
+    doc_map = array.array(_ARRAY_TYPE, [DEAD]) * len(docs[0])
+    live_docs = tuple(array.array(_ARRAY_TYPE) for _ in range(4))
+    for doc_id, file_index in enumerate(docs[0]):
+        if file_index != DEAD:
+            doc_map[doc_id] = len(live_docs[0])
+            live_docs[0].append(file_map[file_index])
+            for section, old in zip(live_docs[1:], docs[1:]):
+                section.append(old[doc_id])
+    live_postings = {}
+    for term, (doc_ids, freqs) in postings.items():
+        kept_docs = array.array(_ARRAY_TYPE)
+        kept_freqs = array.array(_ARRAY_TYPE)
+        for doc_id, frequency in zip(doc_ids, freqs):
+            if doc_map[doc_id] != DEAD:
+                kept_docs.append(doc_map[doc_id])
+                kept_freqs.append(frequency)
+        if kept_docs:
+            live_postings[term] = (kept_docs, kept_freqs)
+    return live_files, live_docs, live_postings
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""Several chat endpoints: model mapping, health tracking and failover order.
+
+The endpoint configured in Settings is the primary; backup endpoints each
+have their own key and map the selected model to one they serve. The
+Router keeps a rolling connect latency and error rate per endpoint and
+orders the endpoints for every request: healthy ones first, by latency
+weighted with the error rate, with a small bias toward the configured
+order so a backup is not preferred over a primary that is only slightly
+slower. An endpoint that just failed rests for a while (longer after
+repeated failures) and is then tried last.
+
+A StreamRace decides which of several attempts at the same answer
+(failover, or a hedged second request) gets to show its text.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+EWMA_WEIGHT = 0.3 # Weight of the newest sample in the rolling averages
+UNKNOWN_LATENCY = 1.0 # Seconds assumed for an endpoint without samples
+ORDER_BIAS = 0.25 # Seconds added per position in the configured order
+ERROR_PENALTY = 4.0 # An error rate of 1 makes an endpoint look five times slower
+BASE_COOLDOWN = 5.0 # Seconds an endpoint rests after a failure, doubled per consecutive failure...
+MAX_COOLDOWN = 120.0 # ... up to this
+ANY_MODEL = "*"
+
+
+class Endpoint:
+    """An OpenAI-compatible API with its own key and model names."""
+
+    def __init__(self, api_url, api_key, models=None):
+        self.api_url = api_url.strip().rstrip("/")
+        self.api_key = api_key.strip()
+        self.models = dict(models or {}) # {selected model or "*": model on this endpoint}
+
+    def model_for(self, model):
+        return self.models.get(model) or self.models.get(ANY_MODEL) or model
+
+    def to_config(self):
+        return {"api_url": self.api_url, "api_key": self.api_key, "models": dict(self.models)}
+
+    @classmethod
+    def from_config(cls, data):
+        return cls(data.get("api_url", ""), data.get("api_key", ""), data.get("models"))
+
+
+def parse_endpoints(text):
+    """Endpoints from lines "URL KEY [MODEL | FROM=TO,...]"; raises ValueError on a bad line."""
+    endpoints = []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        fields = line.split(None, 2)
+        if len(fields) < 2 or not fields[0].startswith(("http://", "https://")):
+            raise ValueError(f"Line {number}: expected \"URL KEY [MODEL or FROM=TO,...]\"")
+        models = {}
+        for item in (fields[2].split(",") if len(fields) > 2 else []):
+            item = item.strip()
+            if "=" in item:
+                source, _, target = item.partition("=")
+                if not source.strip() or not target.strip():
+                    raise ValueError(f"Line {number}: bad model mapping {item!r}")
+                models[source.strip()] = target.strip()
+            elif item:
+                models[ANY_MODEL] = item
+        endpoints.append(Endpoint(fields[0], fields[1], models))
+    return endpoints
+
+
+def format_endpoints(endpoints):
+    """Inverse of parse_endpoints."""
+    lines = []
+    for endpoint in endpoints:
+        mapping = ",".join(target if source == ANY_MODEL else f"{source}={target}"
+                           for source, target in endpoint.models.items())
+        lines.append(" ".join(part for part in (endpoint.api_url, endpoint.api_key, mapping) if part))
+    return "\n".join(lines)
+
+
+class EndpointHealth:
+    """Rolling connect latency and error rate of one endpoint."""
+
+    def __init__(self):
+        self.latency = None # EWMA of seconds until the response headers arrived
+        self.error_rate = 0.0 # EWMA of failures (1) and successes (0)
+        self.failures = 0 # Consecutive failures
+        self.resting_until = 0.0 # time.monotonic() before which the endpoint is tried last
+        self.requests = 0
+
+    def score(self):
+        latency = UNKNOWN_LATENCY if self.latency is None else self.latency
+        return latency * (1 + ERROR_PENALTY * self.error_rate)
+
+
+class Router:
+    """Orders endpoints per request from their recent health; thread-safe."""
+
+    def __init__(self):
+        self._health = {} # {api_url: EndpointHealth}
+        self._lock = threading.Lock()
+
+    def _get(self, endpoint):
+        health = self._health.get(endpoint.api_url)
+        if health is None:
+            health = self._health[endpoint.api_url] = EndpointHealth()
+        return health
+
+    def ranked(self, endpoints):
+        """endpoints (in configured order) in the order to try them."""
+        now = time.monotonic()
+        with self._lock:
+            keyed = []
+            for position, endpoint in enumerate(endpoints):
+                health = self._get(endpoint)
+                resting = health.resting_until > now
+                keyed.append(((resting, health.score() + position * ORDER_BIAS), position, endpoint))
+        return [endpoint for _, _, endpoint in sorted(keyed, key=lambda item: item[:2])]
+
+    def record_success(self, endpoint, connect_seconds):
+        with self._lock:
+            health = self._get(endpoint)
+            health.requests += 1
+            health.latency = connect_seconds if health.latency is None else (
+                EWMA_WEIGHT * connect_seconds + (1 - EWMA_WEIGHT) * health.latency)
+            health.error_rate *= 1 - EWMA_WEIGHT
+            health.failures = 0
+            health.resting_until = 0.0
+
+    def record_failure(self, endpoint, reason=""):
+        with self._lock:
+            health = self._get(endpoint)
+            health.requests += 1
+            health.error_rate = EWMA_WEIGHT + (1 - EWMA_WEIGHT) * health.error_rate
+            health.failures += 1
+            cooldown = min(MAX_COOLDOWN, BASE_COOLDOWN * 2 ** (health.failures - 1))
+            health.resting_until = time.monotonic() + cooldown
+        logger.warning(f"Endpoint {endpoint.api_url} failed ({reason}); trying others first for {cooldown:.0f} s.")
+
+    def get_stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {api_url: {"latency_ms": None if health.latency is None else round(health.latency * 1000, 1),
+                              "error_rate": round(health.error_rate, 3), "requests": health.requests,
+                              "resting_s": round(max(0.0, health.resting_until - now), 1)}
+                    for api_url, health in self._health.items()}
+
+
+class StreamRace:
+    """Attempts at one answer; the first to produce text (or to finish) wins, the others are stopped."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = [] # CancelToken of each attempt
+        self.winner = None # Token of the winning attempt
+        self.progress = threading.Event() # Set when an attempt received its first byte or ended
+
+    def join(self, token):
+        with self._lock:
+            self._tokens.append(token)
+
+    def claim(self, token):
+        """True if the attempt with this token is (now) the winner; the other attempts are cancelled."""
+        with self._lock:
+            if self.winner is None:
+                self.winner = token
+                losers = [other for other in self._tokens if other is not token]
+            else:
+                return self.winner is token
+        for token in losers:
+            token.cancel()
+        return True
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Queueing of chat requests: priorities and a cap on concurrent streams.
+
+Used from the Tk thread only; the worker threads never touch it.
+"""
+import heapq
+import itertools
+
+from thonnycontrib.ai_chat.cancellation import CancelToken
+from thonnycontrib.ai_chat.latency import RequestTimings
+
+PRIORITY_INTERACTIVE = 0 # Questions typed into the chat
+PRIORITY_EXPLAIN = 10 # "Explain Selection" requests
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+
+
+class ChatRequest:
+    """One answer to stream: where it goes in the chat and how far it got."""
+
+    def __init__(self, message_id, entry, user_entry, label, priority, api_url, api_key, model, cache_key=None):
+        self.message_id = message_id # Display id of the assistant message
+        self.entry = entry # Pending assistant entry reserved in chat_history
+        self.user_entry = user_entry # The question; context is built up to it
+        self.label = label # Short text for the queue status line
+        self.priority = priority
+        self.api_url = api_url # Endpoint and model as configured when the request was made
+        self.api_key = api_key
+        self.model = model
+        self.cache_key = cache_key # Explain cache key, if the answer should be cached
+        self.explain_selection = None # (text, source, force_refresh) of a large selection to explain in parts first
+        self.messages = None # Sent instead of the chat context (e.g. the synthesis of the parts)
+        self.snippet_query = None # Question to look up project snippets for before streaming
+        self.attachment = None # Text added to the question in this request only (e.g. project snippets)
+        self.cancel_token = CancelToken()
+        self.renderer = None # Incremental markdown state while streaming
+        self.parts = [] # Text shown so far
+        self.closed_code_blocks = 0 # Code blocks of the answer already complete (highlighted as a whole)
+        self.state = QUEUED
+        self.timings = RequestTimings(api_url, model)
+        self.timings.mark("queued")
+
+
+class RequestScheduler:
+    """Priority queue of ChatRequests with at most max_concurrent running.
+
+    Requests with a lower priority number start first; equal priorities
+    start in submission order.
+    """
+
+    def __init__(self, max_concurrent=1):
+        self.max_concurrent = max(1, max_concurrent)
+        self._heap = []
+        self._counter = itertools.count()
+        self.running = []
+
+    def submit(self, request):
+        request.state = QUEUED
+        heapq.heappush(self._heap, (request.priority, next(self._counter), request))
+
+    def start_ready(self):
+        """Returns the queued requests that may start now, marking them running."""
+        started = []
+        while self._heap and len(self.running) < self.max_concurrent:
+            _, _, request = heapq.heappop(self._heap)
+            if request.state != QUEUED:
+                continue # Cancelled while queued
+            request.state = RUNNING
+            self.running.append(request)
+            started.append(request)
+        return started
+
+    def finish(self, request):
+        """Removes a request whether it was running or still queued."""
+        request.state = DONE
+        if request in self.running:
+            self.running.remove(request)
+        # Queued entries are dropped lazily by start_ready
+
+    def pending(self):
+        """Queued requests in the order they will start."""
+        return [request for _, _, request in sorted(self._heap) if request.state == QUEUED]
+
+    def __len__(self):
+        return len(self.running) + len(self.pending())
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Incremental Server-Sent Events parser for streamed chat completions.
+
+The parser is fed the raw byte chunks of the response body and returns the
+``data`` payload (bytes) of every completed event. It follows the SSE rules
+that matter for chat streams: LF, CRLF and CR line endings (also when split
+across chunks), several ``data:`` lines joined with a newline, ``:`` comment
+lines (keep-alives) and other fields ignored.
+
+``delta_content()`` extracts ``choices[0].delta.content`` from an event.
+With orjson installed every event is simply parsed with it. Otherwise the
+usual compact shape is sliced out with bytes.find() (about four times
+faster than json.loads) and anything else falls back to a full parse.
+"""
+import json
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError: # Optional dependency
+    _json_loads = json.loads
+    JSON_BACKEND = "json"
+
+DONE = b"[DONE]"
+
+# {"...","choices":[{"index":0,"delta":{"content":"..."}...  (content first in delta)
+_DELTA_CONTENT_KEY = b'"delta":{"content":"'
+
+
+class SSEParser:
+    """Splits a byte stream into SSE events; see the module docstring."""
+
+    def __init__(self):
+        self._buffer = b"" # Unterminated last event
+        self._skip_lf = False # Previous chunk ended with CR; a leading LF belongs to it
+
+    def feed(self, chunk):
+        """Consumes a chunk of bytes and returns the data of the events it completed."""
+        if self._skip_lf:
+            self._skip_lf = False
+            if chunk[:1] == b"\n":
+                chunk = chunk[1:]
+        if b"\r" in chunk:
+            if chunk.endswith(b"\r"):
+                self._skip_lf = True
+            chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        if self._buffer:
+            chunk = self._buffer + chunk
+
+        # Events end with a blank line; the last block is not complete yet
+        blocks = chunk.split(b"\n\n")
+        self._buffer = blocks.pop()
+        events = []
+        for block in blocks:
+            if block[:6] == b"data: " and b"\n" not in block:
+                events.append(block[6:]) # Fast path: a single "data: " line
+            elif block:
+                data = _event_data(block)
+                if data is not None:
+                    events.append(data)
+        return events
+
+    def close(self):
+        """Ends the stream. Per the SSE rules an unterminated last event is discarded."""
+        self._buffer = b""
+        self._skip_lf = False
+
+
+def _event_data(block):
+    """Joined data lines of one event block, or None if it has none."""
+    data_lines = []
+    for line in block.split(b"\n"):
+        if line[:5] == b"data:":
+            data_lines.append(line[6:] if line[5:6] == b" " else line[5:])
+        elif line == b"data":
+            data_lines.append(b"") # "data" without a colon is an empty data line
+        # Comments (":" keep-alives), blank lines and other fields (event, id, retry) are ignored
+    if not data_lines:
+        return None
+    return b"\n".join(data_lines)
+
+
+def delta_content(data):
+    """Returns choices[0].delta.content of a chat completion chunk, or None.
+
+    Raises ValueError if data is not valid JSON.
+    """
+    if JSON_BACKEND == "json":
+        content = _sliced_delta_content(data)
+        if content is not None:
+            return content
+    event = _json_loads(data)
+    if not isinstance(event, dict):
+        return None
+    choices = event.get("choices")
+    if not choices:
+        return None
+    delta = choices[0].get("delta") or {}
+    return delta.get("content")
+
+
+def _sliced_delta_content(data):
+    """Fast path for the compact shape; None if data does not have it."""
+    start = data.find(_DELTA_CONTENT_KEY)
+    # The first "delta" must be the one found, i.e. it belongs to choices[0]
+    if start < 0 or data.count(b'"delta"', 0, start):
+        return None
+    start += len(_DELTA_CONTENT_KEY)
+    end = _string_end(data, start)
+    if end < 0:
+        return None
+    raw = data[start:end]
+    if b"\\" not in raw:
+        return raw.decode("utf-8")
+    return json.loads(data[start - 1:end + 1]) # Unescape
+
+
+def _string_end(data, start):
+    """Index of the quote closing the JSON string starting at start, or -1."""
+    end = data.find(b'"', start)
+    while end >= 0:
+        backslashes = 0
+        while data[end - 1 - backslashes] == 0x5C:
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return end
+        end = data.find(b'"', end + 1)
+    return -1
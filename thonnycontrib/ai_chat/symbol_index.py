@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""Index of the functions, classes and methods defined in the user's Python files.
+
+Lets "Explain Selection" attach the definitions a selection uses (helpers
+defined elsewhere in the project) instead of the user pasting whole files.
+
+The index keeps only names and line ranges, as ``__slots__`` records; the
+source of a definition is read again when it is attached. Files are indexed
+once and then updated one at a time (on save, or when their mtime/size
+changed), so keeping it current costs one ``ast.parse`` per changed file.
+Editor buffers with unsaved changes are indexed from their text.
+
+All methods are thread-safe; scans and updates run in worker threads.
+"""
+import ast
+import builtins
+import hashlib
+import keyword
+import logging
+import os
+import re
+import sys
+import textwrap
+import threading
+import tokenize
+
+from thonnycontrib.ai_chat.context_window import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_FILES = 2000 # Files indexed at most
+MAX_FILE_BYTES = 1024 * 1024 # Larger files (generated code, data) are skipped
+MAX_CANDIDATES = 3 # A name defined in more files than this (and not next to the selection) is too ambiguous
+SKIPPED_DIRS = frozenset(["__pycache__", "node_modules", "site-packages", "dist-packages", "build", "dist",
+                          "venv", "env"])
+
+FUNCTION = "def"
+CLASS = "class"
+
+_IGNORED_NAMES = frozenset(dir(builtins)) | frozenset(keyword.kwlist) | frozenset(["self", "cls"])
+_NAME_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+class Symbol:
+    """One definition: where it is, not what it says."""
+
+    __slots__ = ("name", "parent", "kind", "path", "first_line", "last_line")
+
+    def __init__(self, name, parent, kind, path, first_line, last_line):
+        self.name = name
+        self.parent = parent # Enclosing class name for methods, else None
+        self.kind = kind # FUNCTION or CLASS
+        self.path = path
+        self.first_line = first_line # 1-based, including decorators
+        self.last_line = last_line
+
+    @property
+    def qualname(self):
+        return f"{self.parent}.{self.name}" if self.parent else self.name
+
+
+class FileSymbols:
+    """The symbols of one file and what they were computed from."""
+
+    __slots__ = ("path", "mtime", "size", "digest", "source", "symbols")
+
+    def __init__(self, path, mtime, size, digest, source, symbols):
+        self.path = path
+        self.mtime = mtime # Of the file on disk when indexed; None for editor text
+        self.size = size
+        self.digest = digest # Of the indexed text, to skip unchanged buffers
+        self.source = source # Kept only for unsaved editor text
+        self.symbols = symbols # Tuple of Symbols
+
+
+class SymbolIndex:
+    """Name -> definitions over a set of files, updated file by file."""
+
+    def __init__(self, max_files=DEFAULT_MAX_FILES):
+        self.max_files = max_files
+        self._files = {} # {path: FileSymbols}
+        self._by_name = {} # {name: [Symbol, ...]}
+        self._lock = threading.Lock()
+        self.stats = {"parsed": 0, "unchanged": 0, "failed": 0}
+
+    # --- Updating ---
+    def index_source(self, path, source, mtime=None, size=None, keep_source=False):
+        """(Re)indexes path from source. Returns False if the text was already indexed."""
+        digest = hashlib.sha1(source.encode("utf-8", "surrogatepass")).digest()
+        with self._lock:
+            previous = self._files.get(path)
+            if previous is not None and previous.digest == digest:
+                previous.mtime, previous.size = mtime, size
+                previous.source = source if keep_source else None
+                self.stats["unchanged"] += 1
+                return False
+        symbols = parse_symbols(source, path)
+        with self._lock:
+            if symbols is None:
+                self.stats["failed"] += 1
+                if previous is not None:
+                    return False # Keep the last good symbols while the code does not parse
+                symbols = ()
+            self._replace(path, FileSymbols(path, mtime, size, digest, source if keep_source else None, symbols))
+            self.stats["parsed"] += 1
+        return True
+
+    def index_file(self, path):
+        """Indexes a file from disk unless it is unchanged since the last time. Returns True if reparsed."""
+        path = sys.intern(os.path.abspath(path))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.remove(path)
+            return False
+        with self._lock:
+            previous = self._files.get(path)
+            if previous is not None and previous.source is None and (previous.mtime, previous.size) == (stat.st_mtime, stat.st_size):
+                self.stats["unchanged"] += 1
+                return False
+        if stat.st_size > MAX_FILE_BYTES:
+            return False
+        try:
+            with tokenize.open(path) as f: # Honors the coding cookie
+                source = f.read()
+        except (OSError, SyntaxError, UnicodeDecodeError) as e:
+            logger.debug(f"Not indexing {path}: {e}")
+            return False
+        return self.index_source(path, source, stat.st_mtime, stat.st_size)
+
+    def remove(self, path):
+        with self._lock:
+            self._replace(path, None)
+
+    def scan(self, root, cancel_event=None):
+        """Indexes the Python files under root (up to max_files in total). Returns the number reparsed."""
+        reparsed = 0
+        for path in iter_python_files(root):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            with self._lock:
+                full = len(self._files) >= self.max_files and path not in self._files
+            if full:
+                logger.info(f"Symbol index is full ({self.max_files} files); stopped scanning {root}.")
+                break
+            reparsed += self.index_file(path)
+        return reparsed
+
+    def _replace(self, path, record):
+        """Swaps the symbols of path. Called with the lock held."""
+        previous = self._files.pop(path, None)
+        if previous is not None:
+            for symbol in previous.symbols:
+                entries = self._by_name.get(symbol.name)
+                if entries is not None:
+                    entries.remove(symbol)
+                    if not entries:
+                        del self._by_name[symbol.name]
+        if record is not None:
+            self._files[path] = record
+            for symbol in record.symbols:
+                self._by_name.setdefault(symbol.name, []).append(symbol)
+
+    # --- Querying ---
+    def lookup(self, name):
+        with self._lock:
+            return list(self._by_name.get(name, ()))
+
+    def definitions_for(self, code, budget_tokens, near_path=None, root=None):
+        """Definitions the code refers to but does not define, within budget_tokens.
+
+        Returns [(symbol, text)] in the order the names first appear in code.
+        Only definitions under root (a directory or a file) are used, if given.
+        Definitions in near_path (the selection's file) or its directory win
+        over others of the same name; a definition too large for the rest of
+        the budget is replaced by its outline (signatures only).
+        """
+        if budget_tokens <= 0:
+            return []
+        near_dir = os.path.dirname(near_path) if near_path else None
+        result = []
+        used = 0
+        for name in referenced_names(code):
+            candidates = self.lookup(name)
+            if root is not None:
+                candidates = [symbol for symbol in candidates
+                              if symbol.path == root or symbol.path.startswith(root + os.sep)]
+            symbol = self._best_candidate(candidates, near_path, near_dir)
+            if symbol is None:
+                continue
+            text = self.definition_text(symbol)
+            if not text:
+                continue
+            tokens = estimate_tokens(text)
+            if used + tokens > budget_tokens:
+                text = outline(text)
+                tokens = estimate_tokens(text)
+                if used + tokens > budget_tokens:
+                    continue
+            result.append((symbol, text))
+            used += tokens
+        return result
+
+    def _best_candidate(self, candidates, near_path, near_dir):
+        if not candidates:
+            return None
+        for symbol in candidates:
+            if symbol.path == near_path:
+                return symbol
+        for symbol in candidates:
+            if near_dir and os.path.dirname(symbol.path) == near_dir:
+                return symbol
+        if len(set(symbol.path for symbol in candidates)) > MAX_CANDIDATES:
+            return None # e.g. "run" or "update": guessing would attach unrelated code
+        return candidates[0]
+
+    def definition_text(self, symbol):
+        """Current source of a definition; reindexes its file first if it changed on disk."""
+        with self._lock:
+            record = self._files.get(symbol.path)
+        if record is None:
+            return None
+        if record.source is None and self.index_file(symbol.path):
+            # The file changed since it was indexed: find the definition again
+            matches = [candidate for candidate in self.lookup(symbol.name)
+                       if candidate.path == symbol.path and candidate.parent == symbol.parent]
+            if not matches:
+                return None
+            symbol = matches[0]
+            with self._lock:
+                record = self._files.get(symbol.path)
+        source = record.source
+        if source is None:
+            try:
+                with tokenize.open(symbol.path) as f:
+                    source = f.read()
+            except (OSError, SyntaxError, UnicodeDecodeError):
+                return None
+        lines = source.splitlines()[symbol.first_line - 1:symbol.last_line]
+        return textwrap.dedent("\n".join(lines))
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, files=len(self._files), names=len(self._by_name),
+                        symbols=sum(len(record.symbols) for record in self._files.values()))
+
+
+def parse_symbols(source, path):
+    """Symbols defined in source (top level and in top-level classes); None if it does not parse."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+    symbols = []
+    for node in tree.body:
+        kind = _kind(node)
+        if kind is None:
+            continue
+        symbols.append(_symbol(node, None, kind, path))
+        if kind == CLASS:
+            for member in node.body:
+                if _kind(member) is not None:
+                    symbols.append(_symbol(member, node.name, _kind(member), path))
+    return tuple(symbols)
+
+
+def _kind(node):
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        return FUNCTION
+    if isinstance(node, ast.ClassDef):
+        return CLASS
+    return None
+
+
+def _symbol(node, parent, kind, path):
+    first = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+    return Symbol(sys.intern(node.name), sys.intern(parent) if parent else None, kind, path, first, node.end_lineno)
+
+
+def referenced_names(code):
+    """Names code uses (variables, calls, attributes) minus the ones it defines and builtins, in order."""
+    try:
+        tree = ast.parse(textwrap.dedent(code))
+    except (SyntaxError, ValueError):
+        # Partial code: every identifier is a candidate
+        return list(dict.fromkeys(name for name in _NAME_RE.findall(code) if name not in _IGNORED_NAMES))
+    used = {} # {name: position of the first use}
+    defined = set()
+    for node in ast.walk(tree):
+        name = None
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                name = node.id
+            else:
+                defined.add(node.id)
+        elif isinstance(node, ast.Attribute):
+            name = node.attr
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            defined.add(node.name)
+        elif isinstance(node, ast.arg):
+            defined.add(node.arg)
+        if name is not None:
+            position = (node.lineno, node.col_offset)
+            if name not in used or position < used[name]:
+                used[name] = position
+    return [name for name in sorted(used, key=used.get) if name not in defined and name not in _IGNORED_NAMES]
+
+
+def outline(text):
+    """Signature lines (decorators, def, class) of a definition, for when all of it does not fit."""
+    lines = [line for line in text.splitlines()
+             if line.lstrip().startswith(("def ", "async def ", "class ", "@"))]
+    return "\n".join(lines)
+
+
+def project_root(path):
+    """The directory the imports of the file at path start from: above its top-level package, if it is in one."""
+    directory = os.path.dirname(os.path.abspath(path))
+    while os.path.exists(os.path.join(directory, "__init__.py")):
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    return directory
+
+
+def iter_python_files(root):
+    """Python files under root, skipping hidden, cache and virtual environment directories."""
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = sorted(name for name in subdirectories
+                                   if not name.startswith(".") and name not in SKIPPED_DIRS
+                                   and not os.path.exists(os.path.join(directory, name, "pyvenv.cfg")))
+        for name in sorted(files):
+            if name.endswith(".py"):
+                yield sys.intern(os.path.join(directory, name))